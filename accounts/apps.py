@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        # Đăng ký signal vô hiệu hóa cache khi user cập nhật hồ sơ
+        from . import signals  # noqa: F401
@@ -0,0 +1,152 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from .models import Friendship
+from .search import user_search_filter
+from . import presence
+
+User = get_user_model()
+
+# =================================================================
+# USER DIRECTORY - danh bạ cho sidebar chat (bạn bè trước, rồi tới user khác)
+# =================================================================
+# "User card" (id, tên, avatar, role...) được cache theo version:
+#   usercard:ver:<id>      -> version hiện tại (tăng khi user sửa hồ sơ)
+#   usercard:<id>:v<ver>   -> card đã serialize
+# Đổi hồ sơ chỉ cần tăng version (signals.py), card cũ tự hết hạn.
+# Trạng thái online KHÔNG cache, lấy từ presence store cho từng trang.
+
+CARD_TTL = 60 * 60
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+
+CARD_FIELDS = ('id', 'username', 'first_name', 'last_name', 'email', 'avatar', 'role')
+
+
+def _version_key(user_id):
+    return f"usercard:ver:{user_id}"
+
+
+def _card_key(user_id, version):
+    return f"usercard:{user_id}:v{version}"
+
+
+def build_user_card(user):
+    full_name = f"{user.first_name} {user.last_name}".strip()
+    return {
+        'id': user.id,
+        'username': user.username,
+        'name': full_name or user.username or user.email.split('@')[0],
+        'email': user.email,
+        'avatar': user.avatar.url if user.avatar else None,
+        'role': user.role,
+    }
+
+
+def get_user_cards(user_ids):
+    """{user_id: card} - đọc cache theo lô, chỉ query DB cho phần bị miss"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+
+    versions = cache.get_many([_version_key(uid) for uid in user_ids])
+    keys = {uid: _card_key(uid, versions.get(_version_key(uid), 1)) for uid in user_ids}
+    cached = cache.get_many(list(keys.values()))
+
+    cards = {}
+    missing = []
+    for uid, key in keys.items():
+        if key in cached:
+            cards[uid] = cached[key]
+        else:
+            missing.append(uid)
+
+    if missing:
+        fresh = {}
+        for user in User.objects.filter(id__in=missing).only(*CARD_FIELDS):
+            card = build_user_card(user)
+            cards[user.id] = card
+            fresh[keys[user.id]] = card
+        cache.set_many(fresh, CARD_TTL)
+    return cards
+
+
+def invalidate_user_card(user_id):
+    """Tăng version -> lần đọc sau sẽ build lại card"""
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def directory_all(viewer, query=None):
+    """Toàn bộ danh bạ (đi hết các trang) - chỉ cho route cũ cần cả list"""
+    results, cursor = [], None
+    while True:
+        page = directory_page(viewer, query=query, cursor=cursor, page_size=MAX_PAGE_SIZE)
+        results += page['results']
+        cursor = page['next_cursor']
+        if cursor is None:
+            return results
+
+
+def directory_page(viewer, query=None, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    1 trang danh bạ: bạn bè trước (theo id), sau đó các user khác (mới nhất trước).
+
+    Cursor:
+        "f<offset>"   -> đang ở phần bạn bè
+        "u<last_id>"  -> đang ở phần user khác (keyset theo id giảm dần)
+
+    Returns:
+        {"results": [...], "next_cursor": str | None}
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    friend_ids = sorted(Friendship.friend_ids_of(viewer.id))
+    if query:
+        friend_ids = list(
+            User.objects.filter(id__in=friend_ids).filter(user_search_filter(query))
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    section, position = 'f', 0
+    if cursor:
+        try:
+            section, position = cursor[0], int(cursor[1:])
+        except (IndexError, ValueError):
+            section, position = 'f', 0
+
+    page_ids = []
+    next_cursor = None
+    if section == 'f':
+        page_ids = friend_ids[position:position + page_size]
+        if position + page_size < len(friend_ids):
+            next_cursor = f"f{position + page_size}"
+        position = None  # phần user khác bắt đầu từ đầu
+
+    remaining = page_size - len(page_ids)
+    if next_cursor is None and remaining > 0:
+        others = User.objects.exclude(id=viewer.id).exclude(id__in=friend_ids)
+        if query:
+            others = others.filter(user_search_filter(query))
+        if section == 'u' and position:
+            others = others.filter(id__lt=position)
+        other_ids = list(others.order_by('-id').values_list('id', flat=True)[:remaining + 1])
+        if len(other_ids) > remaining:
+            other_ids = other_ids[:remaining]
+            next_cursor = f"u{other_ids[-1]}"
+        page_ids += other_ids
+    elif next_cursor is None:
+        # Phần bạn bè hết đúng ở cuối trang -> trang sau bắt đầu phần user khác
+        next_cursor = "u0"
+
+    friend_set = set(friend_ids)
+    cards = get_user_cards(page_ids)
+    online_map = presence.is_online(page_ids)
+    results = []
+    for uid in page_ids:
+        card = cards.get(uid)
+        if card is None:
+            continue
+        results.append({**card, 'online': online_map.get(uid, False), 'is_friend': uid in friend_set})
+    return {'results': results, 'next_cursor': next_cursor}
@@ -1,7 +1,7 @@
 import os
 import requests
 
-def send_otp_email_brevo(user):
+def send_otp_email_brevo(user, raise_errors=False):
     api_key = os.getenv("BREVO_API_KEY")
     url = "https://api.brevo.com/v3/smtp/email"
 
@@ -28,3 +28,5 @@ def send_otp_email_brevo(user):
         print("📧 Sent OTP via Brevo")
     except Exception as e:
         print("❌ Brevo send error:", e)
+        if raise_errors:
+            raise
@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from core.jobqueue import job
+from .email_service import send_otp_email_brevo
+
+User = get_user_model()
+
+
+@job("accounts.send_otp_email", max_retries=5)
+def send_otp_email(user_id):
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return
+    # raise_errors=True để job queue retry khi Brevo lỗi
+    send_otp_email_brevo(user, raise_errors=True)
+
+
+@job("accounts.flush_last_seen")
+def flush_last_seen():
+    from .presence import flush_last_seen as _flush
+    _flush()
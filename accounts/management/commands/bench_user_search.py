@@ -0,0 +1,112 @@
+import random
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from core.metrics import percentile
+from accounts.models import UserSearchToken
+from accounts.search import build_search_text, build_tokens, search_users_ranked, uses_trigram_index
+
+User = get_user_model()
+
+# Kết quả tham khảo (SQLite 3.40, token table, --repeat 5, 14 query mẫu):
+#
+#     users     icontains p50 / p99      search index p50 / p99
+#     10,000      6.93 /  10.41 ms          7.50 /   9.19 ms
+#    100,000     43.52 /  70.15 ms         21.15 /  45.85 ms
+#
+# Lưu ý: hai bên không trả cùng tập kết quả - fallback chỉ khớp tiền tố từ
+# (accounts/search.py), icontains khớp cả chuỗi con.
+
+HO = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng",
+      "Bùi", "Đỗ", "Hồ", "Ngô", "Dương", "Lý"]
+DEM = ["Văn", "Thị", "Hữu", "Đức", "Minh", "Thanh", "Ngọc", "Quốc", "Gia", "Bảo"]
+TEN = ["An", "Bình", "Cường", "Dũng", "Giang", "Hà", "Hải", "Hằng", "Hiếu", "Hoa", "Hùng",
+       "Hương", "Khánh", "Lan", "Linh", "Long", "Mai", "Nam", "Ngân", "Phong", "Phúc",
+       "Quân", "Quang", "Sơn", "Tâm", "Thảo", "Thắng", "Trang", "Trung", "Tú", "Tuấn",
+       "Việt", "Vy", "Yến"]
+QUERIES = ["nguyen van", "Nguyễn Văn An", "tran thi", "duc", "Đức", "hoang minh", "linh",
+           "pham ngoc tr", "viet", "bui gia", "yen", "le quoc", "ho thanh huong", "xyz"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark tìm kiếm user: icontains cũ vs chỉ mục search_text/token "
+        "trên dữ liệu giả (chạy trong transaction và rollback, không để lại dữ liệu)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+        parser.add_argument("--repeat", type=int, default=5, help="Số lần chạy mỗi query")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        backend = "trigram (PostgreSQL)" if uses_trigram_index() else "token table (fallback)"
+        self.stdout.write(f"🔎 Search backend: {backend} on {connection.vendor}")
+
+        with transaction.atomic():
+            created = 0
+            for size in sorted(options["sizes"]):
+                created = self._grow(created, size, options["batch_size"])
+                if connection.vendor == "postgresql":
+                    with connection.cursor() as cursor:
+                        cursor.execute("ANALYZE accounts_user")
+                self._measure(size, options["repeat"])
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("✅ Done (synthetic users rolled back)"))
+
+    def _grow(self, start, target, batch_size):
+        use_tokens = not uses_trigram_index()
+        t0 = time.perf_counter()
+        for offset in range(start, target, batch_size):
+            users = []
+            for i in range(offset, min(offset + batch_size, target)):
+                user = User(
+                    username=f"bench_{i}",
+                    email=f"bench_{i}@example.invalid",
+                    first_name=f"{random.choice(HO)} {random.choice(DEM)}",
+                    last_name=random.choice(TEN),
+                    password="!",
+                )
+                user.search_text = build_search_text(user)
+                users.append(user)
+            users = User.objects.bulk_create(users)
+            if use_tokens:
+                if users and users[0].pk is None:
+                    # MySQL không trả id sau bulk_create -> đọc lại theo username
+                    ids = dict(User.objects.filter(username__in=[u.username for u in users])
+                               .values_list("username", "id"))
+                    for u in users:
+                        u.pk = u.id = ids[u.username]
+                UserSearchToken.objects.bulk_create(
+                    [UserSearchToken(user_id=u.id, token=t) for u in users for t in build_tokens(u)]
+                )
+        self.stdout.write(f"📥 Inserted {target - start} users in {time.perf_counter() - t0:.1f}s (total {target})")
+        return target
+
+    def _timed(self, fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t0)
+        return samples
+
+    def _measure(self, size, repeat):
+        legacy, indexed = [], []
+        for q in QUERIES:
+            legacy += self._timed(lambda: list(User.objects.filter(
+                Q(username__icontains=q) | Q(first_name__icontains=q) |
+                Q(last_name__icontains=q) | Q(email__icontains=q)
+            )[:10]), repeat)
+            indexed += self._timed(lambda: search_users_ranked(q, limit=10), repeat)
+
+        def fmt(samples):
+            return f"p50={percentile(samples, 50) * 1000:8.2f}ms  p99={percentile(samples, 99) * 1000:8.2f}ms"
+
+        self.stdout.write(f"\n📊 {size:>9,} users")
+        self.stdout.write(f"   icontains (cũ) : {fmt(legacy)}")
+        self.stdout.write(f"   search index   : {fmt(indexed)}")
@@ -0,0 +1,100 @@
+import re
+import unicodedata
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Bản sao các helper trong accounts/search.py tại thời điểm tạo migration:
+# migration không import code đang chạy (đổi search.py sau này không làm
+# thay đổi dữ liệu backfill của migration cũ).
+MAX_TOKENS_PER_USER = 16
+
+_SPLIT_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_text(value):
+    if not value:
+        return ""
+    value = value.replace("đ", "d").replace("Đ", "D")
+    value = unicodedata.normalize("NFD", value)
+    value = "".join(ch for ch in value if unicodedata.category(ch) != "Mn")
+    return " ".join(value.lower().split())
+
+
+def build_search_text(user):
+    parts = [user.first_name, user.last_name, user.username, user.email]
+    return normalize_text(" ".join(p for p in parts if p))[:512]
+
+
+def build_tokens(user):
+    seen = []
+    for token in _SPLIT_RE.split(build_search_text(user)):
+        token = token[:64]
+        if token and token not in seen:
+            seen.append(token)
+    return seen[:MAX_TOKENS_PER_USER]
+
+
+def backfill_search_index(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    UserSearchToken = apps.get_model('accounts', 'UserSearchToken')
+    use_tokens = schema_editor.connection.vendor != 'postgresql'
+
+    batch = []
+    for user in User.objects.only('id', 'first_name', 'last_name', 'username', 'email').iterator(chunk_size=1000):
+        user.search_text = build_search_text(user)
+        batch.append(user)
+        if use_tokens:
+            UserSearchToken.objects.bulk_create(
+                [UserSearchToken(user_id=user.id, token=t) for t in build_tokens(user)],
+                ignore_conflicts=True
+            )
+        if len(batch) >= 1000:
+            User.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ['search_text'])
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS accounts_user_search_trgm '
+        'ON accounts_user USING gin (search_text gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS accounts_user_search_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_alter_user_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='search_text',
+            field=models.CharField(blank=True, default='', editable=False, max_length=512),
+        ),
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=64)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'token')},
+            },
+        ),
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -58,6 +58,9 @@ class User(AbstractUser):
     otp_code = models.CharField(max_length=6, blank=True, null=True)
     otp_expiry = models.DateTimeField(blank=True, null=True)
 
+    # --- Chỉ mục tìm kiếm (tên/username/email đã bỏ dấu, xem accounts/search.py) ---
+    search_text = models.CharField(max_length=512, blank=True, default="", editable=False)
+
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
 
@@ -69,6 +72,20 @@ class User(AbstractUser):
         self.otp_expiry = timezone.now() + datetime.timedelta(minutes=10)
         self.save()
 
+class UserSearchToken(models.Model):
+    """
+    Chỉ mục tìm kiếm fallback cho SQLite/MySQL (PostgreSQL dùng trigram trên User.search_text).
+    Mỗi dòng là 1 từ đã chuẩn hóa của user, tra bằng token LIKE 'abc%'.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=64, db_index=True)
+
+    class Meta:
+        unique_together = ['user', 'token']
+
+    def __str__(self):
+        return f"{self.user_id}: {self.token}"
+
 class UserStatus(models.Model):
     """Trạng thái online/offline của user"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='status')
@@ -123,3 +140,12 @@ class Friendship(models.Model):
     
     def __str__(self):
         return f"{self.from_user.username} → {self.to_user.username} ({self.status})"
+
+    @classmethod
+    def friend_ids_of(cls, user_id):
+        """Danh sách id bạn bè (accepted) trong 1 query, không load object User"""
+        rows = cls.objects.filter(
+            models.Q(from_user_id=user_id) | models.Q(to_user_id=user_id),
+            status='accepted'
+        ).values_list('from_user_id', 'to_user_id')
+        return [to_id if from_id == user_id else from_id for from_id, to_id in rows]
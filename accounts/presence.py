@@ -0,0 +1,313 @@
+import asyncio
+import datetime
+import threading
+import time
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from core.redis_client import get_redis
+
+# =================================================================
+# PRESENCE - trạng thái online theo số kết nối, không ghi DB mỗi lần mở/đóng socket
+# =================================================================
+# - Mỗi socket là 1 "connection" (channel_name) của user; user online khi còn
+#   ít nhất 1 connection chưa hết hạn -> đóng 1 tab không làm user offline.
+# - Mỗi process tự heartbeat các connection của nó (1 task / process), process
+#   chết thì connection tự hết hạn sau PRESENCE_TTL; nhịp heartbeat quét các user
+#   đã hết hạn hết connection -> ghi last_seen + báo offline như khi ngắt bình thường.
+# - last_seen chỉ ghi DB theo lô: mỗi nhịp heartbeat flush 1 lần
+#   (tối đa 1 lần / LAST_SEEN_FLUSH_INTERVAL cho mọi process).
+# - Sự kiện online/offline chỉ gửi tới bạn bè (group user_{friend_id}).
+
+PRESENCE_TTL = 90
+HEARTBEAT_INTERVAL = 30
+LAST_SEEN_FLUSH_INTERVAL = 30
+
+KEY_PREFIX = "doverx:presence"
+
+
+class MemoryPresenceStore:
+    """Store trong bộ nhớ - chỉ đúng khi chạy 1 process (dev)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conns = defaultdict(dict)  # user_id -> {conn_id: last_heartbeat}
+        self._last_seen = {}
+        self._last_flush = 0
+        self._expired = {}  # user_id -> heartbeat cuối, offline do hết hạn chưa báo
+
+    def _alive(self, user_id, now):
+        conns = self._conns.get(user_id)
+        if not conns:
+            return 0
+        expired = [c for c in conns if conns[c] < now - PRESENCE_TTL]
+        if len(expired) == len(conns):
+            self._expired[user_id] = max(conns.values())
+        for conn_id in expired:
+            del conns[conn_id]
+        if not conns:
+            del self._conns[user_id]
+            return 0
+        return len(conns)
+
+    def connect(self, user_id, conn_id, now):
+        with self._lock:
+            was_online = self._alive(user_id, now) > 0
+            self._expired.pop(user_id, None)
+            self._conns[user_id][conn_id] = now
+            return not was_online
+
+    def disconnect(self, user_id, conn_id, now):
+        with self._lock:
+            conns = self._conns.get(user_id, {})
+            if conns.pop(conn_id, None) is None:
+                return False
+            return self._alive(user_id, now) == 0
+
+    def refresh(self, pairs, now):
+        with self._lock:
+            for user_id, conn_id in pairs:
+                # Chỉ gia hạn connection còn tồn tại (tránh hồi sinh socket vừa đóng)
+                if conn_id in self._conns.get(user_id, {}):
+                    self._conns[user_id][conn_id] = now
+
+    def is_online(self, user_ids, now):
+        with self._lock:
+            return {uid: self._alive(uid, now) > 0 for uid in user_ids}
+
+    def expire(self, now):
+        """{user_id: heartbeat cuối} của các user vừa offline vì hết hạn (mỗi user 1 lần)"""
+        with self._lock:
+            for user_id in list(self._conns):
+                self._alive(user_id, now)
+            expired, self._expired = self._expired, {}
+            return expired
+
+    def mark_last_seen(self, user_id, ts):
+        with self._lock:
+            self._last_seen[user_id] = ts
+
+    def claim_flush(self, now):
+        with self._lock:
+            if now - self._last_flush < LAST_SEEN_FLUSH_INTERVAL:
+                return False
+            self._last_flush = now
+            return True
+
+    def pop_last_seen(self):
+        with self._lock:
+            pending, self._last_seen = self._last_seen, {}
+            return pending
+
+
+# Ngắt 1 connection: xóa conn + dọn hết hạn, còn 0 connection thì bỏ user khỏi
+# chỉ mục - cùng 1 bước nguyên tử, connect chen giữa không bị xóa khỏi chỉ mục.
+# KEYS: user key, users index | ARGV: conn_id, mốc hết hạn, user_id -> 1 nếu vừa offline
+_DISCONNECT_LUA = """
+local removed = redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[2])
+if removed == 1 and redis.call('ZCARD', KEYS[1]) == 0 then
+    redis.call('ZREM', KEYS[2], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# 1 user trong chỉ mục đã quá hạn: còn connection sống thì cập nhật lại chỉ mục,
+# không thì bỏ khỏi chỉ mục (ZREM = 1 -> chỉ đúng 1 process báo offline).
+# KEYS: user key, users index | ARGV: mốc hết hạn, user_id, now -> 1 nếu vừa offline
+_EXPIRE_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+if redis.call('ZCARD', KEYS[1]) > 0 then
+    redis.call('ZADD', KEYS[2], 'XX', ARGV[3], ARGV[2])
+    return 0
+end
+return redis.call('ZREM', KEYS[2], ARGV[2])
+"""
+
+
+class RedisPresenceStore:
+    """
+    Mỗi user 1 sorted set: member = conn_id, score = thời điểm heartbeat cuối.
+    Các bước đọc-ghi chạy trong MULTI / Lua nên chuyển trạng thái online/offline
+    được phát hiện đúng 1 lần kể cả khi nhiều process cùng ghi.
+    """
+
+    def __init__(self, client):
+        self.redis = client
+        self._disconnect = client.register_script(_DISCONNECT_LUA)
+        self._expire = client.register_script(_EXPIRE_LUA)
+
+    # Chỉ mục user đang online: member = user_id, score = heartbeat cuối -> quét hết hạn
+    USERS_KEY = f"{KEY_PREFIX}:users"
+
+    def _key(self, user_id):
+        return f"{KEY_PREFIX}:user:{user_id}"
+
+    def connect(self, user_id, conn_id, now):
+        key = self._key(user_id)
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(key, 0, now - PRESENCE_TTL)
+        pipe.zcard(key)
+        pipe.zadd(key, {conn_id: now})
+        pipe.expire(key, PRESENCE_TTL * 2)
+        pipe.zadd(self.USERS_KEY, {user_id: now})
+        _, before, _, _, _ = pipe.execute()
+        return before == 0
+
+    def disconnect(self, user_id, conn_id, now):
+        keys = [self._key(user_id), self.USERS_KEY]
+        return bool(self._disconnect(keys=keys, args=[conn_id, now - PRESENCE_TTL, user_id]))
+
+    def refresh(self, pairs, now):
+        if not pairs:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id, conn_id in pairs:
+            # xx=True: chỉ gia hạn connection còn tồn tại (tránh hồi sinh socket vừa đóng)
+            pipe.zadd(self._key(user_id), {conn_id: now}, xx=True)
+            pipe.expire(self._key(user_id), PRESENCE_TTL * 2)
+            pipe.zadd(self.USERS_KEY, {user_id: now}, xx=True)
+        pipe.execute()
+
+    def is_online(self, user_ids, now):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        pipe = self.redis.pipeline(transaction=False)
+        for uid in user_ids:
+            pipe.zcount(self._key(uid), now - PRESENCE_TTL, "+inf")
+        return {uid: count > 0 for uid, count in zip(user_ids, pipe.execute())}
+
+    def expire(self, now):
+        """{user_id: heartbeat cuối} của các user vừa offline vì hết hạn (mỗi user báo 1 lần)"""
+        cutoff = now - PRESENCE_TTL
+        stale = self.redis.zrangebyscore(self.USERS_KEY, 0, cutoff, withscores=True)
+        expired = {}
+        for member, last_ts in stale:
+            user_id = int(member)
+            if self._expire(keys=[self._key(user_id), self.USERS_KEY], args=[cutoff, user_id, now]):
+                expired[user_id] = last_ts
+        return expired
+
+    def mark_last_seen(self, user_id, ts):
+        self.redis.hset(f"{KEY_PREFIX}:last_seen", user_id, ts)
+
+    def claim_flush(self, now):
+        return bool(self.redis.set(f"{KEY_PREFIX}:flush_lock", now, nx=True, ex=LAST_SEEN_FLUSH_INTERVAL))
+
+    def pop_last_seen(self):
+        key = f"{KEY_PREFIX}:last_seen"
+        pipe = self.redis.pipeline()
+        pipe.hgetall(key)
+        pipe.delete(key)
+        pending, _ = pipe.execute()
+        return {int(uid): float(ts) for uid, ts in pending.items()}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                client = get_redis()
+                _store = RedisPresenceStore(client) if client else MemoryPresenceStore()
+    return _store
+
+
+# =================================================================
+# API DÙNG TRONG VIEWS / CONSUMERS (sync - consumer gọi qua database_sync_to_async)
+# =================================================================
+def is_online(user_ids):
+    """{user_id: bool} cho cả danh sách trong 1 round-trip"""
+    return get_store().is_online(user_ids, time.time())
+
+
+def user_connected(user_id, conn_id):
+    _local_connections[conn_id] = user_id
+    if get_store().connect(user_id, conn_id, time.time()):
+        notify_friends(user_id, True)
+
+
+def user_disconnected(user_id, conn_id):
+    _local_connections.pop(conn_id, None)
+    now = time.time()
+    store = get_store()
+    if store.disconnect(user_id, conn_id, now):
+        store.mark_last_seen(user_id, now)
+        notify_friends(user_id, False)
+        # last_seen được flush ở nhịp heartbeat (sweep)
+
+
+def notify_friends(user_id, online):
+    from accounts.models import Friendship
+    from core.jobs import group_send_many
+
+    friend_ids = Friendship.friend_ids_of(user_id)
+    if not friend_ids:
+        return
+    event = {'type': 'presence.update', 'user_id': user_id, 'online': online}
+    group_send_many.delay([[f"user_{fid}", event] for fid in friend_ids])
+
+
+def sweep(pairs, now):
+    """
+    1 nhịp heartbeat: gia hạn connection của process, báo offline các user
+    hết hạn (process giữ socket đã chết), flush last_seen đang chờ.
+    """
+    store = get_store()
+    store.refresh(pairs, now)
+    for user_id, last_ts in store.expire(now).items():
+        store.mark_last_seen(user_id, last_ts)
+        notify_friends(user_id, False)
+    if store.claim_flush(now):
+        from .jobs import flush_last_seen as flush_job
+        flush_job.delay()
+
+
+def flush_last_seen():
+    """Ghi last_seen đang chờ xuống UserStatus theo lô"""
+    from accounts.models import UserStatus
+
+    pending = get_store().pop_last_seen()
+    if not pending:
+        return 0
+    existing = set(UserStatus.objects.filter(user_id__in=pending.keys()).values_list('user_id', flat=True))
+    UserStatus.objects.bulk_create(
+        [UserStatus(user_id=uid) for uid in pending if uid not in existing],
+        ignore_conflicts=True
+    )
+    statuses = list(UserStatus.objects.filter(user_id__in=pending.keys()))
+    for status in statuses:
+        status.is_online = False
+        status.last_seen = datetime.datetime.fromtimestamp(pending[status.user_id], tz=datetime.timezone.utc)
+    UserStatus.objects.bulk_update(statuses, ['is_online', 'last_seen'])
+    return len(statuses)
+
+
+# =================================================================
+# HEARTBEAT CHUNG CHO CẢ PROCESS (thay vì mỗi socket 1 timer)
+# =================================================================
+_local_connections = {}  # conn_id -> user_id của process này
+_heartbeat_tasks = {}
+
+
+def ensure_heartbeat():
+    """Gọi trong event loop (connect của consumer): khởi động task heartbeat nếu chưa có"""
+    loop = asyncio.get_running_loop()
+    task = _heartbeat_tasks.get(loop)
+    if task is None or task.done():
+        _heartbeat_tasks[loop] = loop.create_task(_heartbeat_loop())
+
+
+async def _heartbeat_loop():
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        pairs = [(uid, conn_id) for conn_id, uid in list(_local_connections.items())]
+        try:
+            await sync_to_async(sweep)(pairs, time.time())
+        except Exception as e:
+            print(f"❌ [presence] Heartbeat error: {e}")
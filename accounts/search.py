@@ -0,0 +1,154 @@
+import re
+import unicodedata
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import FloatField, Func, Q, Value
+from .models import UserSearchToken
+
+User = get_user_model()
+
+# =================================================================
+# TÌM KIẾM USER - chỉ mục riêng thay cho 4 điều kiện icontains
+# =================================================================
+# User.search_text = họ tên + username + email đã chuẩn hóa
+# (chữ thường, bỏ dấu tiếng Việt, đ -> d), cập nhật ở pre_save (signals.py).
+#
+# - PostgreSQL: GIN trigram index trên search_text (migration 0010),
+#   lọc bằng LIKE và xếp hạng bằng similarity().
+# - SQLite/MySQL: bảng UserSearchToken (user, token) có index, lọc bằng
+#   khoảng token >= 'abc' AND token < 'abd' (= tiền tố 'abc', dùng được B-tree
+#   index; SQLite không dùng index cho LIKE ... ESCAPE), xếp hạng trong Python.
+#
+# Khác icontains cũ: fallback chỉ khớp TIỀN TỐ của từng từ ('nguy' -> 'Nguyễn'
+# nhưng 'uyen' không ra), còn icontains / trigram khớp cả chuỗi con giữa từ.
+# Chấp nhận vì ô tìm kiếm gõ từ đầu từ; khớp chuỗi con cần quét cả bảng token.
+
+MAX_TOKENS_PER_USER = 16
+CANDIDATE_LIMIT = 200
+
+_SPLIT_RE = re.compile(r"[^a-z0-9]+")
+# Token chỉ gồm các ký tự này (sau normalize_text + _SPLIT_RE), theo thứ tự sắp xếp
+_TOKEN_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def normalize_text(value):
+    """'Nguyễn Đức Anh' -> 'nguyen duc anh'"""
+    if not value:
+        return ""
+    value = value.replace("đ", "d").replace("Đ", "D")
+    value = unicodedata.normalize("NFD", value)
+    value = "".join(ch for ch in value if unicodedata.category(ch) != "Mn")
+    return " ".join(value.lower().split())
+
+
+def tokenize(value):
+    return [t for t in _SPLIT_RE.split(normalize_text(value)) if t]
+
+
+def build_search_text(user):
+    parts = [user.first_name, user.last_name, user.username, user.email]
+    return normalize_text(" ".join(p for p in parts if p))[:512]
+
+
+def build_tokens(user):
+    seen = []
+    for token in tokenize(build_search_text(user)):
+        token = token[:64]
+        if token not in seen:
+            seen.append(token)
+    return seen[:MAX_TOKENS_PER_USER]
+
+
+def uses_trigram_index():
+    return connection.vendor == "postgresql"
+
+
+def sync_user_tokens(user):
+    """Cập nhật bảng token fallback cho 1 user (không dùng trên PostgreSQL)"""
+    if uses_trigram_index():
+        return
+    UserSearchToken.objects.filter(user_id=user.id).delete()
+    UserSearchToken.objects.bulk_create([
+        UserSearchToken(user_id=user.id, token=t) for t in build_tokens(user)
+    ])
+
+
+def _prefix_upper_bound(prefix):
+    """Chuỗi nhỏ nhất lớn hơn mọi token bắt đầu bằng prefix ('abc' -> 'abd', 'az' -> 'b')"""
+    chars = prefix.rstrip("z")
+    if not chars:
+        return None
+    return chars[:-1] + _TOKEN_ALPHABET[_TOKEN_ALPHABET.index(chars[-1]) + 1]
+
+
+def _prefix_filter(prefix):
+    upper = _prefix_upper_bound(prefix)
+    if upper is None:
+        return Q(token__gte=prefix)
+    return Q(token__gte=prefix, token__lt=upper)
+
+
+class TrigramSimilarity(Func):
+    function = "SIMILARITY"
+    output_field = FloatField()
+
+
+def _rank(user, query_norm, query_tokens):
+    """Điểm cho fallback: khớp nguyên cụm > khớp đủ token > khớp tiền tố"""
+    text = user.search_text or ""
+    words = text.split()
+    score = 0.0
+    if text.startswith(query_norm):
+        score += 3
+    elif query_norm in text:
+        score += 2
+    for token in query_tokens:
+        if token in words:
+            score += 1
+        elif any(w.startswith(token) for w in words):
+            score += 0.5
+    return score
+
+
+def user_search_filter(query):
+    """
+    Q lọc User khớp query (mọi token của query), dùng chỉ mục như search_users_ranked.
+    Query không có token nào -> không khớp ai.
+    """
+    query_tokens = tokenize(query)
+    if not query_tokens:
+        return Q(pk__in=[])
+    condition = Q()
+    for token in query_tokens:
+        if uses_trigram_index():
+            condition &= Q(search_text__contains=token)
+        else:
+            # Mỗi token của query phải là tiền tố của 1 token đã index
+            condition &= Q(id__in=UserSearchToken.objects.filter(_prefix_filter(token)).values("user_id"))
+    return condition
+
+
+def search_users_ranked(query, exclude_id=None, limit=10):
+    """
+    Tìm user theo tên/username/email, không phân biệt dấu.
+    Trả về list User đã xếp hạng (tốt nhất trước).
+    Fallback (không phải PostgreSQL) chỉ khớp tiền tố từ, xem ghi chú đầu file.
+    """
+    query_norm = normalize_text(query)
+    query_tokens = tokenize(query)
+    if not query_tokens:
+        return []
+
+    qs = User.objects.filter(user_search_filter(query))
+    if exclude_id is not None:
+        qs = qs.exclude(id=exclude_id)
+
+    if uses_trigram_index():
+        return list(
+            qs.annotate(rank=TrigramSimilarity("search_text", Value(query_norm)))
+            .order_by("-rank", "id")[:limit]
+        )
+
+    candidates = list(qs.order_by("id")[:CANDIDATE_LIMIT])
+    candidates.sort(key=lambda u: (-_rank(u, query_norm, query_tokens), u.id))
+    return candidates[:limit]
@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .directory import CARD_FIELDS, invalidate_user_card
+from .search import build_search_text, sync_user_tokens
+
+User = get_user_model()
+
+# Field nằm trong user card (directory) hoặc snapshot websocket (social/middleware.py)
+CACHED_FIELDS = set(CARD_FIELDS) | {'is_active'}
+
+
+@receiver(pre_save, sender=User)
+def user_search_text(sender, instance, **kwargs):
+    # Giữ chỉ mục tìm kiếm khớp với tên/username/email
+    instance.search_text = build_search_text(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Hồ sơ / avatar đổi -> card trong cache directory không còn đúng.
+    # save(update_fields=...) không đụng field nào được cache (vd. last_login) -> giữ cache
+    if not created and (update_fields is None or CACHED_FIELDS & set(update_fields)):
+        invalidate_user_card(instance.id)
+        # Snapshot dùng cho handshake websocket (is_active, tên...)
+        invalidate_ws_user(instance.id)
+
+    # Bảng token fallback chỉ cần cập nhật khi các field được index thay đổi
+    indexed = {'first_name', 'last_name', 'username', 'email', 'search_text'}
+    if created or update_fields is None or indexed & set(update_fields):
+        sync_user_tokens(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_ws_user(instance.id)
+
+
+def invalidate_ws_user(user_id):
+    from social.middleware import invalidate_cached_user
+    invalidate_cached_user(user_id)
@@ -1,3 +1,175 @@
-from django.test import TestCase
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+from .directory import directory_page
+from .models import Friendship
+from .presence import PRESENCE_TTL, MemoryPresenceStore, RedisPresenceStore, sweep
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+User = get_user_model()
+
+
+def make_user(name):
+    return User.objects.create_user(username=name, email=f"{name}@example.com")
+
+
+# =================================================================
+# PRESENCE (accounts/presence.py) - cùng 1 bộ test cho Memory và Redis store
+# =================================================================
+class PresenceStoreCases:
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+
+    def test_online_until_last_connection_closes(self):
+        self.assertTrue(self.store.connect(1, "tab-a", 100))
+        self.assertFalse(self.store.connect(1, "tab-b", 101))
+        self.assertFalse(self.store.disconnect(1, "tab-a", 102))
+        self.assertEqual(self.store.is_online([1, 2], 102), {1: True, 2: False})
+        self.assertTrue(self.store.disconnect(1, "tab-b", 103))
+        self.assertEqual(self.store.is_online([1], 103), {1: False})
+
+    def test_unknown_connection_disconnect_is_noop(self):
+        self.store.connect(1, "tab-a", 100)
+        self.assertFalse(self.store.disconnect(1, "ghost", 101))
+        # Ngắt 2 lần cùng 1 connection chỉ báo offline 1 lần
+        self.assertTrue(self.store.disconnect(1, "tab-a", 102))
+        self.assertFalse(self.store.disconnect(1, "tab-a", 103))
+
+    def test_expired_connections_reported_once(self):
+        self.store.connect(1, "dead-process", 100)
+        self.store.connect(2, "alive", 100)
+        later = 100 + PRESENCE_TTL + 1
+        self.store.refresh([(2, "alive")], later - 1)
+        self.assertEqual(self.store.expire(later), {1: 100})
+        self.assertEqual(self.store.expire(later), {})
+        self.assertEqual(self.store.is_online([1, 2], later), {1: False, 2: True})
+
+    def test_refresh_does_not_revive_closed_connection(self):
+        self.store.connect(1, "tab-a", 100)
+        self.store.disconnect(1, "tab-a", 101)
+        self.store.refresh([(1, "tab-a")], 102)
+        self.assertEqual(self.store.is_online([1], 102), {1: False})
+
+    def test_reconnect_after_expiry_counts_as_online(self):
+        self.store.connect(1, "tab-a", 100)
+        self.assertTrue(self.store.connect(1, "tab-b", 100 + PRESENCE_TTL + 1))
+
+    def test_last_seen_flush_is_claimed_once_per_interval(self):
+        self.store.mark_last_seen(1, 123.0)
+        self.assertTrue(self.store.claim_flush(1000))
+        self.assertFalse(self.store.claim_flush(1001))
+        self.assertEqual(self.store.pop_last_seen(), {1: 123.0})
+        self.assertEqual(self.store.pop_last_seen(), {})
+
+
+class MemoryPresenceStoreTests(PresenceStoreCases, SimpleTestCase):
+    def make_store(self):
+        return MemoryPresenceStore()
+
+
+@skipUnless(fakeredis, "fakeredis chưa cài")
+class RedisPresenceStoreTests(PresenceStoreCases, SimpleTestCase):
+    def make_store(self):
+        return RedisPresenceStore(fakeredis.FakeRedis(decode_responses=True))
+
+    def test_disconnect_keeps_concurrent_connect_in_index(self):
+        # connect của tab khác chen vào trước khi disconnect chạy -> user vẫn trong chỉ mục
+        self.store.connect(1, "tab-a", 100)
+        self.store.connect(1, "tab-b", 101)
+        self.assertFalse(self.store.disconnect(1, "tab-a", 102))
+        self.assertIsNotNone(self.store.redis.zscore(RedisPresenceStore.USERS_KEY, 1))
+        self.assertTrue(self.store.disconnect(1, "tab-b", 103))
+        self.assertIsNone(self.store.redis.zscore(RedisPresenceStore.USERS_KEY, 1))
+
+    def test_last_seen_flush_is_claimed_once_per_interval(self):
+        # Khóa flush trên Redis hết hạn theo thời gian thật, không theo `now`
+        self.store.mark_last_seen(1, 123.0)
+        self.assertTrue(self.store.claim_flush(1000))
+        self.assertFalse(self.store.claim_flush(5000))
+        self.assertEqual(self.store.pop_last_seen(), {1: 123.0})
+
+
+class SweepTests(SimpleTestCase):
+    def test_sweep_reports_expired_users_offline(self):
+        store = MemoryPresenceStore()
+        store.connect(7, "conn", 100)
+        with mock.patch("accounts.presence.get_store", return_value=store), \
+                mock.patch("accounts.presence.notify_friends") as notify, \
+                mock.patch("accounts.jobs.flush_last_seen.delay") as flush:
+            sweep([], 100 + PRESENCE_TTL + 1)
+        notify.assert_called_once_with(7, False)
+        flush.assert_called_once_with()
+        self.assertEqual(store.pop_last_seen(), {7: 100})
+
+
+# =================================================================
+# DANH BẠ (accounts/directory.py)
+# =================================================================
+class DirectoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = make_user("viewer")
+        self.friends = [make_user(f"friend{i}") for i in range(2)]
+        self.others = [make_user(f"other{i}") for i in range(3)]
+        for friend in self.friends:
+            Friendship.objects.create(from_user=self.viewer, to_user=friend, status="accepted")
+        Friendship.objects.create(from_user=self.others[0], to_user=self.viewer, status="pending")
+
+    def walk(self, page_size, query=None):
+        pages, cursor = [], None
+        while True:
+            page = directory_page(self.viewer, query=query, cursor=cursor, page_size=page_size)
+            pages.append(page)
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    def ids(self, pages):
+        return [card["id"] for page in pages for card in page["results"]]
+
+    def test_friends_first_then_newest_others(self):
+        expected = [u.id for u in self.friends] + [u.id for u in reversed(self.others)]
+        for page_size in (1, 2, 3, 10):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.ids(self.walk(page_size)), expected)
+
+    def test_friends_ending_on_page_boundary_continue_into_others(self):
+        first = directory_page(self.viewer, page_size=2)
+        self.assertEqual([c["id"] for c in first["results"]], [u.id for u in self.friends])
+        self.assertTrue(all(c["is_friend"] for c in first["results"]))
+        self.assertEqual(first["next_cursor"], "u0")
+        second = directory_page(self.viewer, cursor="u0", page_size=2)
+        self.assertEqual([c["id"] for c in second["results"]], [self.others[2].id, self.others[1].id])
+        self.assertFalse(any(c["is_friend"] for c in second["results"]))
+
+    def test_search_filters_both_sections(self):
+        self.assertEqual(self.ids(self.walk(1, query="friend1")), [self.friends[1].id])
+        self.assertEqual(self.ids(self.walk(1, query="other")), [u.id for u in reversed(self.others)])
+
+    def test_bad_cursor_restarts(self):
+        page = directory_page(self.viewer, cursor="zz", page_size=10)
+        self.assertEqual(len(page["results"]), 5)
+
+    def test_legacy_list_returns_everyone(self):
+        client = APIClient()
+        client.force_authenticate(self.viewer)
+        with mock.patch("accounts.directory.MAX_PAGE_SIZE", 2):
+            response = client.get("/api/accounts/users/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 5)
+
+    def test_profile_change_refreshes_cached_card(self):
+        directory_page(self.viewer, page_size=1)
+        self.friends[0].first_name = "Renamed"
+        self.friends[0].save()
+        card = directory_page(self.viewer, page_size=1)["results"][0]
+        self.assertEqual(card["name"], "Renamed")
@@ -24,6 +24,7 @@ urlpatterns = [
     path('remove-avatar/', remove_avatar, name='remove_avatar'),
      # Users List
     path('users/', views.get_users_list, name='users-list'),
+    path('users/directory/', views.get_users_directory, name='users-directory'),
     
     # ✅ THÊM DÒNG NÀY
     path('users/<int:user_id>/', views.get_user_by_id, name='get-user-by-id'),
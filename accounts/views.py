@@ -17,12 +17,14 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .serializers import CustomTokenObtainPairSerializer
 from django.db.models import Q
 from .models import Friendship, UserStatus 
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from django.utils.text import slugify
 import uuid
 from django.db import transaction
-from .email_service import send_otp_email_brevo
+from .jobs import send_otp_email
+from core.jobs import group_send
+from . import presence
+from .directory import directory_all, directory_page
+from .search import search_users_ranked
 User = get_user_model()
 
 
@@ -105,8 +107,8 @@ class DoctorRegisterView(APIView):
 
                 # Tạo OTP
                 user.generate_otp()
-                send_otp_email_brevo(user)
-                # Gửi Mail (Nếu gửi lỗi sẽ nhảy xuống except và rollback user)
+                # Gửi mail qua job queue sau khi commit (có retry), request không chờ Brevo
+                send_otp_email.delay(user.id)
                 # send_mail(
                 #     subject="🔐 Mã xác nhận tài khoản DoveRx của bạn",
                 #     message=f"Xin chào {user.first_name or user.username},\n\n"
@@ -187,14 +189,8 @@ def search_users(request):
     
     current_user = request.user
     
-    # 1. Lấy list Users
-    users_qs = User.objects.filter(
-        Q(username__icontains=query) |
-        Q(first_name__icontains=query) |
-        Q(last_name__icontains=query) |
-        Q(email__icontains=query)
-    ).exclude(id=current_user.id)[:10]
-    target_users = list(users_qs) 
+    # 1. Lấy list Users qua chỉ mục tìm kiếm (không dấu, có xếp hạng - accounts/search.py)
+    target_users = search_users_ranked(query, exclude_id=current_user.id, limit=10)
     
     # Nếu không có user nào thì trả về rỗng luôn (đỡ tốn công query Friendship)
     if not target_users:
@@ -313,8 +309,6 @@ def send_friend_request(request):
     # 2. GỬI WEBSOCKET (Code mới thêm)
     # ==================================================================
     try:
-        channel_layer = get_channel_layer()
-        
         # Chuẩn bị dữ liệu hiển thị cho người nhận
         # (Avatar, Tên người gửi để hiện trên thông báo)
         user_avatar = None
@@ -336,8 +330,8 @@ def send_friend_request(request):
             "created_at": friendship.created_at.isoformat()
         }
 
-        # Gửi đến group của người nhận: "user_{ID}"
-        async_to_sync(channel_layer.group_send)(
+        # Gửi đến group của người nhận: "user_{ID}" (qua job queue, sau commit)
+        group_send.delay(
             f"user_{to_user.id}", 
             {
                 "type": "send_notification", # Hàm xử lý trong ChatConsumer
@@ -392,12 +386,7 @@ def accept_friend_request(request):
     full_name = f"{friend.first_name} {friend.last_name}".strip()
     
     # Lấy online status
-    is_online = False
-    try:
-        if hasattr(friend, 'status'):
-            is_online = friend.status.is_online
-    except Exception:
-        pass
+    is_online = presence.is_online([friend.id]).get(friend.id, False)
     
     return Response({
         'message': 'Friend request accepted',
@@ -461,21 +450,18 @@ def get_friends(request):
     friendships = Friendship.objects.filter(
         Q(from_user=current_user) | Q(to_user=current_user),
         status='accepted'
-    ).select_related('from_user', 'to_user', 'from_user__status', 'to_user__status')
+    ).select_related('from_user', 'to_user')
+    friend_users = [
+        f.to_user if f.from_user_id == current_user.id else f.from_user
+        for f in friendships
+    ]
+    # Trạng thái online của cả danh sách trong 1 lần tra presence store
+    online_map = presence.is_online([u.id for u in friend_users])
     
     friends = []
-    for friendship in friendships:
-        friend = friendship.to_user if friendship.from_user == current_user else friendship.from_user
-        
+    for friend in friend_users:
         full_name = f"{friend.first_name} {friend.last_name}".strip()
-        
-        # Lấy trạng thái online
-        is_online = False
-        try:
-            if hasattr(friend, 'status'):
-                is_online = friend.status.is_online
-        except Exception as e:
-            print(f"⚠️ [get_friends] Cannot get online status for user {friend.id}: {e}")
+        is_online = online_map.get(friend.id, False)
         
         friends.append({
             'id': friend.id,
@@ -495,37 +481,31 @@ def get_friends(request):
 @permission_classes([IsAuthenticated])
 def get_users_list(request):
     """
-    Lấy danh sách tất cả users (trừ chính mình)
-    Dùng cho sidebar chat contacts
+    Danh sách users cho sidebar chat contacts (bạn bè trước).
+    Route cũ: giữ format cũ, trả TOÀN BỘ list (card vẫn lấy từ cache).
+    Client mới dùng /users/directory/ (phân trang bằng cursor).
     """
-    current_user = request.user
-    
-    #  Dùng select_related để tối ưu query
-    users = User.objects.exclude(id=current_user.id).select_related('status')
-    
-    users_list = []
-    for user in users:
-        full_name = f"{user.first_name} {user.last_name}".strip()
-        
-        # Lấy trạng thái online
-        is_online = False
-        try:
-            if hasattr(user, 'status'):
-                is_online = user.status.is_online
-        except Exception as e:
-            print(f"⚠️ [get_users_list] Cannot get online status for user {user.id}: {e}")
-        
-        users_list.append({
-            'id': user.id,
-            'name': full_name or user.username or user.email.split('@')[0],
-            'email': user.email,
-           
-            'avatar':user.avatar.url if user.avatar else None,
-            'role': user.role,
-            'online': is_online  # Lấy từ database
-        })
-    
-    return Response(users_list)
+    return Response(directory_all(request.user, query=request.GET.get('q', '').strip() or None))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_users_directory(request):
+    """
+    Danh bạ phân trang, có tìm kiếm. Card user được cache (accounts/directory.py).
+    GET /api/accounts/users/directory/?q=...&limit=30&cursor=<next_cursor>
+    """
+    try:
+        limit = int(request.GET.get('limit', 30))
+    except ValueError:
+        limit = 30
+    page = directory_page(
+        request.user,
+        query=request.GET.get('q', '').strip() or None,
+        cursor=request.GET.get('cursor') or None,
+        page_size=limit,
+    )
+    return Response(page)
 
 
 @api_view(['GET'])
@@ -536,7 +516,7 @@ def get_user_by_id(request, user_id):
     Bao gồm cả friendship status với current user
     """
     try:
-        target_user = User.objects.select_related('status').get(id=user_id)  #  THÊM select_related
+        target_user = User.objects.get(id=user_id)
     except User.DoesNotExist:
         return Response(
             {'error': 'User not found'}, 
@@ -565,12 +545,7 @@ def get_user_by_id(request, user_id):
     full_name = f"{target_user.first_name} {target_user.last_name}".strip()
     
     #  Lấy online status
-    is_online = False
-    try:
-        if hasattr(target_user, 'status'):
-            is_online = target_user.status.is_online
-    except Exception:
-        pass
+    is_online = presence.is_online([target_user.id]).get(target_user.id, False)
     
     user_data = {
         'id': target_user.id,
@@ -100,9 +100,9 @@ import requests
 from django.contrib.auth import get_user_model
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import status
 from rest_framework.permissions import AllowAny
+from .serializers import CustomTokenObtainPairSerializer
 import time
 
 class GoogleLoginAPIView(APIView):
@@ -210,8 +210,8 @@ class GoogleLoginAPIView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-        # --- Cấp JWT token ---
-        refresh = RefreshToken.for_user(user)
+        # --- Cấp JWT token (cùng claims với đăng nhập thường) ---
+        refresh = CustomTokenObtainPairSerializer.get_token(user)
 
         # --- Chuẩn hóa dữ liệu trả về cho frontend ---
         user_info = {
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        # Thành viên conversation đổi -> ChatConsumer bỏ cache quyền
+        from . import signals  # noqa: F401
@@ -1,19 +1,33 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
+from collections import OrderedDict
 import json
 import traceback
 from .models import Conversation, Message
-from accounts.models import UserStatus
+from . import inbox, resume
+from .history import InvalidMessageCursor
+from core import typing_indicator
+from core.multiplex import LegacyEndpointMixin, Substream
+from accounts import presence
 
-class ChatConsumer(AsyncWebsocketConsumer):
+# Số conversation tối đa cache quyền truy cập cho mỗi socket
+MEMBERSHIP_CACHE_SIZE = 128
+
+
+class ChatConsumer(LegacyEndpointMixin, AsyncWebsocketConsumer):
     """
     Consumer xử lý chat real-time giữa 2 người
     """
-    
+    # Route cũ ws/chat/: event của FeedConsumer đến qua user_{id} -> bỏ qua
+    legacy_name = 'chat'
+    foreign_prefixes = ('feed_',)
+
     async def connect(self):
         try:
             self.user = self.scope.get('user', AnonymousUser())
+            # conversation_id -> tuple id người còn lại, hoặc None nếu không có quyền (LRU)
+            self.membership_cache = OrderedDict()
             
             if not self.user.is_authenticated:
                 await self.close(code=4001)
@@ -27,6 +41,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             )
             
             await self.set_user_online(True)
+            presence.ensure_heartbeat()
             await self.accept()
             
             await self.send(text_data=json.dumps({
@@ -69,6 +84,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
             if message_type == 'mark_read':
                 await self.handle_mark_read(data)
                 return
+
+            if message_type == 'resume':
+                await self.handle_resume(data)
+                return
                 
         except Exception as e:
             print(f"❌ [ChatConsumer] Exception: {e}")
@@ -93,17 +112,29 @@ class ChatConsumer(AsyncWebsocketConsumer):
             if not conversation_id or (not text and not attachment):
                 return
             
+            # Quyền truy cập lấy từ cache, không query DB
+            if await self.get_peer_ids(conversation_id) is None:
+                return
+
             # Gọi hàm save_message
-            message_data = await self.save_message(conversation_id, text, attachment)
+            message_data = await self.save_message(int(conversation_id), text, attachment)
             
             if not message_data:
                 return
             
+            # Gửi tin xong -> không còn "đang gõ"
+            peer_ids = await self.get_peer_ids(conversation_id)
+            typing_indicator.user_typing(
+                typing_indicator.chat_target(conversation_id),
+                [f'user_{peer_id}' for peer_id in peer_ids],
+                self.user,
+                False
+            )
+
             # Gửi cho người nhận
-            other_user_id = await self.get_other_user_id(conversation_id)
-            if other_user_id:
+            for peer_id in peer_ids:
                 await self.channel_layer.group_send(
-                    f'user_{other_user_id}',
+                    f'user_{peer_id}',
                     {
                         'type': 'chat.new_message',
                         'message': message_data
@@ -118,33 +149,70 @@ class ChatConsumer(AsyncWebsocketConsumer):
             
         except Exception as e:
             print(f"❌ Handle send message error: {e}")
-    async def feed_notification(self, event):
-        pass
     async def handle_typing(self, data):
         try:
             conversation_id = data.get('conversation_id')
             is_typing = data.get('is_typing', True)
             if not conversation_id: return
-            other_user_id = await self.get_other_user_id(conversation_id)
-            if other_user_id:
-                await self.channel_layer.group_send(f'user_{other_user_id}', {
-                    'type': 'chat.user_typing', 'conversation_id': conversation_id,
-                    'user_id': self.user.id, 'is_typing': is_typing
-                })
+            peer_ids = await self.get_peer_ids(conversation_id)
+            if not peer_ids: return
+            # Throttle + gom theo lô, không gửi 1 event mỗi phím gõ
+            typing_indicator.user_typing(
+                typing_indicator.chat_target(conversation_id),
+                [f'user_{peer_id}' for peer_id in peer_ids],
+                self.user,
+                is_typing
+            )
         except: pass
 
     async def handle_mark_read(self, data):
         try:
             conversation_id = data.get('conversation_id')
             if not conversation_id: return
-            await self.mark_messages_as_read(conversation_id)
-            other_user_id = await self.get_other_user_id(conversation_id)
-            if other_user_id:
-                await self.channel_layer.group_send(f'user_{other_user_id}', {
-                   'type': 'chat.messages_read', 'conversation_id': conversation_id, 'user_id': self.user.id
+            peer_ids = await self.get_peer_ids(conversation_id)
+            if peer_ids is None: return
+            # {"type": "mark_read", "conversation_id": 1, "message_id": 123 (tùy chọn)}
+            up_to = data.get('message_id')
+            watermark = await self.mark_messages_as_read(int(conversation_id), int(up_to) if up_to else None)
+            for peer_id in peer_ids:
+                await self.channel_layer.group_send(f'user_{peer_id}', {
+                   'type': 'chat.messages_read', 'conversation_id': conversation_id, 'user_id': self.user.id,
+                   'last_read_message_id': watermark
                 })
         except: pass
 
+    async def handle_resume(self, data):
+        """Gửi tin nhắn + trạng thái đọc bị lỡ từ mốc client gửi lên (chat/resume.py)"""
+        try:
+            since, cursors = resume.parse_resume(data)
+        except (InvalidMessageCursor, AttributeError):
+            await self.send(text_data=json.dumps({'type': 'resync_required', 'reason': 'invalid_cursor'}))
+            return
+
+        plan, missed = await self.plan_resume(since, cursors)
+        if plan is None or missed > resume.RESUME_MAX_MESSAGES:
+            # Lỡ quá nhiều -> client tải lại qua REST
+            await self.send(text_data=json.dumps({'type': 'resync_required', 'reason': 'too_far_behind'}))
+            return
+
+        conversation_ids, watermarks = await self.load_resume_scope(plan, since, cursors)
+        after = 0
+        while plan:
+            batch = await self.load_missed_batch(plan, after, watermarks)
+            if not batch:
+                break
+            await self.send(text_data=json.dumps({'type': 'resume_messages', 'messages': batch}))
+            after = batch[-1]['id']
+            if len(batch) < resume.RESUME_BATCH_SIZE:
+                break
+
+        states = await self.load_read_states(conversation_ids, watermarks)
+        await self.send(text_data=json.dumps({'type': 'resume_read_states', 'states': states}))
+        await self.send(text_data=json.dumps({
+            'type': 'resume_complete',
+            'last_message_id': max(after, since or 0, *cursors.values())
+        }))
+
     async def chat_new_message(self, event):
         # Đảm bảo gửi payload event['message'] ra ngoài (Consumer tiêu chuẩn)
         await self.send(text_data=json.dumps({'type': 'new_message', 'message': event['message']}))
@@ -153,25 +221,74 @@ class ChatConsumer(AsyncWebsocketConsumer):
         # Gửi toàn bộ event ra ngoài, Front-end sẽ xử lý
         await self.send(text_data=json.dumps(event))
 
+    async def typing_batch(self, event):
+        """Trạng thái đang gõ trong conversation (core/typing_indicator.py)"""
+        if event.get('scope') != 'chat':
+            return
+        typing = [t for t in event['typing'] if t['user_id'] != self.user.id]
+        stopped = [uid for uid in event['stopped'] if uid != self.user.id]
+        if not typing and not stopped:
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'typing_batch',
+            'conversation_id': event['target_id'],
+            'typing': typing,
+            'stopped': stopped,
+            'ttl': event['ttl']
+        }))
+
     async def chat_messages_read(self, event):
         await self.send(text_data=json.dumps(event))
+
+    async def chat_membership_changed(self, event):
+        # Conversation đổi thành viên (chat/signals.py) -> bỏ cache quyền
+        conversation_id = event.get('conversation_id')
+        if conversation_id is None:
+            self.membership_cache.clear()
+        else:
+            self.membership_cache.pop(conversation_id, None)
+
+    async def get_peer_ids(self, conversation_id):
+        """
+        Id những người còn lại trong conversation (tuple), None nếu user không
+        thuộc conversation. Cache LRU theo socket, chỉ query DB khi miss;
+        kết quả None không cache (user có thể vừa được thêm vào conversation).
+        """
+        try:
+            conversation_id = int(conversation_id)
+        except (TypeError, ValueError):
+            return None
+
+        cache = self.membership_cache
+        if conversation_id in cache:
+            cache.move_to_end(conversation_id)
+            return cache[conversation_id]
+
+        peer_ids = await self.load_peer_ids(conversation_id)
+        if peer_ids is None:
+            return None
+        cache[conversation_id] = peer_ids
+        if len(cache) > MEMBERSHIP_CACHE_SIZE:
+            cache.popitem(last=False)
+        return peer_ids
+
+    async def presence_update(self, event):
+        # Bạn bè online/offline (chỉ gửi tới bạn bè, xem accounts/presence.py)
+        await self.send(text_data=json.dumps({
+            'type': 'presence_update',
+            'user_id': event['user_id'],
+            'online': event['online']
+        }))
     
     # =================================================================
     #  Dùng URL từ Client để tránh lỗi Media
     # =================================================================
     @database_sync_to_async
     def save_message(self, conversation_id, text, attachment=None):
-        try:            
-            conversation = Conversation.objects.filter(
-                id=conversation_id,
-                participants=self.user
-            ).first()
-            
-            if not conversation:
-                return None
-
+        # Quyền truy cập đã kiểm tra qua get_peer_ids (cache), không query lại Conversation
+        try:
             message = Message(
-                conversation=conversation,
+                conversation_id=conversation_id,
                 sender=self.user,
                 text=text,
                 is_read=False
@@ -193,9 +310,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     filename = final_url.split('/')[-1]
                     message.attachment.name = f"chat_attachments/{filename}"
 
-            # 2. Lưu vào DB     
-            message.save()
-            conversation.save()
+            # 2. Lưu vào DB (cùng transaction với tin nhắn cuối + bộ đếm chưa đọc)
+            inbox.save_message(message)
 
             # 3. Chuẩn bị dữ liệu trả về
             
@@ -231,7 +347,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
             return {
                 'id': message.id,
-                'conversation': message.conversation.id,
+                'conversation': message.conversation_id,
                 'sender': {
                     'id': self.user.id,
                     'username': self.user.username,
@@ -250,25 +366,59 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return None
 
     @database_sync_to_async
-    def get_other_user_id(self, conversation_id):
-        try:
-            conversation = Conversation.objects.filter(id=conversation_id, participants=self.user).first()
-            if conversation:
-                for p in conversation.participants.all():
-                    if p.id != self.user.id: return p.id
+    def load_peer_ids(self, conversation_id):
+        # 1 query trên bảng M2M, không load Conversation / User
+        member_ids = list(
+            Conversation.participants.through.objects.filter(
+                conversation_id=conversation_id
+            ).values_list('user_id', flat=True)
+        )
+        if self.user.id not in member_ids:
             return None
-        except: return None
+        return tuple(uid for uid in member_ids if uid != self.user.id)
     
     @database_sync_to_async
-    def mark_messages_as_read(self, conversation_id):
+    def plan_resume(self, since, cursors):
+        plan = resume.plan_resume(self.user.id, since, cursors)
+        return plan, resume.count_missed(plan) if plan else 0
+
+    @database_sync_to_async
+    def load_resume_scope(self, plan, since, cursors):
+        # Conversation có tin mới + conversation client đang giữ (+ gần đây nếu dùng mốc chung)
+        conversation_ids = set(plan) | set(cursors)
+        if since is not None:
+            conversation_ids.update(resume.recent_conversation_ids(self.user.id))
+        # Chỉ conversation user còn là thành viên
+        conversation_ids = list(
+            Conversation.objects.filter(id__in=conversation_ids, participants=self.user).values_list('id', flat=True)
+        )
+        return conversation_ids, resume.read_watermarks_for(conversation_ids)
+
+    @database_sync_to_async
+    def load_missed_batch(self, plan, after, watermarks):
+        return resume.missed_batch(plan, after, watermarks)
+
+    @database_sync_to_async
+    def load_read_states(self, conversation_ids, watermarks):
+        return resume.read_states(self.user.id, conversation_ids, watermarks)
+
+    @database_sync_to_async
+    def mark_messages_as_read(self, conversation_id, up_to=None):
         try:
-            Message.objects.filter(conversation_id=conversation_id, is_read=False).exclude(sender=self.user).update(is_read=True)
-        except: pass
+            return inbox.mark_conversation_read(conversation_id, self.user, up_to=up_to)
+        except: return None
     
     @database_sync_to_async
     def set_user_online(self, is_online):
+        # Đếm theo connection (nhiều tab), không ghi DB mỗi lần mở/đóng socket
         try:
-            status, _ = UserStatus.objects.get_or_create(user=self.user)
-            status.is_online = is_online
-            status.save()
-        except: pass
\ No newline at end of file
+            if is_online:
+                presence.user_connected(self.user.id, self.channel_name)
+            else:
+                presence.user_disconnected(self.user.id, self.channel_name)
+        except Exception as e:
+            print(f"❌ [presence] Error: {e}")
+
+
+class ChatStream(Substream, ChatConsumer):
+    """ChatConsumer chạy như stream "chat" trong social.consumers.StreamConsumer"""
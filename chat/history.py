@@ -0,0 +1,83 @@
+from .models import Message
+
+# =================================================================
+# LỊCH SỬ TIN NHẮN - keyset theo id (index (conversation, id), migration 0007)
+# =================================================================
+# id tăng dần theo thời gian gửi nên "cũ hơn" = id nhỏ hơn. Mỗi trang chỉ là
+#   WHERE conversation_id = ? AND id < ? ORDER BY id DESC LIMIT n
+# -> chi phí như nhau dù đang ở trang 1 hay trang 10.000 (khác với OFFSET).
+#
+# Các chế độ:
+#   before=<id>  -> tin cũ hơn id (cuộn lên)
+#   after=<id>   -> tin mới hơn id (cuộn xuống / bắt kịp)
+#   around=<id>  -> cửa sổ quanh 1 tin ("nhảy tới tin nhắn")
+#   (không có)   -> trang mới nhất
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+class InvalidMessageCursor(ValueError):
+    """Tham số before/after/around không hợp lệ"""
+
+
+def parse_message_id(value):
+    if value in (None, ''):
+        return None
+    try:
+        message_id = int(value)
+    except (TypeError, ValueError):
+        raise InvalidMessageCursor(value)
+    if message_id < 0:
+        raise InvalidMessageCursor(value)
+    return message_id
+
+
+def _older(qs, message_id, limit, inclusive=False):
+    lookup = 'id__lte' if inclusive else 'id__lt'
+    if message_id is not None:
+        qs = qs.filter(**{lookup: message_id})
+    rows = list(qs.order_by('-id')[:limit + 1])
+    has_more = len(rows) > limit
+    return list(reversed(rows[:limit])), has_more
+
+
+def _newer(qs, message_id, limit):
+    rows = list(qs.filter(id__gt=message_id).order_by('id')[:limit + 1])
+    has_more = len(rows) > limit
+    return rows[:limit], has_more
+
+
+def message_window(conversation_id, before=None, after=None, around=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    1 trang tin nhắn, luôn trả về theo thứ tự cũ -> mới.
+
+    Returns:
+        {
+            "results": [Message, ...],
+            "has_more_before": bool,   # còn tin cũ hơn results[0]
+            "has_more_after": bool,    # còn tin mới hơn results[-1]
+        }
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    qs = Message.objects.filter(conversation_id=conversation_id).select_related('sender')
+
+    if around is not None:
+        # Nửa trước (gồm chính tin được nhảy tới) + nửa sau
+        older_limit = limit // 2 + 1
+        older, has_more_before = _older(qs, around, older_limit, inclusive=True)
+        newer, has_more_after = _newer(qs, around, limit - len(older))
+        results = older + newer
+    elif after is not None:
+        results, has_more_after = _newer(qs, after, limit)
+        # Còn tin cũ hơn results[0] khi có tin id <= after (after có thể đã bị xóa)
+        has_more_before = qs.filter(id__lte=after).exists()
+    else:
+        results, has_more_before = _older(qs, before, limit)
+        has_more_after = before is not None and qs.filter(id__gte=before).exists()
+
+    return {
+        'results': results,
+        'has_more_before': has_more_before,
+        'has_more_after': has_more_after,
+    }
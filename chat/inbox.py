@@ -0,0 +1,175 @@
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from .models import Conversation, ConversationReadState, Message
+
+# =================================================================
+# INBOX - tin nhắn cuối + bộ đếm chưa đọc phi chuẩn hóa
+# =================================================================
+# - Conversation.last_message / last_message_text / last_message_at
+#   được ghi cùng transaction với tin nhắn mới.
+# - ConversationReadState.unread_count: mỗi người 1 dòng, tin mới cộng F() + 1
+#   cho người nhận, đánh dấu đã đọc thì về 0.
+# - Đã đọc = mốc last_read_message_id trên cùng dòng đó (tin có id <= mốc
+#   là đã đọc). Đánh dấu đọc chỉ UPDATE 1 dòng, không chạm bảng Message;
+#   "đã xem" của từng tin suy ra từ mốc của người nhận (serializers.py).
+# -> Danh sách conversation chỉ còn 1 query (xem views.get_conversations).
+
+SNIPPET_LENGTH = 255
+ATTACHMENT_SNIPPET = '📎 Tệp đính kèm'
+
+
+def message_snippet(message):
+    text = (message.text or '').strip()
+    if text:
+        return text[:SNIPPET_LENGTH]
+    return ATTACHMENT_SNIPPET if message.attachment else ''
+
+
+def ensure_read_states(conversation_id, user_ids):
+    """Tạo dòng trạng thái đọc còn thiếu (conversation mới tạo)"""
+    ConversationReadState.objects.bulk_create(
+        [ConversationReadState(conversation_id=conversation_id, user_id=uid) for uid in user_ids],
+        ignore_conflicts=True
+    )
+
+
+def notify_membership_changed(conversation_id, user_ids):
+    """
+    Báo các ChatConsumer của những user này bỏ cache quyền của conversation (sau commit).
+    Gọi tự động khi participants đổi (chat/signals.py).
+    """
+    from core.jobs import group_send_many
+
+    event = {'type': 'chat.membership_changed', 'conversation_id': conversation_id}
+    group_send_many.delay([[f"user_{uid}", event] for uid in user_ids])
+
+
+def direct_pair(user_id, other_id):
+    """Khóa chuẩn (user_low, user_high) của chat 1:1"""
+    return min(user_id, other_id), max(user_id, other_id)
+
+
+def get_or_create_direct_conversation(user_id, other_id):
+    """
+    Conversation 1:1 giữa 2 user, tạo mới nếu chưa có.
+    An toàn khi 2 request chạy song song: unique (user_low, user_high)
+    chặn bản ghi thứ 2, bên thua đọc lại bản của bên thắng.
+
+    Returns:
+        (conversation, created)
+    """
+    low, high = direct_pair(user_id, other_id)
+    conversation = Conversation.objects.filter(user_low_id=low, user_high_id=high).first()
+    if conversation:
+        return conversation, False
+
+    try:
+        with transaction.atomic():
+            conversation = Conversation.objects.create(user_low_id=low, user_high_id=high)
+            # participants.add -> chat/signals.py báo các ChatConsumer bỏ cache quyền
+            conversation.participants.add(low, high)
+            ensure_read_states(conversation.id, [low, high])
+        return conversation, True
+    except IntegrityError:
+        return Conversation.objects.get(user_low_id=low, user_high_id=high), False
+
+
+def record_message(message):
+    """
+    Cập nhật tin nhắn cuối + bộ đếm chưa đọc sau khi lưu `message`.
+    Gọi trong cùng transaction.atomic() với message.save().
+    """
+    now = timezone.now()
+    # Chỉ tiến lên: 2 tin gửi song song không làm last_message lùi về tin cũ hơn
+    Conversation.objects.filter(
+        Q(last_message__isnull=True) | Q(last_message_id__lt=message.id),
+        pk=message.conversation_id
+    ).update(
+        last_message=message,
+        last_message_text=message_snippet(message),
+        last_message_at=message.created_at,
+        updated_at=now
+    )
+    ConversationReadState.objects.filter(
+        conversation_id=message.conversation_id
+    ).exclude(user_id=message.sender_id).update(unread_count=F('unread_count') + 1)
+
+
+def save_message(message):
+    with transaction.atomic():
+        message.save()
+        record_message(message)
+    return message
+
+
+def mark_conversation_read(conversation_id, user, up_to=None):
+    """
+    Dời mốc đã đọc của user tới tin cuối của conversation (hoặc tới tin
+    `up_to`, bị chặn ở tin cuối: id do client gửi, không được vượt qua tin
+    chưa tồn tại). Mốc chỉ tiến lên.
+
+    - Đọc hết: 1 UPDATE trên dòng ConversationReadState, bộ đếm về 0.
+    - Đọc tới up_to: bộ đếm = số tin của người khác sau mốc (đếm theo
+      khoảng id trên index (conversation, id)).
+
+    Returns:
+        mốc last_read_message_id mới (None nếu user không thuộc conversation)
+    """
+    states = ConversationReadState.objects.filter(conversation_id=conversation_id, user=user)
+
+    if up_to is None:
+        last_id = Conversation.objects.filter(pk=OuterRef('conversation_id')).values('last_message_id')[:1]
+        states.update(
+            last_read_message_id=Greatest(
+                F('last_read_message_id'),
+                Coalesce(Subquery(last_id), Value(0)),
+                output_field=models.BigIntegerField()
+            ),
+            unread_count=0
+        )
+        return states.values_list('last_read_message_id', flat=True).first()
+
+    with transaction.atomic():
+        state = states.select_for_update().first()
+        if state is None:
+            return None
+        last_id = Conversation.objects.filter(pk=conversation_id).values_list('last_message_id', flat=True).first()
+        watermark = max(state.last_read_message_id, min(int(up_to), last_id or 0))
+        unread = Message.objects.filter(
+            conversation_id=conversation_id,
+            id__gt=watermark
+        ).exclude(sender=user).count()
+        states.filter(pk=state.pk).update(last_read_message_id=watermark, unread_count=unread)
+    return watermark
+
+
+def read_watermarks(conversation_id):
+    """{user_id: last_read_message_id} của mọi người trong conversation"""
+    return dict(
+        ConversationReadState.objects.filter(conversation_id=conversation_id)
+        .values_list('user_id', 'last_read_message_id')
+    )
+
+
+def rebuild_inbox(conversation_ids=None):
+    """Tính lại tin nhắn cuối + bộ đếm từ bảng Message (migration / sửa lệch)"""
+    conversations = Conversation.objects.prefetch_related('participants')
+    if conversation_ids is not None:
+        conversations = conversations.filter(id__in=conversation_ids)
+
+    for conversation in conversations.iterator(chunk_size=500):
+        last = Message.objects.filter(conversation=conversation).order_by('-created_at', '-id').first()
+        Conversation.objects.filter(pk=conversation.pk).update(
+            last_message=last,
+            last_message_text=message_snippet(last) if last else '',
+            last_message_at=last.created_at if last else None
+        )
+        for participant in conversation.participants.all():
+            state, _ = ConversationReadState.objects.get_or_create(conversation=conversation, user=participant)
+            unread = Message.objects.filter(
+                conversation=conversation,
+                id__gt=state.last_read_message_id
+            ).exclude(sender=participant).count()
+            ConversationReadState.objects.filter(pk=state.pk).update(unread_count=unread)
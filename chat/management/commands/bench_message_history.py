@@ -0,0 +1,110 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from core.metrics import percentile
+from chat.history import message_window
+from chat.models import Conversation, Message
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark lịch sử tin nhắn: OFFSET/LIMIT cũ vs keyset before/around theo id "
+        "trên bảng Message giả (chạy trong transaction và rollback, không để lại dữ liệu)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000_000, help="Tổng số tin nhắn giả")
+        parser.add_argument("--conversations", type=int, default=100)
+        parser.add_argument("--depths", type=int, nargs="+", default=[0, 1_000, 10_000, 50_000, 90_000],
+                            help="Độ sâu cuộn (số tin tính từ tin mới nhất)")
+        parser.add_argument("--limit", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=5, help="Số lần chạy mỗi query")
+        parser.add_argument("--batch-size", type=int, default=20_000)
+
+    def handle(self, *args, **options):
+        per_conv = options["rows"] // options["conversations"]
+        self.stdout.write(
+            f"💬 {options['rows']:,} messages in {options['conversations']} conversations "
+            f"({per_conv:,} each) on {connection.vendor}"
+        )
+
+        with transaction.atomic():
+            alice = User.objects.create(username="bench_chat_a", email="bench_chat_a@example.invalid", password="!")
+            bob = User.objects.create(username="bench_chat_b", email="bench_chat_b@example.invalid", password="!")
+            conv_ids = []
+            t0 = time.perf_counter()
+            for _ in range(options["conversations"]):
+                conversation = Conversation.objects.create()
+                conversation.participants.add(alice, bob)
+                self._fill(conversation.id, (alice.id, bob.id), per_conv, options["batch_size"])
+                conv_ids.append(conversation.id)
+            self.stdout.write(f"📥 Inserted in {time.perf_counter() - t0:.1f}s")
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute(f"ANALYZE {Message._meta.db_table}")
+
+            depths = [d for d in options["depths"] if d < per_conv]
+            for depth in depths:
+                self._measure(conv_ids, depth, options["limit"], options["repeat"])
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("✅ Done (synthetic messages rolled back)"))
+
+    def _fill(self, conversation_id, sender_ids, count, batch_size):
+        if connection.vendor == "postgresql":
+            # generate_series nhanh hơn bulk_create nhiều lần ở quy mô 10M dòng
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {Message._meta.db_table} "
+                    "(conversation_id, sender_id, text, created_at, is_read) "
+                    "SELECT %s, CASE WHEN g %% 2 = 0 THEN %s ELSE %s END, 'bench message ' || g, "
+                    "now() - (%s - g) * interval '1 second', true "
+                    "FROM generate_series(1, %s) AS g",
+                    [conversation_id, sender_ids[0], sender_ids[1], count, count],
+                )
+            return
+
+        now = timezone.now()
+        for offset in range(0, count, batch_size):
+            Message.objects.bulk_create([
+                Message(
+                    conversation_id=conversation_id,
+                    sender_id=sender_ids[i % 2],
+                    text=f"bench message {i}",
+                    created_at=now,
+                    is_read=True,
+                )
+                for i in range(offset, min(offset + batch_size, count))
+            ])
+
+    def _timed(self, fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t0)
+        return samples
+
+    def _measure(self, conv_ids, depth, limit, repeat):
+        offset_samples, before_samples, around_samples = [], [], []
+        for conv_id in conv_ids[:10]:
+            qs = Message.objects.filter(conversation_id=conv_id)
+            # id của tin ở độ sâu này (client có sẵn từ trang trước, không tính giờ)
+            pivot = qs.order_by("-id").values_list("id", flat=True)[depth]
+
+            offset_samples += self._timed(lambda: list(
+                qs.select_related("sender").order_by("-created_at")[depth:depth + limit]
+            ), repeat)
+            before_samples += self._timed(lambda: message_window(conv_id, before=pivot, limit=limit), repeat)
+            around_samples += self._timed(lambda: message_window(conv_id, around=pivot, limit=limit), repeat)
+
+        def fmt(samples):
+            return f"p50={percentile(samples, 50) * 1000:8.2f}ms  p99={percentile(samples, 99) * 1000:8.2f}ms"
+
+        self.stdout.write(f"\n📊 depth {depth:>9,}")
+        self.stdout.write(f"   offset (cũ)    : {fmt(offset_samples)}")
+        self.stdout.write(f"   before=<id>    : {fmt(before_samples)}")
+        self.stdout.write(f"   around=<id>    : {fmt(around_samples)}")
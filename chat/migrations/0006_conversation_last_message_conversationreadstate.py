@@ -0,0 +1,70 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_inbox(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationReadState = apps.get_model('chat', 'ConversationReadState')
+    Message = apps.get_model('chat', 'Message')
+
+    for conversation in Conversation.objects.prefetch_related('participants').iterator(chunk_size=500):
+        last = Message.objects.filter(conversation=conversation).order_by('-created_at', '-id').first()
+        if last:
+            text = (last.text or '').strip()
+            Conversation.objects.filter(pk=conversation.pk).update(
+                last_message=last,
+                last_message_text=text[:255] if text else ('📎 Tệp đính kèm' if last.attachment else ''),
+                last_message_at=last.created_at
+            )
+        states = []
+        for participant in conversation.participants.all():
+            unread = Message.objects.filter(
+                conversation=conversation,
+                is_read=False
+            ).exclude(sender=participant).count()
+            states.append(ConversationReadState(
+                conversation=conversation,
+                user=participant,
+                unread_count=unread
+            ))
+        ConversationReadState.objects.bulk_create(states, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_remove_message_attachment_type_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_text',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ConversationReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='chat.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('conversation', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
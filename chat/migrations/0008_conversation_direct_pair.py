@@ -0,0 +1,76 @@
+import django.db.models.deletion
+from collections import defaultdict
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_direct_pairs(apps, schema_editor):
+    """
+    Gán (user_low, user_high) cho mọi conversation 2 người.
+    Cặp bị trùng: giữ conversation cũ nhất, chuyển tin nhắn của các bản
+    trùng sang đó, cộng dồn bộ đếm chưa đọc rồi xóa bản trùng.
+    """
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationReadState = apps.get_model('chat', 'ConversationReadState')
+    Message = apps.get_model('chat', 'Message')
+    Through = Conversation.participants.through
+
+    members = defaultdict(set)
+    for conv_id, user_id in Through.objects.values_list('conversation_id', 'user_id').iterator():
+        members[conv_id].add(user_id)
+
+    pairs = defaultdict(list)
+    for conv_id, user_ids in members.items():
+        if len(user_ids) == 2:
+            pairs[tuple(sorted(user_ids))].append(conv_id)
+
+    for (low, high), conv_ids in pairs.items():
+        conv_ids.sort()
+        keeper_id, duplicate_ids = conv_ids[0], conv_ids[1:]
+
+        if duplicate_ids:
+            Message.objects.filter(conversation_id__in=duplicate_ids).update(conversation_id=keeper_id)
+            for user_id in (low, high):
+                unread = sum(ConversationReadState.objects.filter(
+                    conversation_id__in=conv_ids, user_id=user_id
+                ).values_list('unread_count', flat=True))
+                ConversationReadState.objects.update_or_create(
+                    conversation_id=keeper_id,
+                    user_id=user_id,
+                    defaults={'unread_count': unread}
+                )
+            Conversation.objects.filter(id__in=duplicate_ids).delete()
+
+            last = Message.objects.filter(conversation_id=keeper_id).order_by('-created_at', '-id').first()
+            if last:
+                text = (last.text or '').strip()
+                Conversation.objects.filter(pk=keeper_id).update(
+                    last_message=last,
+                    last_message_text=text[:255] if text else ('📎 Tệp đính kèm' if last.attachment else ''),
+                    last_message_at=last.created_at,
+                    updated_at=last.created_at
+                )
+
+        Conversation.objects.filter(pk=keeper_id).update(user_low_id=low, user_high_id=high)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_message_chat_message_conv_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(merge_direct_pairs, migrations.RunPython.noop),
+    ]
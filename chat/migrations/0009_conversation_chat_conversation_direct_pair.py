@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Tách khỏi 0008: PostgreSQL không cho ALTER TABLE trong cùng transaction
+    # còn FK trigger (deferred) chờ xử lý sau khi 0008 chuyển/xóa dữ liệu.
+
+    dependencies = [
+        ('chat', '0008_conversation_direct_pair'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='chat_conversation_direct_pair'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_watermarks(apps, schema_editor):
+    """
+    Mốc đọc từ cờ is_read cũ: ngay trước tin chưa đọc đầu tiên của người
+    khác (không làm mất tin chưa đọc nào), không có thì là tin cuối.
+    """
+    ConversationReadState = apps.get_model('chat', 'ConversationReadState')
+    Message = apps.get_model('chat', 'Message')
+
+    first_unread = (
+        Message.objects.filter(conversation_id=OuterRef('conversation_id'), is_read=False)
+        .exclude(sender_id=OuterRef('user_id'))
+        .order_by('id').values('id')[:1]
+    )
+    last = Message.objects.filter(conversation_id=OuterRef('conversation_id')).order_by('-id').values('id')[:1]
+    ConversationReadState.objects.update(
+        last_read_message_id=Coalesce(
+            Subquery(first_unread) - 1,
+            Subquery(last),
+            Value(0),
+            output_field=models.BigIntegerField()
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_conversation_chat_conversation_direct_pair'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationreadstate',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_watermarks, migrations.RunPython.noop),
+    ]
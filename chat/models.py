@@ -6,11 +6,40 @@ class Conversation(models.Model):
     Model đại diện cho cuộc trò chuyện giữa 2 người dùng
     """
     participants = models.ManyToManyField(User, related_name='conversations')
+    # Khóa chuẩn của chat 1:1: (id nhỏ, id lớn) -> tra cứu / get-or-create 1 lần probe index
+    user_low = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    user_high = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    # Tin nhắn cuối (phi chuẩn hóa, cập nhật trong chat/inbox.py) -> inbox không cần subquery
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    last_message_text = models.CharField(max_length=255, blank=True, default='')
+    last_message_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         ordering = ['-updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='chat_conversation_direct_pair'),
+        ]
     
     def __str__(self):
         participant_names = ', '.join([user.username for user in self.participants.all()[:2]])
@@ -50,10 +79,41 @@ class Message(models.Model):
     )
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Cột cũ, không còn được cập nhật: trạng thái đọc lấy theo
+    # ConversationReadState.last_read_message_id của người nhận
     is_read = models.BooleanField(default=False)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Keyset lịch sử tin nhắn: WHERE conversation_id = ? AND id < ? ORDER BY id DESC
+            models.Index(fields=['conversation', 'id'], name='chat_message_conv_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.username}: {self.text[:50]}"
+
+
+class ConversationReadState(models.Model):
+    """
+    Trạng thái đọc của từng người trong conversation: mốc đã đọc
+    (mọi tin có id <= last_read_message_id) + số tin chưa đọc
+    """
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='read_states'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='conversation_read_states'
+    )
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_message_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['conversation', 'user']
+
+    def __str__(self):
+        return f"{self.user_id} @ conversation {self.conversation_id}: {self.unread_count} unread"
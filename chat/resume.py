@@ -0,0 +1,130 @@
+from functools import reduce
+from operator import or_
+from django.db.models import Q
+from .history import parse_message_id
+from .models import Conversation, ConversationReadState, Message
+from .serializers import MessageSerializer
+
+# =================================================================
+# RESUME - bắt kịp sau khi socket chat rớt / reconnect
+# =================================================================
+# Client gửi ngay sau connection_established:
+#   {"type": "resume", "last_message_id": 1234}                 (mốc chung)
+#   {"type": "resume", "conversations": {"12": 340, "15": 400}} (mốc từng conversation)
+#   (dùng cả 2: conversation không có trong map thì lấy mốc chung)
+# id tin nhắn tăng dần toàn hệ thống nên id lớn nhất đã thấy chính là
+# "sequence" của user, không cần cột riêng.
+#
+# Server trả:
+#   resume_messages     {"messages": [...]}  theo id tăng dần, mỗi lô <= RESUME_BATCH_SIZE
+#   resume_read_states  {"states": [{conversation_id, unread_count, read_by: {user_id: mốc}}]}
+#   resume_complete     {"last_message_id": ...}
+# hoặc resync_required nếu bỏ lỡ quá nhiều (> RESUME_MAX_MESSAGES tin hoặc
+# > RESUME_MAX_CONVERSATIONS conversation) -> client tải lại qua REST như cũ.
+# Tin mới đến trong lúc resume vẫn đi qua chat.new_message: client bỏ trùng theo id.
+
+RESUME_BATCH_SIZE = 100
+RESUME_MAX_MESSAGES = 1000
+RESUME_MAX_CONVERSATIONS = 100
+
+
+def parse_resume(data):
+    """
+    Returns:
+        (last_message_id | None, {conversation_id: mốc})
+    Raises:
+        InvalidMessageCursor
+    """
+    since = parse_message_id(data.get('last_message_id'))
+    cursors = {}
+    for conversation_id, message_id in (data.get('conversations') or {}).items():
+        conversation_id = parse_message_id(conversation_id)
+        if conversation_id is not None:
+            cursors[conversation_id] = parse_message_id(message_id) or 0
+    return since, cursors
+
+
+def plan_resume(user_id, since, cursors):
+    """
+    Các conversation (của user) có tin mới sau mốc.
+
+    Returns:
+        {conversation_id: mốc} hoặc None nếu quá RESUME_MAX_CONVERSATIONS
+    """
+    conversations = Conversation.objects.filter(participants=user_id, last_message__isnull=False)
+    if since is not None:
+        conversations = conversations.filter(Q(last_message_id__gt=since) | Q(id__in=list(cursors)))
+    else:
+        conversations = conversations.filter(id__in=list(cursors))
+
+    plan = {}
+    rows = conversations.order_by('-last_message_id').values_list('id', 'last_message_id')
+    # Dòng không thỏa chỉ có thể đến từ cursors -> đọc dư len(cursors) là đủ để biết có vượt giới hạn không
+    for conversation_id, last_message_id in rows[:RESUME_MAX_CONVERSATIONS + len(cursors) + 1]:
+        mark = cursors.get(conversation_id, since)
+        if last_message_id > mark:
+            plan[conversation_id] = mark
+            if len(plan) > RESUME_MAX_CONVERSATIONS:
+                return None
+    return plan
+
+
+def _missed(plan, after=0):
+    condition = reduce(or_, (Q(conversation_id=cid, id__gt=mark) for cid, mark in plan.items()))
+    return Message.objects.filter(condition, id__gt=after)
+
+
+def count_missed(plan, cap=RESUME_MAX_MESSAGES):
+    """Số tin bỏ lỡ, dừng đếm ở cap + 1"""
+    if not plan:
+        return 0
+    return len(_missed(plan).order_by('id').values_list('id', flat=True)[:cap + 1])
+
+
+def read_watermarks_for(conversation_ids):
+    """{conversation_id: {user_id: last_read_message_id}}"""
+    result = {cid: {} for cid in conversation_ids}
+    rows = ConversationReadState.objects.filter(conversation_id__in=conversation_ids).values_list(
+        'conversation_id', 'user_id', 'last_read_message_id'
+    )
+    for conversation_id, user_id, mark in rows:
+        result[conversation_id][user_id] = mark
+    return result
+
+
+def missed_batch(plan, after=0, watermarks=None, limit=RESUME_BATCH_SIZE):
+    """1 lô tin bỏ lỡ (id > after), đã serialize như REST"""
+    if not plan:
+        return []
+    messages = list(_missed(plan, after).select_related('sender').order_by('id')[:limit])
+    watermarks = watermarks or {}
+    return [
+        MessageSerializer(message, context={'read_watermarks': watermarks.get(message.conversation_id, {})}).data
+        for message in messages
+    ]
+
+
+def read_states(user_id, conversation_ids, watermarks=None):
+    """Số chưa đọc của user + mốc đọc của những người còn lại, theo conversation"""
+    if not conversation_ids:
+        return []
+    watermarks = watermarks or read_watermarks_for(conversation_ids)
+    unread = dict(
+        ConversationReadState.objects.filter(conversation_id__in=conversation_ids, user_id=user_id)
+        .values_list('conversation_id', 'unread_count')
+    )
+    return [
+        {
+            'conversation_id': cid,
+            'unread_count': unread.get(cid, 0),
+            'read_by': {uid: mark for uid, mark in watermarks.get(cid, {}).items() if uid != user_id},
+        }
+        for cid in conversation_ids
+    ]
+
+
+def recent_conversation_ids(user_id, limit=RESUME_MAX_CONVERSATIONS):
+    """Conversation gần đây nhất: mốc đọc của người kia có thể đã đổi dù không có tin mới"""
+    return list(
+        Conversation.objects.filter(participants=user_id).order_by('-updated_at').values_list('id', flat=True)[:limit]
+    )
@@ -53,6 +53,7 @@ class MessageSerializer(serializers.ModelSerializer):
     """Serializer cho Message"""
     sender = UserBasicSerializer(read_only=True)
     attachment = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
@@ -60,6 +61,16 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ['id', 'conversation', 'sender', 'text', 'attachment', 'created_at', 'is_read']
         read_only_fields = ['id', 'sender', 'created_at']
 
+    def get_is_read(self, obj):
+        """
+        Đã đọc = có người nhận với mốc đọc >= id tin (chat/inbox.py).
+        View truyền context['read_watermarks'] = {user_id: last_read_message_id}.
+        """
+        watermarks = self.context.get('read_watermarks')
+        if watermarks is None:
+            return obj.is_read
+        return any(mark >= obj.id for uid, mark in watermarks.items() if uid != obj.sender_id)
+
     def get_attachment(self, obj):
         """
         Trả về object { url: ..., type: ... } và FIX MỌI LỖI URL
@@ -122,10 +133,12 @@ class ConversationSerializer(serializers.ModelSerializer):
         fields = ['id', 'participants', 'last_message', 'unread_count', 'updated_at']
 
     def get_last_message(self, obj):
-     
-        last_msg = obj.messages.order_by('-created_at').first()
-        if last_msg:
-            return MessageSerializer(last_msg, context=self.context).data
+        # Con trỏ phi chuẩn hóa, view đã select_related('last_message__sender')
+        if obj.last_message_id:
+            # read_states đã prefetch trong view -> không thêm query
+            watermarks = {s.user_id: s.last_read_message_id for s in obj.read_states.all()}
+            context = {**self.context, 'read_watermarks': watermarks}
+            return MessageSerializer(obj.last_message, context=context).data
         return None
 
     def get_unread_count(self, obj):
@@ -136,7 +149,7 @@ class ConversationSerializer(serializers.ModelSerializer):
       
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-           
-            return obj.messages.filter(is_read=False).exclude(sender=request.user).count()
+            state = obj.read_states.filter(user=request.user).values_list('unread_count', flat=True).first()
+            return state or 0
             
         return 0
\ No newline at end of file
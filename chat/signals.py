@@ -0,0 +1,37 @@
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+from .inbox import notify_membership_changed
+from .models import Conversation
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Thêm / bớt / xóa hết thành viên -> mọi người liên quan (còn lại + vừa
+    thêm / bớt) bỏ cache quyền của conversation trong ChatConsumer.
+    """
+    if action == 'pre_clear':
+        # post_clear không có pk_set -> ghi lại trước khi xóa
+        if reverse:
+            instance._cleared_conversation_ids = list(instance.conversations.values_list('id', flat=True))
+        else:
+            instance._cleared_user_ids = list(instance.participants.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # user.conversations.add(...): instance là User, pk_set là conversation id
+        conversation_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_conversation_ids', [])
+        members = Conversation.participants.through.objects.filter(conversation_id__in=conversation_ids)
+        affected = {}
+        for conversation_id, user_id in members.values_list('conversation_id', 'user_id'):
+            affected.setdefault(conversation_id, {instance.pk}).add(user_id)
+        for conversation_id in conversation_ids:
+            notify_membership_changed(conversation_id, sorted(affected.get(conversation_id, {instance.pk})))
+        return
+
+    changed = pk_set if action != 'post_clear' else getattr(instance, '_cleared_user_ids', [])
+    user_ids = set(changed) | set(instance.participants.values_list('id', flat=True))
+    if user_ids:
+        notify_membership_changed(instance.pk, sorted(user_ids))
@@ -1,96 +1,394 @@
-from rest_framework import viewsets, permissions, status
-from rest_framework.decorators import action
-from rest_framework.response import Response
-from django.db.models import Q, Max
-from .models import Conversation, Message
-from .serializers import ConversationSerializer, MessageSerializer
-
-class ConversationViewSet(viewsets.ModelViewSet):
-    """API cho Conversations"""
-    serializer_class = ConversationSerializer
-    permission_classes = [permissions.IsAuthenticated]
-    
-    def get_queryset(self):
-        """Lấy danh sách cuộc trò chuyện của user hiện tại"""
-        return Conversation.objects.filter(
-            participants=self.request.user
-        ).prefetch_related('participants', 'messages')
-    
-    @action(detail=False, methods=['post'])
-    def get_or_create(self, request):
-        """Lấy hoặc tạo conversation với user khác"""
-        other_user_id = request.data.get('user_id')
-        
-        if not other_user_id:
-            return Response(
-                {'error': 'user_id is required'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Tìm conversation có 2 người này
-        conversation = Conversation.objects.filter(
-            participants=request.user
-        ).filter(
-            participants=other_user_id
-        ).annotate(
-            participant_count=models.Count('participants')
-        ).filter(
-            participant_count=2
-        ).first()
-        
-        if not conversation:
-            # Tạo mới
-            conversation = Conversation.objects.create()
-            conversation.participants.add(request.user, other_user_id)
-        
-        serializer = self.get_serializer(conversation)
-        return Response(serializer.data)
-
-
-class MessageViewSet(viewsets.ModelViewSet):
-    """API cho Messages"""
-    serializer_class = MessageSerializer
-    permission_classes = [permissions.IsAuthenticated]
-    
-    def get_queryset(self):
-        """Lấy tin nhắn của conversation"""
-        conversation_id = self.request.query_params.get('conversation')
-        
-        if conversation_id:
-            # Kiểm tra user có trong conversation không
-            conversation = Conversation.objects.filter(
-                id=conversation_id,
-                participants=self.request.user
-            ).first()
-            
-            if conversation:
-                return Message.objects.filter(
-                    conversation=conversation
-                ).select_related('sender')
-        
-        return Message.objects.none()
-    
-    def perform_create(self, serializer):
-        """Tạo tin nhắn mới"""
-        serializer.save(sender=self.request.user)
-    
-    @action(detail=False, methods=['post'])
-    def mark_as_read(self, request):
-        """Đánh dấu tin nhắn đã đọc"""
-        conversation_id = request.data.get('conversation_id')
-        
-        if not conversation_id:
-            return Response(
-                {'error': 'conversation_id is required'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Đánh dấu tất cả tin nhắn chưa đọc của conversation
-        Message.objects.filter(
-            conversation_id=conversation_id,
-            is_read=False
-        ).exclude(
-            sender=request.user
-        ).update(is_read=True)
-        
-        return Response({'status': 'marked as read'})
\ No newline at end of file
+from unittest import mock
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from core import jobqueue
+from core.jobs import group_send_many
+from .history import InvalidMessageCursor, message_window
+from .inbox import (
+    get_or_create_direct_conversation, mark_conversation_read, read_watermarks, rebuild_inbox, record_message,
+    save_message,
+)
+from .models import Conversation, ConversationReadState, Message
+from . import resume
+
+User = get_user_model()
+
+
+def make_user(name):
+    return User.objects.create_user(username=name, email=f"{name}@example.com")
+
+
+def send(conversation, sender, text="hi"):
+    return save_message(Message(conversation=conversation, sender=sender, text=text))
+
+
+def unread_of(conversation, user):
+    return ConversationReadState.objects.get(conversation=conversation, user=user).unread_count
+
+
+# =================================================================
+# INBOX - tin nhắn cuối + bộ đếm chưa đọc (chat/inbox.py)
+# =================================================================
+class InboxTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.conversation, _ = get_or_create_direct_conversation(self.alice.id, self.bob.id)
+
+    def test_new_message_updates_last_message_and_unread(self):
+        send(self.conversation, self.alice, "one")
+        last = send(self.conversation, self.alice, "two")
+        conversation = Conversation.objects.get(pk=self.conversation.pk)
+        self.assertEqual(conversation.last_message_id, last.id)
+        self.assertEqual(conversation.last_message_text, "two")
+        self.assertEqual(unread_of(self.conversation, self.bob), 2)
+        self.assertEqual(unread_of(self.conversation, self.alice), 0)
+
+    def test_attachment_only_snippet(self):
+        save_message(Message(conversation=self.conversation, sender=self.bob, text="", attachment="chat_attachments/x.png"))
+        self.assertEqual(Conversation.objects.get(pk=self.conversation.pk).last_message_text, "📎 Tệp đính kèm")
+
+    def test_last_message_never_moves_back(self):
+        # 2 tin gửi song song: tin id nhỏ hơn ghi inbox sau cùng không kéo last_message lùi lại
+        older = Message.objects.create(conversation=self.conversation, sender=self.bob, text="older")
+        newer = send(self.conversation, self.alice, "newer")
+        record_message(older)
+        self.assertEqual(Conversation.objects.get(pk=self.conversation.pk).last_message_id, newer.id)
+
+    def test_rebuild_fixes_drift(self):
+        send(self.conversation, self.alice)
+        last = send(self.conversation, self.bob, "latest")
+        Conversation.objects.filter(pk=self.conversation.pk).update(last_message=None, last_message_text="")
+        ConversationReadState.objects.filter(conversation=self.conversation).update(unread_count=9)
+
+        rebuild_inbox([self.conversation.id])
+        conversation = Conversation.objects.get(pk=self.conversation.pk)
+        self.assertEqual((conversation.last_message_id, conversation.last_message_text), (last.id, "latest"))
+        self.assertEqual(unread_of(self.conversation, self.alice), 1)
+        self.assertEqual(unread_of(self.conversation, self.bob), 1)
+
+    def test_conversation_list_is_one_query(self):
+        carol = make_user("carol")
+        other, _ = get_or_create_direct_conversation(self.alice.id, carol.id)
+        send(self.conversation, self.bob, "from bob")
+        send(other, carol, "from carol")
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        # conversations + prefetch participants + prefetch read_states
+        with self.assertNumQueries(3):
+            response = client.get("/api/chat/conversations/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+
+# =================================================================
+# LỊCH SỬ TIN NHẮN - keyset before / after / around (chat/history.py)
+# =================================================================
+class MessageHistoryTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.conversation, _ = get_or_create_direct_conversation(self.alice.id, self.bob.id)
+        self.ids = [send(self.conversation, self.alice, str(i)).id for i in range(10)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def window(self, **kwargs):
+        page = message_window(self.conversation.id, **kwargs)
+        return [m.id for m in page["results"]], page["has_more_before"], page["has_more_after"]
+
+    def test_latest_page(self):
+        self.assertEqual(self.window(limit=4), (self.ids[-4:], True, False))
+        self.assertEqual(self.window(limit=50), (self.ids, False, False))
+
+    def test_before(self):
+        self.assertEqual(self.window(before=self.ids[5], limit=3), (self.ids[2:5], True, True))
+        self.assertEqual(self.window(before=self.ids[2], limit=3), (self.ids[:2], False, True))
+
+    def test_after(self):
+        self.assertEqual(self.window(after=self.ids[2], limit=3), (self.ids[3:6], True, True))
+        self.assertEqual(self.window(after=self.ids[6], limit=5), (self.ids[7:], True, False))
+
+    def test_has_more_is_computed_at_the_edges(self):
+        # after trước tin đầu tiên: không còn tin cũ hơn
+        self.assertEqual(self.window(after=self.ids[0] - 1, limit=3), (self.ids[:3], False, True))
+        # before sau tin cuối: không còn tin mới hơn
+        self.assertEqual(self.window(before=self.ids[-1] + 1, limit=3), (self.ids[-3:], True, False))
+
+    def test_around(self):
+        ids, before, after = self.window(around=self.ids[5], limit=4)
+        self.assertIn(self.ids[5], ids)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(ids), 4)
+        self.assertTrue(before and after)
+
+    def test_endpoint_pages_and_validates(self):
+        url = f"/api/chat/conversations/{self.conversation.id}/messages/"
+        body = self.client.get(url, {"after": self.ids[7]}).json()
+        self.assertEqual([m["id"] for m in body["results"]], self.ids[8:])
+        self.assertTrue(body["has_more_before"])
+        self.assertFalse(body["has_more_after"])
+        self.assertEqual(self.client.get(url, {"before": "abc"}).status_code, 400)
+        # Kiểu cũ: list
+        self.assertEqual(len(self.client.get(url).json()), 10)
+
+    def test_endpoint_requires_membership(self):
+        self.client.force_authenticate(make_user("mallory"))
+        response = self.client.get(f"/api/chat/conversations/{self.conversation.id}/messages/")
+        self.assertEqual(response.status_code, 404)
+
+
+# =================================================================
+# CHAT 1:1 - khóa chuẩn (user_low, user_high), get-or-create an toàn khi song song
+# =================================================================
+class DirectConversationTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+
+    def test_same_conversation_from_both_sides(self):
+        first, created = get_or_create_direct_conversation(self.bob.id, self.alice.id)
+        second, created_again = get_or_create_direct_conversation(self.alice.id, self.bob.id)
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual((first.user_low_id, first.user_high_id), (self.alice.id, self.bob.id))
+        self.assertEqual(set(first.participants.values_list("id", flat=True)), {self.alice.id, self.bob.id})
+        self.assertEqual(ConversationReadState.objects.filter(conversation=first).count(), 2)
+
+    def test_losing_the_race_returns_the_winner(self):
+        winner, _ = get_or_create_direct_conversation(self.alice.id, self.bob.id)
+        # Request song song không thấy conversation ở lần đọc đầu -> insert đụng unique
+        with mock.patch("django.db.models.query.QuerySet.first", return_value=None):
+            conversation, created = get_or_create_direct_conversation(self.bob.id, self.alice.id)
+        self.assertFalse(created)
+        self.assertEqual(conversation.pk, winner.pk)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+
+# =================================================================
+# SOCKET CHAT (qua ASGI app thật: JWT middleware + routing)
+# =================================================================
+class ChatSocketTestCase(TransactionTestCase):
+    def setUp(self):
+        from doverx_backend.asgi import application
+        self.application = application
+        # Job (group_send, presence...) chạy ngay, không qua thread worker
+        for patcher in (
+            mock.patch.object(jobqueue, "_backend", jobqueue.EagerBackend()),
+            mock.patch("accounts.presence.ensure_heartbeat"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def open_socket(self, user, path="/ws/chat/"):
+        communicator = WebsocketCommunicator(self.application, f"{path}?token={AccessToken.for_user(user)}")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())["type"], "connection_established")
+        return communicator
+
+    async def send_text(self, communicator, conversation, text):
+        await communicator.send_json_to({"type": "send_message", "conversation_id": conversation.id, "text": text})
+
+
+# =================================================================
+# CACHE QUYỀN THEO SOCKET (ChatConsumer.get_peer_ids, chat/signals.py)
+# =================================================================
+class MembershipSignalTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.carol = make_user("carol")
+        self.conversation = Conversation.objects.create()
+
+    def notified(self, change):
+        with mock.patch.object(group_send_many, "delay") as delay:
+            change()
+        items = delay.call_args.args[0]
+        self.assertTrue(all(event == {"type": "chat.membership_changed", "conversation_id": self.conversation.id}
+                            for _, event in items))
+        return {group for group, _ in items}
+
+    def test_add_and_remove_notify_members_and_affected_users(self):
+        self.assertEqual(self.notified(lambda: self.conversation.participants.add(self.alice, self.bob)),
+                         {f"user_{self.alice.id}", f"user_{self.bob.id}"})
+        self.assertEqual(self.notified(lambda: self.conversation.participants.remove(self.bob)),
+                         {f"user_{self.alice.id}", f"user_{self.bob.id}"})
+
+    def test_reverse_side_and_clear(self):
+        self.conversation.participants.add(self.alice)
+        self.assertEqual(self.notified(lambda: self.carol.conversations.add(self.conversation)),
+                         {f"user_{self.alice.id}", f"user_{self.carol.id}"})
+        self.assertEqual(self.notified(lambda: self.conversation.participants.clear()),
+                         {f"user_{self.alice.id}", f"user_{self.carol.id}"})
+
+
+class MembershipCacheSocketTests(ChatSocketTestCase):
+    async def test_added_member_is_not_locked_out_and_removed_member_is(self):
+        alice, carol = await database_sync_to_async(lambda: (make_user("alice"), make_user("carol")))()
+        conversation = await database_sync_to_async(Conversation.objects.create)()
+        await database_sync_to_async(conversation.participants.add)(alice)
+        socket = await self.open_socket(carol)
+
+        # Chưa là thành viên: bị bỏ qua, kết quả "không có quyền" không được cache
+        await self.send_text(socket, conversation, "1")
+        self.assertTrue(await socket.receive_nothing())
+
+        # Ghi thẳng bảng M2M (không có m2m_changed): lần gửi sau vẫn phải đọc lại quyền
+        await database_sync_to_async(Conversation.participants.through.objects.create)(
+            conversation=conversation, user=carol
+        )
+        await self.send_text(socket, conversation, "2")
+        self.assertEqual((await socket.receive_json_from())["type"], "message_sent")
+
+        # Bị xóa khỏi conversation: event membership_changed bỏ quyền đang cache
+        await database_sync_to_async(conversation.participants.remove)(carol)
+        self.assertTrue(await socket.receive_nothing())
+        await self.send_text(socket, conversation, "3")
+        self.assertTrue(await socket.receive_nothing())
+        self.assertEqual(await database_sync_to_async(Message.objects.filter(conversation=conversation).count)(), 1)
+        await socket.disconnect()
+
+
+# =================================================================
+# MỐC ĐÃ ĐỌC (ConversationReadState.last_read_message_id)
+# =================================================================
+class ReadWatermarkTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.conversation, _ = get_or_create_direct_conversation(self.alice.id, self.bob.id)
+        self.ids = [send(self.conversation, self.alice, str(i)).id for i in range(5)]
+
+    def test_read_all(self):
+        self.assertEqual(mark_conversation_read(self.conversation.id, self.bob), self.ids[-1])
+        self.assertEqual(unread_of(self.conversation, self.bob), 0)
+
+    def test_read_up_to_recounts_unread(self):
+        send(self.conversation, self.bob, "reply")
+        self.assertEqual(mark_conversation_read(self.conversation.id, self.bob, up_to=self.ids[1]), self.ids[1])
+        self.assertEqual(unread_of(self.conversation, self.bob), 3)
+
+    def test_watermark_only_moves_forward_and_is_clamped(self):
+        mark_conversation_read(self.conversation.id, self.bob, up_to=self.ids[3])
+        self.assertEqual(mark_conversation_read(self.conversation.id, self.bob, up_to=self.ids[0]), self.ids[3])
+        # Client gửi id chưa tồn tại -> chặn ở tin cuối, tin đến sau vẫn là chưa đọc
+        self.assertEqual(mark_conversation_read(self.conversation.id, self.bob, up_to=10 ** 9), self.ids[-1])
+        send(self.conversation, self.alice, "later")
+        self.assertEqual(unread_of(self.conversation, self.bob), 1)
+
+    def test_non_member(self):
+        self.assertIsNone(mark_conversation_read(self.conversation.id, make_user("mallory"), up_to=self.ids[0]))
+
+    def test_seen_flag_derives_from_recipient_watermark(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        response = client.post("/api/chat/messages/read_sync/", {"conversation_id": self.conversation.id, "message_id": self.ids[2]})
+        self.assertEqual(response.json()["last_read_message_id"], self.ids[2])
+        self.assertEqual(read_watermarks(self.conversation.id), {self.alice.id: 0, self.bob.id: self.ids[2]})
+
+        client.force_authenticate(self.alice)
+        messages = client.get(f"/api/chat/conversations/{self.conversation.id}/messages/").json()
+        self.assertEqual([m["is_read"] for m in messages], [True, True, True, False, False])
+
+
+class ReadWatermarkSocketTests(ChatSocketTestCase):
+    async def test_mark_read_broadcasts_watermark_to_peer(self):
+        alice, bob = await database_sync_to_async(lambda: (make_user("alice"), make_user("bob")))()
+        conversation, _ = await database_sync_to_async(get_or_create_direct_conversation)(alice.id, bob.id)
+        message = await database_sync_to_async(send)(conversation, alice)
+        alice_socket = await self.open_socket(alice)
+        bob_socket = await self.open_socket(bob)
+
+        await bob_socket.send_json_to({"type": "mark_read", "conversation_id": conversation.id})
+        event = await alice_socket.receive_json_from()
+        self.assertEqual(event["type"], "chat.messages_read")
+        self.assertEqual((event["user_id"], event["last_read_message_id"]), (bob.id, message.id))
+        self.assertTrue(await bob_socket.receive_nothing())
+        await alice_socket.disconnect()
+        await bob_socket.disconnect()
+
+
+# =================================================================
+# RESUME - bắt kịp sau khi socket reconnect (chat/resume.py)
+# =================================================================
+class ResumePlanTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.carol = make_user("carol")
+        self.with_bob, _ = get_or_create_direct_conversation(self.alice.id, self.bob.id)
+        self.with_carol, _ = get_or_create_direct_conversation(self.alice.id, self.carol.id)
+        self.seen = send(self.with_bob, self.bob, "seen").id
+        self.missed = [send(self.with_bob, self.bob, "b").id, send(self.with_carol, self.carol, "c").id]
+
+    def test_global_mark(self):
+        plan = resume.plan_resume(self.alice.id, self.seen, {})
+        self.assertEqual(plan, {self.with_bob.id: self.seen, self.with_carol.id: self.seen})
+        self.assertEqual(resume.count_missed(plan), 2)
+        self.assertEqual([m["id"] for m in resume.missed_batch(plan)], self.missed)
+
+    def test_per_conversation_marks_override_global(self):
+        plan = resume.plan_resume(self.alice.id, self.seen, {self.with_carol.id: self.missed[1]})
+        self.assertEqual(plan, {self.with_bob.id: self.seen})
+
+    def test_other_users_conversations_are_excluded(self):
+        mallory = make_user("mallory")
+        self.assertEqual(resume.plan_resume(mallory.id, 0, {self.with_bob.id: 0}), {})
+
+    def test_batches_continue_after_last_id(self):
+        plan = resume.plan_resume(self.alice.id, 0, {})
+        first = resume.missed_batch(plan, limit=2)
+        rest = resume.missed_batch(plan, after=first[-1]["id"], limit=2)
+        self.assertEqual([m["id"] for m in first + rest], [self.seen] + self.missed)
+
+    def test_too_many_conversations(self):
+        with mock.patch.object(resume, "RESUME_MAX_CONVERSATIONS", 1):
+            self.assertIsNone(resume.plan_resume(self.alice.id, 0, {}))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidMessageCursor):
+            resume.parse_resume({"last_message_id": "x"})
+
+
+class ResumeSocketTests(ChatSocketTestCase):
+    def seed(self):
+        alice, bob = make_user("alice"), make_user("bob")
+        conversation, _ = get_or_create_direct_conversation(alice.id, bob.id)
+        seen = send(conversation, bob, "seen").id
+        missed = [send(conversation, bob, str(i)).id for i in range(3)]
+        mark_conversation_read(conversation.id, bob)
+        return alice, conversation, seen, missed
+
+    async def test_replays_missed_messages_then_read_states(self):
+        alice, conversation, seen, missed = await database_sync_to_async(self.seed)()
+        socket = await self.open_socket(alice)
+        await socket.send_json_to({"type": "resume", "last_message_id": seen})
+        batch = await socket.receive_json_from()
+        states = await socket.receive_json_from()
+        complete = await socket.receive_json_from()
+
+        self.assertEqual(batch["type"], "resume_messages")
+        self.assertEqual([m["id"] for m in batch["messages"]], missed)
+        # Số chưa đọc của mình + mốc đọc của người kia
+        self.assertEqual(states["type"], "resume_read_states")
+        state = states["states"][0]
+        self.assertEqual((state["conversation_id"], state["unread_count"]), (conversation.id, 4))
+        self.assertEqual(list(state["read_by"].values()), [missed[-1]])
+        self.assertEqual(complete, {"type": "resume_complete", "last_message_id": missed[-1]})
+        await socket.disconnect()
+
+    async def test_resync_when_too_far_behind_or_invalid(self):
+        alice, _, _, _ = await database_sync_to_async(self.seed)()
+        socket = await self.open_socket(alice)
+        with mock.patch.object(resume, "RESUME_MAX_MESSAGES", 2):
+            await socket.send_json_to({"type": "resume", "last_message_id": 0})
+            self.assertEqual(await socket.receive_json_from(), {"type": "resync_required", "reason": "too_far_behind"})
+        await socket.send_json_to({"type": "resume", "last_message_id": "abc"})
+        self.assertEqual(await socket.receive_json_from(), {"type": "resync_required", "reason": "invalid_cursor"})
+        await socket.disconnect()
@@ -3,16 +3,18 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.db.models import Q, Max, Count
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.db import models
 from django.core.files.storage import default_storage
 import cloudinary
 import cloudinary.uploader
-from .models import Conversation, Message
+from .models import Conversation, ConversationReadState, Message
+from .inbox import get_or_create_direct_conversation, mark_conversation_read, read_watermarks
+from . import history
 from .serializers import ConversationSerializer, MessageSerializer
 from accounts.models import User
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -21,14 +23,18 @@ def get_conversations(request):
     Lấy danh sách conversations và đếm số tin nhắn chưa đọc chính xác.
     """
     try:
+        # Tin nhắn cuối + số chưa đọc đã được tính sẵn (chat/inbox.py)
+        unread = ConversationReadState.objects.filter(
+            conversation=OuterRef('pk'),
+            user=request.user
+        ).values('unread_count')[:1]
         conversations = Conversation.objects.filter(
             participants=request.user
         ).annotate(
-            unread_count=Count(
-                'messages',
-                filter=Q(messages__is_read=False) & ~Q(messages__sender=request.user)
-            )
-        ).prefetch_related('participants').order_by('-updated_at')
+            unread_count=Coalesce(Subquery(unread), 0)
+        ).select_related(
+            'last_message__sender'
+        ).prefetch_related('participants', 'read_states').order_by('-updated_at')
         
         serializer = ConversationSerializer(
             conversations, 
@@ -69,42 +75,20 @@ def get_conversation_with_user(request, user_id):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    print(f"🔍 [get_conversation_with_user] Looking for conversation")
-    print(f"   Current user: {request.user.username} (ID: {request.user.id})")
-    print(f"   Other user: {other_user.username} (ID: {other_user.id})")
-    
-    #  đúng để tìm conversation
-    # Tìm conversation có CẢ 2 user và chỉ có 2 user
-    conversations = Conversation.objects.filter(
-        participants=request.user
-    ).filter(
-        participants=other_user
-    )
-    
-    conversation = Conversation.objects.annotate(
-    count=Count('participants')
-    ).filter(
-    count=2
-    ).filter(
-    participants=request.user
-    ).filter(
-        participants=other_user
-    ).first()
- 
-    # ✅ CHỈ TẠO MỚI NẾU CHƯA CÓ
-    if not conversation:
-        print(f"⚠️ [get_conversation_with_user] NO EXISTING CONVERSATION FOUND!")
-        print(f"⚠️ Creating NEW conversation between {request.user.username} and {other_user.username}")
-        
-        conversation = Conversation.objects.create()
-        conversation.participants.add(request.user, other_user)
-        conversation.save()
-        
+    if other_user.id == request.user.id:
+        return Response(
+            {'error': 'Cannot start a conversation with yourself'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # 1 lần probe index unique (user_low, user_high), an toàn khi gọi song song
+    conversation, created = get_or_create_direct_conversation(request.user.id, other_user.id)
+    if created:
         print(f"✅ [get_conversation_with_user] Created conversation {conversation.id}")
-    else:
-        print(f"✅ [get_conversation_with_user] Found EXISTING conversation {conversation.id}")
-        print(f"   Participants: {[p.username for p in conversation.participants.all()]}")
-    
+
+    conversation = Conversation.objects.select_related(
+        'last_message__sender'
+    ).prefetch_related('participants', 'read_states').get(pk=conversation.pk)
     serializer = ConversationSerializer(conversation, context={'request': request})
     return Response(serializer.data)
 
@@ -116,6 +100,13 @@ def get_messages(request, conversation_id):
     Lấy danh sách tin nhắn trong conversation
     
     GET /api/chat/conversations/<conversation_id>/messages/
+        ?before=<id>  tin cũ hơn (cuộn lên)
+        ?after=<id>   tin mới hơn
+        ?around=<id>  cửa sổ quanh 1 tin (nhảy tới tin nhắn)
+        &limit=50
+    -> {"results": [...], "has_more_before": bool, "has_more_after": bool}
+
+    Không có before/after/around: trả về list như cũ (hỗ trợ ?offset=).
     """
     try:
         print(f"📩 [get_messages] User {request.user.id} requesting messages for conversation {conversation_id}")
@@ -134,17 +125,51 @@ def get_messages(request, conversation_id):
             )
         
         # Lấy tin nhắn
-        limit = int(request.GET.get('limit', 50))
+        try:
+            limit = int(request.GET.get('limit', history.DEFAULT_PAGE_SIZE))
+        except ValueError:
+            limit = history.DEFAULT_PAGE_SIZE
+
+        if any(k in request.GET for k in ('before', 'after', 'around')):
+            # Keyset theo id (chat/history.py) - không chậm dần khi cuộn sâu
+            try:
+                page = history.message_window(
+                    conversation_id,
+                    before=history.parse_message_id(request.GET.get('before')),
+                    after=history.parse_message_id(request.GET.get('after')),
+                    around=history.parse_message_id(request.GET.get('around')),
+                    limit=limit
+                )
+            except history.InvalidMessageCursor:
+                return Response({'error': 'Invalid message id'}, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = MessageSerializer(page['results'], many=True, context={
+                'request': request,
+                'read_watermarks': read_watermarks(conversation_id)
+            })
+            return Response({
+                'results': serializer.data,
+                'has_more_before': page['has_more_before'],
+                'has_more_after': page['has_more_after'],
+            })
+
+        # Kiểu cũ (offset/limit) - giữ cho client chưa chuyển sang before/after
         offset = int(request.GET.get('offset', 0))
+        limit = max(1, min(limit, history.MAX_PAGE_SIZE))
+
+        if offset:
+            messages = Message.objects.filter(
+                conversation_id=conversation_id
+            ).select_related('sender').order_by('-id')[offset:offset+limit]
+            # Đảo ngược để tin nhắn cũ nhất ở trên
+            messages = list(reversed(messages))
+        else:
+            messages = history.message_window(conversation_id, limit=limit)['results']
         
-        messages = Message.objects.filter(
-            conversation_id=conversation_id
-        ).select_related('sender').order_by('-created_at')[offset:offset+limit]
-        
-        # Đảo ngược để tin nhắn cũ nhất ở trên
-        messages = list(reversed(messages))
-        
-        serializer = MessageSerializer(messages, many=True, context={'request': request})
+        serializer = MessageSerializer(messages, many=True, context={
+            'request': request,
+            'read_watermarks': read_watermarks(conversation_id)
+        })
         
         print(f"✅ [get_messages] Returning {len(messages)} messages")
         return Response(serializer.data)
@@ -162,7 +187,10 @@ def get_messages(request, conversation_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_messages_as_read(request):
-    """Đánh dấu tin nhắn là đã đọc (Backend Persistence)"""
+    """
+    Đánh dấu đã đọc (dời mốc đọc, chat/inbox.py)
+    body: {"conversation_id": 1, "message_id": 123 (tùy chọn, mặc định: tin cuối)}
+    """
     conversation_id = request.data.get('conversation_id')
     
     if not conversation_id:
@@ -171,9 +199,15 @@ def mark_messages_as_read(request):
     #  FIX QUAN TRỌNG: Đảm bảo conversation_id là số nguyên hợp lệ
     try:
         conversation_id = int(conversation_id)
-    except ValueError:
+    except (TypeError, ValueError):
          return Response({'error': 'Invalid conversation_id format'}, status=status.HTTP_400_BAD_REQUEST)
 
+    try:
+        up_to = request.data.get('message_id')
+        up_to = int(up_to) if up_to is not None else None
+    except (TypeError, ValueError):
+        return Response({'error': 'Invalid message_id'}, status=status.HTTP_400_BAD_REQUEST)
+
     try:
         # Kiểm tra user có quyền truy cập conversation không
         conversation = Conversation.objects.filter(
@@ -184,15 +218,12 @@ def mark_messages_as_read(request):
         if not conversation:
              return Response({'error': 'Conversation not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Update Database: Đánh dấu tất cả tin nhắn từ người khác là đã đọc
-        marked_count = Message.objects.filter(
-            conversation_id=conversation_id,
-            is_read=False
-        ).exclude(sender=request.user).update(is_read=True)
+        # Chỉ dời mốc đọc của user (1 dòng), không UPDATE từng tin nhắn
+        watermark = mark_conversation_read(conversation_id, request.user, up_to=up_to)
         
-        print(f"✅ MARKED READ: Conversation {conversation_id}. Count: {marked_count}")
+        print(f"✅ MARKED READ: Conversation {conversation_id}. Up to: {watermark}")
         
-        return Response({'success': True, 'marked_count': marked_count})
+        return Response({'success': True, 'last_read_message_id': watermark})
         
     except Exception as e:
         print(f"❌ Error during mark_messages_as_read: {e}")
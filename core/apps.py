@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'core'
+
+    def ready(self):
+        # Nạp <app>/jobs.py của mọi app để đăng ký job vào registry
+        from django.utils.module_loading import autodiscover_modules
+        autodiscover_modules('jobs')
+
+        from .jobqueue import check_config
+        check_config()
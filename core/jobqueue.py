@@ -0,0 +1,300 @@
+import json
+import queue
+import random
+import threading
+import time
+import traceback
+import uuid
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from . import metrics
+from .redis_client import get_redis
+
+# =================================================================
+# JOB QUEUE - chạy side effect (socket, email...) SAU commit, ngoài request
+# =================================================================
+# Khai báo job trong <app>/jobs.py:
+#
+#     @job("social.push_notifications")
+#     def push_notifications(payloads): ...
+#
+# Gọi:   push_notifications.delay(payloads)   -> enqueue khi transaction commit
+#        push_notifications.delay_in(10, payloads) -> như trên nhưng chạy sau 10 giây
+#
+# Backend (settings.JOB_QUEUE["BACKEND"]):
+#   - "eager": chạy ngay trong thread hiện tại (test / debug)
+#   - "local": thread worker trong cùng process (dev, không có Redis)
+#   - "redis": đẩy vào Redis list, chạy bằng `python manage.py runjobs`
+#
+# Tham số job phải serialize được sang JSON (truyền id, không truyền object).
+# Mọi backend đều nhận args đã qua JSON (DjangoJSONEncoder) như Redis: datetime
+# -> chuỗi, tuple -> list... nên job chạy giống nhau ở dev và production.
+
+JOB_REGISTRY = {}
+
+QUEUE_KEY = "doverx:jobs:queue"
+DELAYED_KEY = "doverx:jobs:delayed"
+DEAD_KEY = "doverx:jobs:dead"
+STATS_KEY = "doverx:jobs:stats"
+
+
+def _config(key, default=None):
+    return getattr(settings, "JOB_QUEUE", {}).get(key, default)
+
+
+class Job:
+    def __init__(self, name, func, max_retries=None, backoff=None):
+        self.name = name
+        self.func = func
+        self.max_retries = max_retries if max_retries is not None else _config("MAX_RETRIES", 3)
+        self.backoff = backoff if backoff is not None else _config("BACKOFF_SECONDS", 2)
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def _message(self, args, kwargs):
+        # Round-trip JSON ngay lúc gọi: tham số không serialize được báo lỗi tại chỗ gọi
+        payload = json.loads(json.dumps({"args": list(args), "kwargs": kwargs}, cls=DjangoJSONEncoder))
+        return {
+            "id": uuid.uuid4().hex,
+            "name": self.name,
+            "args": payload["args"],
+            "kwargs": payload["kwargs"],
+            "attempts": 0,
+            "enqueued_at": time.time(),
+        }
+
+    def delay(self, *args, **kwargs):
+        """Enqueue khi transaction hiện tại commit (chạy ngay nếu không ở trong transaction)"""
+        message = self._message(args, kwargs)
+        transaction.on_commit(lambda: enqueue(message))
+        return message["id"]
+
+    def delay_in(self, seconds, *args, **kwargs):
+        """Như delay() nhưng job chỉ chạy sau `seconds` giây kể từ lúc commit"""
+        message = self._message(args, kwargs)
+        transaction.on_commit(lambda: enqueue(message, seconds))
+        return message["id"]
+
+
+def enqueue(message, delay=None):
+    """
+    Đẩy message vào backend (gọi trong on_commit). Backend lỗi (vd. Redis
+    mất kết nối) -> log rồi chạy job ngay tại chỗ thay vì để lỗi lọt vào
+    request đã commit.
+    """
+    try:
+        if delay is None:
+            get_backend().push(message)
+        else:
+            get_backend().schedule(message, delay)
+        return
+    except Exception as e:
+        print(f"❌ [jobs] Enqueue {message['name']} failed, running inline: {e}")
+        metrics.incr("jobs.enqueue_failures")
+    job_obj = JOB_REGISTRY.get(message["name"])
+    if job_obj is None:
+        return
+    try:
+        job_obj(*message["args"], **message["kwargs"])
+    except Exception as e:
+        # Không có queue để hẹn retry -> bỏ job
+        print(f"❌ [jobs] Inline {message['name']} failed, dropped: {e}")
+        metrics.incr(f"job.{message['name']}.dead")
+
+
+def job(name, max_retries=None, backoff=None):
+    def decorator(func):
+        registered = Job(name, func, max_retries=max_retries, backoff=backoff)
+        JOB_REGISTRY[name] = registered
+        return registered
+    return decorator
+
+
+def retry_delay(job_obj, attempts):
+    """
+    Backoff lũy thừa: backoff, 2*backoff, 4*backoff... (giây), chặn ở MAX_BACKOFF_SECONDS,
+    jitter 50-100% để các job lỗi cùng lúc không retry dồn 1 thời điểm.
+    """
+    delay = min(float(job_obj.backoff) * 2 ** (attempts - 1), float(_config("MAX_BACKOFF_SECONDS", 300)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_message(message):
+    """
+    Chạy 1 job message.
+
+    Returns:
+        None nếu thành công / bỏ qua, hoặc (message, delay_seconds) nếu cần retry
+        (None kèm dead-letter khi đã hết lượt retry).
+    """
+    job_obj = JOB_REGISTRY.get(message["name"])
+    if job_obj is None:
+        print(f"❌ [jobs] Unknown job: {message['name']}")
+        metrics.incr("jobs.unknown")
+        return None
+
+    name = message["name"]
+    close_old_connections()
+    start = time.perf_counter()
+    try:
+        job_obj(*message.get("args", []), **message.get("kwargs", {}))
+    except Exception as e:
+        metrics.incr(f"job.{name}.failures")
+        message["attempts"] = message.get("attempts", 0) + 1
+        message["last_error"] = str(e)
+        if message["attempts"] <= job_obj.max_retries:
+            delay = retry_delay(job_obj, message["attempts"])
+            print(f"⚠️ [jobs] {name} failed (attempt {message['attempts']}), retry in {delay:.1f}s: {e}")
+            metrics.incr(f"job.{name}.retries")
+            return message, delay
+        print(f"❌ [jobs] {name} gave up after {message['attempts']} attempts: {e}")
+        traceback.print_exc()
+        metrics.incr(f"job.{name}.dead")
+        get_backend().dead_letter(message)
+        return None
+    finally:
+        metrics.observe(f"job.{name}.duration", time.perf_counter() - start)
+        close_old_connections()
+
+    latency = time.time() - message.get("enqueued_at", time.time())
+    metrics.incr(f"job.{name}.succeeded")
+    metrics.observe(f"job.{name}.latency", latency)
+    get_backend().record(name, latency)
+    return None
+
+
+# =================================================================
+# BACKENDS
+# =================================================================
+class EagerBackend:
+    """Chạy ngay, retry liền (không sleep) - dùng cho test"""
+
+    def push(self, message):
+        while True:
+            result = run_message(message)
+            if result is None:
+                return
+            message = result[0]
+
+    def schedule(self, message, delay):
+        # Test / debug: không chờ
+        self.push(message)
+
+    def dead_letter(self, message):
+        pass
+
+    def record(self, name, latency):
+        pass
+
+
+class LocalBackend:
+    """Thread worker trong process hiện tại (mất job nếu process chết)"""
+
+    def __init__(self, workers=1):
+        self.queue = queue.Queue()
+        self.dead = []
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"jobs-worker-{i}", daemon=True).start()
+
+    def push(self, message):
+        self.queue.put(message)
+
+    def schedule(self, message, delay):
+        timer = threading.Timer(delay, self.push, args=[message])
+        timer.daemon = True
+        timer.start()
+
+    def _work(self):
+        while True:
+            message = self.queue.get()
+            try:
+                result = run_message(message)
+                if result is not None:
+                    self.schedule(*result)
+            except Exception as e:
+                print(f"❌ [jobs] Worker error: {e}")
+            finally:
+                self.queue.task_done()
+
+    def dead_letter(self, message):
+        self.dead = (self.dead + [message])[-100:]
+
+    def record(self, name, latency):
+        pass
+
+
+class RedisBackend:
+    """Redis list + sorted set cho job trễ / retry; worker: `manage.py runjobs`"""
+
+    def __init__(self):
+        self.redis = get_redis()
+
+    def push(self, message):
+        self.redis.lpush(QUEUE_KEY, json.dumps(message, cls=DjangoJSONEncoder))
+
+    def schedule(self, message, delay):
+        self.redis.zadd(DELAYED_KEY, {json.dumps(message, cls=DjangoJSONEncoder): time.time() + delay})
+
+    def promote_due(self):
+        """Chuyển các job trễ / retry đã tới hạn từ sorted set sang queue chính"""
+        now = time.time()
+        for raw in self.redis.zrangebyscore(DELAYED_KEY, 0, now, start=0, num=100):
+            # zrem trả 1 cho đúng 1 worker -> không bị chạy trùng khi có nhiều worker
+            if self.redis.zrem(DELAYED_KEY, raw):
+                self.redis.lpush(QUEUE_KEY, raw)
+
+    def pop(self, timeout=1):
+        item = self.redis.brpop(QUEUE_KEY, timeout=timeout)
+        return json.loads(item[1]) if item else None
+
+    def dead_letter(self, message):
+        self.redis.lpush(DEAD_KEY, json.dumps(message, cls=DjangoJSONEncoder))
+        self.redis.ltrim(DEAD_KEY, 0, 999)
+        self.redis.hincrby(STATS_KEY, f"{message['name']}:dead", 1)
+
+    def record(self, name, latency):
+        pipe = self.redis.pipeline()
+        pipe.hincrby(STATS_KEY, f"{name}:succeeded", 1)
+        pipe.hincrbyfloat(STATS_KEY, f"{name}:latency_total", latency)
+        pipe.execute()
+
+    def stats(self):
+        return {
+            "queued": self.redis.llen(QUEUE_KEY),
+            "delayed": self.redis.zcard(DELAYED_KEY),
+            "dead": self.redis.llen(DEAD_KEY),
+            "jobs": self.redis.hgetall(STATS_KEY),
+        }
+
+
+BACKENDS = ("eager", "local", "redis")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def check_config():
+    """Gọi lúc khởi động (CoreConfig.ready): cấu hình sai thì báo lỗi ngay, không âm thầm mất job"""
+    name = _config("BACKEND", "local")
+    if name not in BACKENDS:
+        raise ImproperlyConfigured(f"JOB_QUEUE BACKEND={name!r} không hợp lệ (chọn 1 trong {', '.join(BACKENDS)})")
+    if name == "redis" and not getattr(settings, "REDIS_URL", None):
+        raise ImproperlyConfigured("JOB_QUEUE_BACKEND=redis cần REDIS_URL")
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = _config("BACKEND", "local")
+                if name == "eager":
+                    _backend = EagerBackend()
+                elif name == "redis":
+                    _backend = RedisBackend()
+                else:
+                    _backend = LocalBackend(workers=_config("LOCAL_WORKERS", 1))
+    return _backend
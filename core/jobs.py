@@ -0,0 +1,21 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .jobqueue import job
+
+
+@job("core.group_send")
+def group_send(group, message):
+    """Gửi 1 event tới group của channel layer (chạy ngoài request)"""
+    async_to_sync(get_channel_layer().group_send)(group, message)
+
+
+@job("core.group_send_many")
+def group_send_many(items):
+    """items: [[group, message], ...] - gửi cả lô trong 1 lần vào event loop"""
+    channel_layer = get_channel_layer()
+
+    async def _send_all():
+        for group, message in items:
+            await channel_layer.group_send(group, message)
+
+    async_to_sync(_send_all)()
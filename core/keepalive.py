@@ -0,0 +1,123 @@
+import asyncio
+import json
+from . import metrics
+
+# =================================================================
+# KEEPALIVE WHEEL - 1 task / process thay vì 1 task ping / socket
+# =================================================================
+# - Socket được chia đều vào PING_INTERVAL / TICK ô (slot). Mỗi TICK giây
+#   wheel xử lý đúng 1 ô -> mỗi socket được xét 1 lần / PING_INTERVAL,
+#   ping rải đều theo thời gian (không dồn cục theo lúc connect).
+# - Chỉ ping socket "rảnh": không gửi gì trong nửa chu kỳ vừa qua
+#   (feed_update, notification... đã giữ kết nối sống rồi).
+# - Phát hiện peer chết: client từng trả lời ping ({"type": "pong"}) mà
+#   im lặng quá IDLE_TIMEOUT giây thì đóng. Client cũ không trả lời ping
+#   chỉ được ping, không bị đóng.
+# - Consumer dùng KeepaliveMixin để tự đăng ký và đóng dấu thời gian gửi/nhận.
+
+PING_INTERVAL = 30
+TICK = 1
+IDLE_TIMEOUT = 90
+CLOSE_CODE = 4008
+
+
+class KeepaliveWheel:
+    def __init__(self, interval=PING_INTERVAL, tick=TICK, idle_timeout=IDLE_TIMEOUT):
+        self.interval = interval
+        self.tick = tick
+        self.idle_timeout = idle_timeout
+        self.slots = [dict() for _ in range(max(1, int(interval / tick)))]
+        self._where = {}   # channel_name -> slot index
+        self._next_slot = 0
+        self._cursor = 0
+        self._task = None
+
+    def __len__(self):
+        return len(self._where)
+
+    def register(self, consumer):
+        index = self._next_slot
+        self._next_slot = (self._next_slot + 1) % len(self.slots)
+        self.slots[index][consumer.channel_name] = consumer
+        self._where[consumer.channel_name] = index
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def unregister(self, consumer):
+        index = self._where.pop(consumer.channel_name, None)
+        if index is not None:
+            self.slots[index].pop(consumer.channel_name, None)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while self._where:
+            next_tick += self.tick
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            try:
+                await self.process_slot(self._cursor, loop.time())
+            except Exception as e:
+                print(f"❌ [keepalive] Error: {e}")
+            self._cursor = (self._cursor + 1) % len(self.slots)
+
+    async def process_slot(self, index, now):
+        pinged = closed = 0
+        for consumer in list(self.slots[index].values()):
+            if consumer.keepalive_replies and now - consumer.keepalive_received > self.idle_timeout:
+                self.unregister(consumer)
+                closed += 1
+                try:
+                    await consumer.close(code=CLOSE_CODE)
+                except Exception:
+                    pass
+            elif now - consumer.keepalive_sent >= self.interval / 2:
+                # Ô này quay lại sau đúng 1 interval -> khoảng lặng tối đa 1.5 x interval
+                pinged += 1
+                try:
+                    await consumer.send(text_data=json.dumps({'type': 'ping', 'timestamp': str(now)}))
+                except Exception:
+                    self.unregister(consumer)
+        if pinged:
+            metrics.incr("ws.keepalive_ping", pinged)
+        if closed:
+            metrics.incr("ws.keepalive_closed", closed)
+        return pinged, closed
+
+
+_wheels = {}
+
+
+def get_wheel():
+    """1 wheel cho mỗi event loop"""
+    loop = asyncio.get_running_loop()
+    wheel = _wheels.get(loop)
+    if wheel is None:
+        wheel = _wheels[loop] = KeepaliveWheel()
+    return wheel
+
+
+class KeepaliveMixin:
+    """
+    Trộn vào AsyncWebsocketConsumer: gọi start_keepalive() sau accept(),
+    stop_keepalive() trong disconnect().
+    """
+
+    keepalive_sent = 0.0
+    keepalive_received = 0.0
+    keepalive_replies = False
+
+    def start_keepalive(self):
+        now = asyncio.get_running_loop().time()
+        self.keepalive_sent = self.keepalive_received = now
+        get_wheel().register(self)
+
+    def stop_keepalive(self):
+        get_wheel().unregister(self)
+
+    async def send(self, *args, **kwargs):
+        self.keepalive_sent = asyncio.get_running_loop().time()
+        await super().send(*args, **kwargs)
+
+    async def websocket_receive(self, message):
+        self.keepalive_received = asyncio.get_running_loop().time()
+        await super().websocket_receive(message)
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import time
+import tracemalloc
+from collections import Counter
+from django.core.management.base import BaseCommand
+from core.keepalive import KeepaliveWheel
+
+
+class FakeSocket:
+    """Đủ thuộc tính cho KeepaliveWheel, send() chỉ đếm"""
+
+    def __init__(self, index, loop, log):
+        self.channel_name = f"bench.{index}"
+        self.keepalive_sent = self.keepalive_received = loop.time()
+        self.keepalive_replies = False
+        self._log = log
+
+    async def send(self, text_data=None, bytes_data=None):
+        self._log.append(time.monotonic())
+
+    async def close(self, code=None):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "So sánh keepalive cũ (1 task sleep + ping mỗi socket) với keepalive wheel "
+        "(1 task / process): bộ nhớ, CPU và độ dồn cục của ping"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sockets", type=int, default=50_000)
+        parser.add_argument("--interval", type=float, default=3.0,
+                            help="Chu kỳ ping (giây) - rút ngắn từ 30s để chạy nhanh")
+        parser.add_argument("--duration", type=float, default=9.0)
+        parser.add_argument("--connect-burst", type=float, default=0.2,
+                            help="Các socket cùng connect trong khoảng này (mô phỏng reconnect sau deploy)")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"🫀 {options['sockets']:,} sockets, ping every {options['interval']}s, "
+            f"run {options['duration']}s"
+        )
+        for label, runner in (("per-socket tasks", self._per_socket), ("keepalive wheel", self._wheel)):
+            result = asyncio.run(runner(options))
+            self._report(label, result, options)
+
+    async def _per_socket(self, options):
+        """Cách cũ: FeedConsumer.send_periodic_ping cho từng socket"""
+        log = []
+        loop = asyncio.get_running_loop()
+
+        async def ping_loop(sock):
+            while True:
+                await asyncio.sleep(options["interval"])
+                await sock.send(text_data=json.dumps({"type": "ping", "timestamp": str(loop.time())}))
+
+        tracemalloc.start()
+        sockets, tasks = [], []
+        for i in range(options["sockets"]):
+            sock = FakeSocket(i, loop, log)
+            sockets.append(sock)
+            tasks.append(loop.create_task(ping_loop(sock)))
+            if i % 1000 == 0:
+                await asyncio.sleep(options["connect_burst"] * 1000 / options["sockets"])
+        memory = tracemalloc.get_traced_memory()[0]
+
+        cpu0, t0 = time.process_time(), time.monotonic()
+        await asyncio.sleep(options["duration"])
+        cpu = time.process_time() - cpu0
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        tracemalloc.stop()
+        return memory, cpu, [ts - t0 for ts in log if ts >= t0]
+
+    async def _wheel(self, options):
+        log = []
+        loop = asyncio.get_running_loop()
+        wheel = KeepaliveWheel(interval=options["interval"], tick=options["interval"] / 30)
+
+        tracemalloc.start()
+        sockets = []
+        for i in range(options["sockets"]):
+            sock = FakeSocket(i, loop, log)
+            sockets.append(sock)
+            wheel.register(sock)
+            if i % 1000 == 0:
+                await asyncio.sleep(options["connect_burst"] * 1000 / options["sockets"])
+        memory = tracemalloc.get_traced_memory()[0]
+
+        cpu0, t0 = time.process_time(), time.monotonic()
+        await asyncio.sleep(options["duration"])
+        cpu = time.process_time() - cpu0
+        for sock in sockets:
+            wheel.unregister(sock)
+        tracemalloc.stop()
+        return memory, cpu, [ts - t0 for ts in log if ts >= t0]
+
+    def _report(self, label, result, options):
+        memory, cpu, pings = result
+        buckets = Counter(int(ts * 10) for ts in pings)  # cửa sổ 100ms
+        peak = max(buckets.values()) if buckets else 0
+        self.stdout.write(
+            f"\n📊 {label}\n"
+            f"   memory      : {memory / 1024 / 1024:8.1f} MiB ({memory / options['sockets']:.0f} B/socket)\n"
+            f"   CPU         : {cpu:8.2f}s over {options['duration']}s\n"
+            f"   pings       : {len(pings):,}\n"
+            f"   peak / 100ms: {peak:,} pings"
+        )
@@ -0,0 +1,327 @@
+import asyncio
+import random
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from core import jobqueue
+from core.metrics import percentile
+
+User = get_user_model()
+
+DEFAULT_MIX = "send_message=50,typing=25,post_react=15,mark_read=10"
+
+
+class QueryCounter:
+    """execute_wrapper đếm mọi query, gắn vào từng connection DB khi được mở"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def attach(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self):
+        connection_created.connect(self.attach, dispatch_uid="loadtest_ws_query_counter")
+        for conn in connections.all(initialized_only=True):
+            self.attach(connection=conn)
+
+    def uninstall(self):
+        connection_created.disconnect(dispatch_uid="loadtest_ws_query_counter")
+        for conn in connections.all(initialized_only=True):
+            if self in conn.execute_wrappers:
+                conn.execute_wrappers.remove(self)
+
+
+class StreamView:
+    """
+    1 stream trên socket ws/stream/, dùng như socket cũ: bọc / tháo
+    {"stream": ..., "payload": ...}, bỏ qua frame của stream kia
+    """
+
+    def __init__(self, comm, stream):
+        self.comm = comm
+        self.stream = stream
+
+    @property
+    def output_queue(self):
+        return self.comm.output_queue
+
+    async def send_json_to(self, data):
+        await self.comm.send_json_to({"stream": self.stream, "payload": data})
+
+    async def receive_json_from(self, timeout=1):
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            frame = await self.comm.receive_json_from(timeout=remaining)
+            if frame.get("stream") == self.stream:
+                return frame["payload"]
+
+
+class Client:
+    """1 user giả: 1 socket ws/feed/ + 1 socket ws/chat/, hoặc 1 socket ws/stream/ (--multiplex)"""
+
+    def __init__(self, user_id, token):
+        self.user_id = user_id
+        self.token = token
+        self.feed = None
+        self.chat = None
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test websocket: chạy doverx_backend.asgi.application trong process "
+        "(test DB + InMemoryChannelLayer), mở N socket đã xác thực tới ws/feed/ và ws/chat/, "
+        "đo thời gian connect, độ trễ p50/p99, bộ nhớ / socket và số query / sự kiện"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200, help="Mỗi user mở 2 socket (feed + chat)")
+        parser.add_argument("--multiplex", action="store_true",
+                            help="Mỗi user mở 1 socket ws/stream/ (feed + chat multiplex)")
+        parser.add_argument("--events", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--mix", default=DEFAULT_MIX, help="Tỉ lệ loại sự kiện, vd. " + DEFAULT_MIX)
+        parser.add_argument("--timeout", type=float, default=5.0, help="Giây chờ mỗi lần giao nhận")
+        parser.add_argument("--keepdb", action="store_true", help="Giữ lại test DB giữa các lần chạy")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        mix = self._parse_mix(options["mix"])
+        users = max(2, options["users"] - options["users"] % 2)
+
+        with override_settings(
+            CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+            JOB_QUEUE={"BACKEND": "eager", "MAX_RETRIES": 0},
+            REDIS_URL=None,
+        ):
+            # Job chạy ngay trong event loop hiện tại (InMemoryChannelLayer không dùng chung được giữa các loop)
+            jobqueue._backend = None
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+            counter = QueryCounter()
+            counter.install()
+            try:
+                asyncio.run(self._run(users, mix, counter, options))
+            finally:
+                counter.uninstall()
+                jobqueue._backend = None
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+
+    def _parse_mix(self, value):
+        mix = {}
+        for part in value.split(","):
+            name, _, weight = part.partition("=")
+            mix[name.strip()] = float(weight or 1)
+        unknown = set(mix) - {"send_message", "typing", "post_react", "mark_read"}
+        if unknown:
+            raise ValueError(f"Unknown event types: {', '.join(sorted(unknown))}")
+        return mix
+
+    # ==================== SEED ====================
+
+    def _seed(self, count):
+        from accounts.serializers import CustomTokenObtainPairSerializer
+        from chat.inbox import get_or_create_direct_conversation
+        from social.models import Post
+
+        run_id = int(time.time())
+        User.objects.bulk_create([
+            User(username=f"lt_{run_id}_{i}", email=f"lt_{run_id}_{i}@example.invalid",
+                 first_name="Load", last_name=f"Test {i}", password="!")
+            for i in range(count)
+        ])
+        users = list(User.objects.filter(username__startswith=f"lt_{run_id}_").order_by("id"))
+        clients = [
+            Client(u.id, str(CustomTokenObtainPairSerializer.get_token(u).access_token))
+            for u in users
+        ]
+        pairs = []
+        for a, b in zip(users[0::2], users[1::2]):
+            conversation, _ = get_or_create_direct_conversation(a.id, b.id)
+            post = Post.objects.create(author=a, content_text="load test", visibility="public")
+            pairs.append((conversation.id, post.id))
+        return clients, pairs
+
+    # ==================== RUN ====================
+
+    async def _run(self, users, mix, counter, options):
+        from doverx_backend.asgi import application
+
+        clients, pair_targets = await database_sync_to_async(self._seed)(users)
+        sockets_per_user = 1 if options["multiplex"] else 2
+        self.stdout.write(f"🧪 {len(clients)} users / {len(clients) * sockets_per_user} sockets, {options['events']} events, "
+                          f"concurrency {options['concurrency']}")
+
+        tracemalloc.start()
+        mem_before = tracemalloc.get_traced_memory()[0]
+        connect_latencies = []
+        semaphore = asyncio.Semaphore(options["concurrency"])
+
+        async def open_socket(path, token, greetings=1):
+            async with semaphore:
+                comm = WebsocketCommunicator(application, f"{path}?token={token}")
+                t0 = time.perf_counter()
+                connected, _ = await comm.connect(timeout=options["timeout"])
+                if not connected:
+                    raise RuntimeError(f"Connect to {path} rejected")
+                for _ in range(greetings):
+                    await comm.receive_json_from(timeout=options["timeout"])  # connection_established
+                connect_latencies.append(time.perf_counter() - t0)
+                return comm
+
+        t0 = time.perf_counter()
+        if options["multiplex"]:
+            # Mỗi stream gửi 1 connection_established
+            sockets = await asyncio.gather(*[open_socket("/ws/stream/", c.token, greetings=2) for c in clients])
+            feeds = [StreamView(comm, "feed") for comm in sockets]
+            chats = [StreamView(comm, "chat") for comm in sockets]
+        else:
+            sockets = await asyncio.gather(*[open_socket("/ws/feed/", c.token) for c in clients])
+            feeds = sockets
+            chats = await asyncio.gather(*[open_socket("/ws/chat/", c.token) for c in clients])
+            sockets = sockets + chats
+        connect_wall = time.perf_counter() - t0
+        for client, feed, chat in zip(clients, feeds, chats):
+            client.feed, client.chat = feed, chat
+        mem_per_socket = (tracemalloc.get_traced_memory()[0] - mem_before) / len(sockets)
+        tracemalloc.stop()
+
+        pairs = []
+        for (a, b), (conversation_id, post_id) in zip(zip(clients[0::2], clients[1::2]), pair_targets):
+            for client in (a, b):
+                await client.feed.send_json_to({"type": "subscribe", "posts": [post_id]})
+            pairs.append((a, b, conversation_id, post_id))
+
+        kinds = list(mix)
+        weights = [mix[k] for k in kinds]
+        events = [(random.choice(range(len(pairs))), random.choices(kinds, weights)[0]) for _ in range(options["events"])]
+
+        # Mỗi worker giữ 1 nhóm cặp riêng -> mỗi cặp chỉ có 1 sự kiện đang chạy, khỏi nhầm message
+        worker_count = max(1, min(options["concurrency"], len(pairs)))
+        queues = defaultdict(list)
+        for pair_index, kind in events:
+            queues[pair_index % worker_count].append((pair_index, kind))
+
+        results = defaultdict(lambda: {"latency": [], "queries": [], "timeouts": 0})
+        seq = iter(range(1, len(events) + 1))
+
+        async def worker(items):
+            for pair_index, kind in items:
+                a, b, conversation_id, post_id = pairs[pair_index]
+                if random.random() < 0.5:
+                    a, b = b, a
+                q0 = counter.count
+                try:
+                    latency = await self._event(kind, a, b, conversation_id, post_id, next(seq), options["timeout"])
+                except asyncio.TimeoutError:
+                    results[kind]["timeouts"] += 1
+                    continue
+                results[kind]["latency"].append(latency)
+                results[kind]["queries"].append(counter.count - q0)
+                for comm in (a.feed, a.chat, b.feed, b.chat):
+                    self._drain(comm)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*[worker(queues[i]) for i in range(worker_count)])
+        run_wall = time.perf_counter() - t0
+
+        for comm in sockets:
+            await comm.disconnect()
+
+        self._report(connect_latencies, connect_wall, mem_per_socket, results, run_wall, worker_count)
+
+    async def _event(self, kind, a, b, conversation_id, post_id, seq, timeout):
+        """Gửi 1 sự kiện từ a, chờ b nhận được. Returns độ trễ (giây)"""
+        t0 = time.perf_counter()
+        if kind == "send_message":
+            marker = f"loadtest #{seq}"
+            await a.chat.send_json_to({"type": "send_message", "conversation_id": conversation_id, "text": marker})
+            await self._expect(b.chat, timeout, lambda m: m.get("type") == "new_message"
+                               and m["message"]["text"] == marker)
+
+        elif kind == "typing":
+            await a.chat.send_json_to({"type": "typing", "conversation_id": conversation_id, "is_typing": True})
+            await self._expect(b.chat, timeout, lambda m: m.get("type") == "typing_batch"
+                               and any(t["user_id"] == a.user_id for t in m["typing"]))
+            latency = time.perf_counter() - t0
+            # Ngừng gõ để lần sau không bị throttle (không tính giờ)
+            await a.chat.send_json_to({"type": "typing", "conversation_id": conversation_id, "is_typing": False})
+            await self._expect(b.chat, timeout, lambda m: m.get("type") == "typing_batch"
+                               and a.user_id in m["stopped"])
+            return latency
+
+        elif kind == "post_react":
+            await a.feed.send_json_to({"type": "post_react", "post_id": post_id,
+                                       "reaction_type": random.choice(["like", "love", "haha"])})
+            await self._expect(b.feed, timeout, lambda m: m.get("type") == "feed_update"
+                               and m["data"].get("event") == "post_react"
+                               and m["data"].get("user_id") == a.user_id)
+
+        elif kind == "mark_read":
+            await b.chat.send_json_to({"type": "mark_read", "conversation_id": conversation_id})
+            await self._expect(a.chat, timeout, lambda m: m.get("type") == "chat.messages_read"
+                               and m.get("user_id") == b.user_id)
+
+        return time.perf_counter() - t0
+
+    async def _expect(self, comm, timeout, predicate):
+        """Đọc tới khi gặp message thỏa predicate (bỏ qua ping, presence...)"""
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            message = await comm.receive_json_from(timeout=remaining)
+            if predicate(message):
+                return message
+
+    def _drain(self, comm):
+        while not comm.output_queue.empty():
+            comm.output_queue.get_nowait()
+
+    # ==================== REPORT ====================
+
+    def _report(self, connect_latencies, connect_wall, mem_per_socket, results, run_wall, worker_count):
+        def ms(value):
+            return f"{value * 1000:8.2f}ms" if value is not None else "     n/a"
+
+        self.stdout.write(
+            f"\n🔌 connect  : {len(connect_latencies)} sockets in {connect_wall:.2f}s  "
+            f"p50={ms(percentile(connect_latencies, 50))}  p99={ms(percentile(connect_latencies, 99))}"
+        )
+        self.stdout.write(f"🧠 memory   : {mem_per_socket / 1024:.1f} KiB / socket (tracemalloc)")
+
+        total = sum(len(r["latency"]) for r in results.values())
+        self.stdout.write(f"📨 delivered: {total} events in {run_wall:.2f}s ({total / max(run_wall, 1e-9):.0f}/s)\n")
+        for kind, r in sorted(results.items()):
+            queries = sum(r["queries"]) / len(r["queries"]) if r["queries"] else 0
+            self.stdout.write(
+                f"   {kind:<13} n={len(r['latency']):<6} p50={ms(percentile(r['latency'], 50))}  "
+                f"p99={ms(percentile(r['latency'], 99))}  queries/event={queries:5.1f}  timeouts={r['timeouts']}"
+            )
+        if worker_count > 1:
+            self.stdout.write("   (queries/event là xấp xỉ khi --concurrency > 1: query của sự kiện chạy song song bị tính lẫn)")
+        timeouts = sum(r["timeouts"] for r in results.values())
+        if timeouts:
+            self.stdout.write(self.style.WARNING(f"⚠️ {timeouts} events timed out"))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Done (test DB destroyed)"))
@@ -0,0 +1,48 @@
+import signal
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core import metrics
+from core.jobqueue import JOB_REGISTRY, RedisBackend, get_backend, run_message
+
+
+class Command(BaseCommand):
+    help = "Chạy worker xử lý job queue (backend redis)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stats-every", type=int, default=60,
+                            help="In thống kê latency/failure mỗi N giây (0 = tắt)")
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if not isinstance(backend, RedisBackend):
+            raise CommandError("runjobs chỉ dùng với JOB_QUEUE_BACKEND=redis (local/eager tự chạy trong process)")
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(f"🚀 Job worker started ({len(JOB_REGISTRY)} jobs: {', '.join(sorted(JOB_REGISTRY))})")
+        stats_every = options["stats_every"]
+        last_stats = time.time()
+        while self.running:
+            backend.promote_due()
+            message = backend.pop(timeout=1)
+            if message is not None:
+                result = run_message(message)
+                if result is not None:
+                    backend.schedule(*result)
+
+            if stats_every and time.time() - last_stats >= stats_every:
+                self._print_stats()
+                last_stats = time.time()
+
+        self.stdout.write("👋 Job worker stopped")
+
+    def _stop(self, *args):
+        self.running = False
+
+    def _print_stats(self):
+        timings = metrics.snapshot()["timings_ms"]
+        for name, t in sorted(timings.items()):
+            if name.endswith(".latency"):
+                self.stdout.write(f"📊 {name}: n={t['count']} p50={t['p50']}ms p99={t['p99']}ms")
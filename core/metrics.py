@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import defaultdict, deque
+
+# =================================================================
+# METRICS TRONG PROCESS (counter / timing / rate)
+# =================================================================
+# Đủ nhẹ để gọi trên mọi request/socket. Xem qua GET /api/metrics/ (admin).
+
+RATE_WINDOW_SECONDS = 60
+TIMING_SAMPLES = 1000
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = defaultdict(lambda: deque(maxlen=TIMING_SAMPLES))
+_rates = defaultdict(lambda: deque(maxlen=RATE_WINDOW_SECONDS))
+
+
+def incr(name, value=1):
+    """Tăng counter và ghi vào cửa sổ tính rate (theo từng giây)"""
+    now = int(time.time())
+    with _lock:
+        _counters[name] += value
+        buckets = _rates[name]
+        if buckets and buckets[-1][0] == now:
+            buckets[-1][1] += value
+        else:
+            buckets.append([now, value])
+
+
+def observe(name, seconds):
+    """Ghi 1 mẫu thời gian (giây)"""
+    with _lock:
+        _timings[name].append(seconds)
+
+
+class timer:
+    """with metrics.timer("job.x.duration"): ..."""
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def rate(name, window=RATE_WINDOW_SECONDS):
+    """Số sự kiện / giây trung bình trong `window` giây gần nhất"""
+    cutoff = int(time.time()) - window
+    with _lock:
+        total = sum(v for ts, v in _rates.get(name, ()) if ts > cutoff)
+    return total / float(window)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        timings = {name: list(samples) for name, samples in _timings.items()}
+        rate_names = list(_rates.keys())
+    return {
+        'counters': counters,
+        'rates_per_sec': {name: round(rate(name), 3) for name in rate_names},
+        'timings_ms': {
+            name: {
+                'count': len(samples),
+                'p50': round(percentile(samples, 50) * 1000, 2),
+                'p99': round(percentile(samples, 99) * 1000, 2),
+                'max': round(max(samples) * 1000, 2),
+            }
+            for name, samples in timings.items() if samples
+        },
+    }
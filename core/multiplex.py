@@ -0,0 +1,134 @@
+import json
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.consumer import get_handler_name
+from django.contrib.auth.models import AnonymousUser
+from . import metrics
+
+# =================================================================
+# MULTIPLEX - nhiều "stream" (feed, chat...) trên 1 websocket
+# =================================================================
+# Client -> server:  {"stream": "chat", "payload": {...message cũ...}}
+# Server -> client:  {"stream": "chat", "payload": {...message cũ...}}
+#
+# - Mỗi stream là 1 consumer cũ (FeedStream, ChatStream) chạy bên trong
+#   MultiplexConsumer, dùng chung channel_name -> user_{id} chỉ có 1 thành
+#   viên cho mỗi tab, mỗi event cá nhân chỉ được giao 1 lần.
+# - Event từ channel layer được chuyển cho đúng stream theo `routes` /
+#   `prefix_routes` (khai báo tường minh, không đoán), không khớp thì bỏ qua.
+# - Stream gửi ra qua base_send của nó -> được bọc tag stream ở đây.
+# - Route cũ ws/feed/ + ws/chat/ (2 socket / tab) chỉ còn là shim, xem
+#   LegacyEndpointMixin và doverx_backend/routing.py.
+
+
+class Substream:
+    """Trộn trước 1 consumer để nó chạy bên trong MultiplexConsumer"""
+
+    def __init__(self, multiplexer, stream_name):
+        super().__init__()
+        self.multiplexer = multiplexer
+        self.stream_name = stream_name
+        self.scope = multiplexer.scope
+        self.channel_layer = multiplexer.channel_layer
+        self.channel_name = multiplexer.channel_name
+        self.base_send = self._relay
+
+    async def _relay(self, message):
+        await self.multiplexer.relay(self.stream_name, message)
+
+
+class LegacyEndpointMixin:
+    """
+    DEPRECATED - consumer chạy trực tiếp ở route cũ (ws/feed/, ws/chat/).
+
+    2 socket cũ cùng join user_{id} nên mỗi socket nhận cả event dành cho
+    socket kia: event có tên handler trong `foreign_events` hoặc bắt đầu bằng
+    `foreign_prefixes` bị bỏ qua (thay cho các handler no-op). Trong StreamConsumer, stream không đi qua dispatch/websocket_connect
+    nên mixin không có tác dụng. Số kết nối cũ: metric ws.legacy.<legacy_name>.
+    """
+    legacy_name = ""
+    foreign_events = frozenset()
+    foreign_prefixes = ()
+
+    async def websocket_connect(self, message):
+        metrics.incr(f"ws.legacy.{self.legacy_name}")
+        await super().websocket_connect(message)
+
+    async def dispatch(self, message):
+        handler = get_handler_name(message)
+        if handler in self.foreign_events or handler.startswith(self.foreign_prefixes):
+            return
+        await super().dispatch(message)
+
+
+class MultiplexConsumer(AsyncWebsocketConsumer):
+    # {"feed": FeedStream, ...}
+    streams = {}
+    # handler name -> stream, vd. {"presence_update": "chat"}
+    routes = {}
+    # (prefix, stream), xét theo thứ tự, vd. [("feed_", "feed")]
+    prefix_routes = []
+
+    async def connect(self):
+        user = self.scope.get("user", AnonymousUser())
+        if not user.is_authenticated:
+            await self.close(code=4001)
+            return
+
+        await self.accept()
+        self.active_streams = {}
+        for name, stream_class in self.streams.items():
+            stream = stream_class(self, name)
+            self.active_streams[name] = stream
+            await stream.connect()
+
+    async def disconnect(self, close_code):
+        for stream in getattr(self, "active_streams", {}).values():
+            try:
+                await stream.disconnect(close_code)
+            except Exception as e:
+                print(f"❌ [multiplex] {stream.stream_name} disconnect error: {e}")
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data)
+        except (TypeError, ValueError):
+            return
+        stream = self.active_streams.get(data.get("stream")) if isinstance(data, dict) else None
+        if stream is None:
+            return
+        await stream.websocket_receive({"type": "websocket.receive", "text": json.dumps(data.get("payload") or {})})
+
+    async def relay(self, stream_name, message):
+        """ASGI message do 1 stream gửi ra"""
+        message_type = message["type"]
+        if message_type == "websocket.send":
+            if message.get("text") is not None:
+                # payload đã là JSON -> ghép chuỗi, không parse lại
+                await self.send(text_data=f'{{"stream":"{stream_name}","payload":{message["text"]}}}')
+            elif message.get("bytes") is not None:
+                await self.send(bytes_data=message["bytes"])
+        elif message_type == "websocket.close":
+            await self.close(code=message.get("code"))
+        # websocket.accept: socket chung đã accept rồi
+
+    def route(self, message):
+        handler = get_handler_name(message)
+        name = self.routes.get(handler)
+        if name is None:
+            for prefix, stream_name in self.prefix_routes:
+                if handler.startswith(prefix):
+                    name = stream_name
+                    break
+        if callable(name):
+            name = name(message)
+        return getattr(self, "active_streams", {}).get(name)
+
+    async def dispatch(self, message):
+        if message["type"].startswith("websocket."):
+            return await super().dispatch(message)
+        stream = self.route(message)
+        if stream is None:
+            return
+        handler = getattr(stream, get_handler_name(message), None)
+        if handler is not None:
+            await handler(message)
@@ -0,0 +1,12 @@
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    """Redis client dùng chung cho cả process (None nếu chưa cấu hình REDIS_URL)"""
+    global _client
+    if _client is None and settings.REDIS_URL:
+        _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
@@ -0,0 +1,248 @@
+import datetime
+import importlib
+from unittest import mock
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from chat.inbox import get_or_create_direct_conversation
+from . import jobqueue, metrics
+from .jobqueue import EagerBackend, job, retry_delay, run_message
+
+User = get_user_model()
+
+calls = []
+
+
+@job("tests.flaky", max_retries=2, backoff=2)
+def flaky(fail_times, value):
+    calls.append(value)
+    if len(calls) <= fail_times:
+        raise RuntimeError("boom")
+
+
+@job("tests.echo")
+def echo(value):
+    calls.append(value)
+
+
+# =================================================================
+# JOB QUEUE (core/jobqueue.py)
+# =================================================================
+class RetryDelayTests(SimpleTestCase):
+    def test_exponential_backoff(self):
+        with mock.patch("core.jobqueue.random.uniform", return_value=1.0):
+            self.assertEqual([retry_delay(flaky, n) for n in (1, 2, 3, 4)], [2, 4, 8, 16])
+
+    @override_settings(JOB_QUEUE={"MAX_BACKOFF_SECONDS": 10})
+    def test_cap_and_jitter(self):
+        with mock.patch("core.jobqueue.random.uniform", return_value=1.0):
+            self.assertEqual(retry_delay(flaky, 20), 10)
+        with mock.patch("core.jobqueue.random.uniform", return_value=0.5):
+            self.assertEqual(retry_delay(flaky, 20), 5)
+        for _ in range(50):
+            self.assertTrue(1 <= retry_delay(flaky, 1) <= 2)
+
+
+class RunMessageTests(SimpleTestCase):
+    def setUp(self):
+        calls.clear()
+        self.backend = mock.Mock()
+        patcher = mock.patch("core.jobqueue.get_backend", return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failure_schedules_retry_then_dead_letters(self):
+        message = flaky._message((5, "x"), {})
+        for attempt in (1, 2):
+            message, delay = run_message(message)
+            self.assertEqual(message["attempts"], attempt)
+            self.assertEqual(message["last_error"], "boom")
+            self.assertGreater(delay, 0)
+        self.assertIsNone(run_message(message))
+        self.backend.dead_letter.assert_called_once_with(message)
+        self.assertEqual(len(calls), 3)
+
+    def test_success_is_recorded(self):
+        self.assertIsNone(run_message(echo._message(("ok",), {})))
+        self.backend.record.assert_called_once()
+        self.assertEqual(calls, ["ok"])
+
+    def test_unknown_job_is_skipped(self):
+        self.assertIsNone(run_message({"name": "tests.missing", "args": [], "kwargs": {}}))
+
+
+class EnqueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+        patcher = mock.patch.object(jobqueue, "_backend", EagerBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_delay_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            echo.delay("later")
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, ["later"])
+
+    def test_args_round_trip_through_json(self):
+        when = datetime.datetime(2024, 1, 2, 3, 4, 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            echo.delay({"at": when, "ids": (1, 2)})
+        self.assertEqual(calls, [{"at": "2024-01-02T03:04:05", "ids": [1, 2]}])
+
+    def test_unserializable_args_fail_at_call_site(self):
+        with self.assertRaises(TypeError):
+            echo.delay(object())
+
+    def test_eager_backend_retries_until_success(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            flaky.delay(2, "y")
+        self.assertEqual(calls, ["y", "y", "y"])
+
+    def test_backend_failure_falls_back_to_inline(self):
+        broken = mock.Mock()
+        broken.push.side_effect = ConnectionError("redis down")
+        broken.schedule.side_effect = ConnectionError("redis down")
+        with mock.patch.object(jobqueue, "_backend", broken):
+            with self.captureOnCommitCallbacks(execute=True):
+                echo.delay("now")
+                echo.delay_in(30, "soon")
+        self.assertEqual(calls, ["now", "soon"])
+
+    def test_inline_failure_is_dropped(self):
+        broken = mock.Mock()
+        broken.push.side_effect = ConnectionError("redis down")
+        with mock.patch.object(jobqueue, "_backend", broken):
+            # Job lỗi khi chạy inline: không lọt exception ra request đã commit
+            with self.captureOnCommitCallbacks(execute=True):
+                flaky.delay(1, "z")
+        self.assertEqual(calls, ["z"])
+
+
+class CheckConfigTests(SimpleTestCase):
+    @override_settings(JOB_QUEUE={"BACKEND": "celery"})
+    def test_unknown_backend(self):
+        with self.assertRaises(ImproperlyConfigured):
+            jobqueue.check_config()
+
+    @override_settings(JOB_QUEUE={"BACKEND": "redis"}, REDIS_URL=None)
+    def test_redis_requires_url(self):
+        with self.assertRaises(ImproperlyConfigured):
+            jobqueue.check_config()
+
+    @override_settings(JOB_QUEUE={})
+    def test_default_is_local(self):
+        jobqueue.check_config()
+
+
+# =================================================================
+# WEBSOCKET ROUTING + MULTIPLEX (doverx_backend/routing.py, core/multiplex.py)
+# =================================================================
+class StreamRoutingTests(TransactionTestCase):
+    def setUp(self):
+        from doverx_backend.asgi import application
+        self.application = application
+        for patcher in (
+            mock.patch.object(jobqueue, "_backend", EagerBackend()),
+            mock.patch("accounts.presence.ensure_heartbeat"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_user(self, name):
+        return User.objects.create_user(username=name, email=f"{name}@example.com")
+
+    async def open_socket(self, user, path="/ws/stream/", greetings=2):
+        communicator = WebsocketCommunicator(self.application, f"{path}?token={AccessToken.for_user(user)}")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        for _ in range(greetings):
+            greeting = await communicator.receive_json_from()
+            self.assertEqual(greeting.get("payload", greeting)["type"], "connection_established")
+        return communicator
+
+    async def group_send(self, user, event):
+        await get_channel_layer().group_send(f"user_{user.id}", event)
+
+    async def test_stream_socket_delivers_each_event_once_to_its_stream(self):
+        alice, bob = await database_sync_to_async(lambda: (self.make_user("alice"), self.make_user("bob")))()
+        conversation, _ = await database_sync_to_async(get_or_create_direct_conversation)(alice.id, bob.id)
+        alice_socket = await self.open_socket(alice)
+        bob_socket = await self.open_socket(bob)
+
+        await alice_socket.send_json_to({"stream": "chat", "payload": {
+            "type": "send_message", "conversation_id": conversation.id, "text": "hi"
+        }})
+        sent = await alice_socket.receive_json_from()
+        self.assertEqual((sent["stream"], sent["payload"]["type"]), ("chat", "message_sent"))
+        received = await bob_socket.receive_json_from()
+        self.assertEqual((received["stream"], received["payload"]["type"]), ("chat", "new_message"))
+
+        await self.group_send(bob, {"type": "feed.notification", "data": {"id": 1}})
+        notification = await bob_socket.receive_json_from()
+        self.assertEqual((notification["stream"], notification["payload"]["type"]), ("feed", "notification"))
+
+        await self.group_send(bob, {"type": "presence.update", "user_id": alice.id, "online": False})
+        presence = await bob_socket.receive_json_from()
+        self.assertEqual((presence["stream"], presence["payload"]["type"]), ("chat", "presence_update"))
+
+        # Không stream nào nhận trùng, event không có route bị bỏ qua
+        await self.group_send(bob, {"type": "unknown.event"})
+        self.assertTrue(await bob_socket.receive_nothing())
+        await alice_socket.disconnect()
+        await bob_socket.disconnect()
+
+    async def test_payload_to_unknown_stream_is_ignored(self):
+        alice = await database_sync_to_async(self.make_user)("alice")
+        socket = await self.open_socket(alice)
+        await socket.send_json_to({"stream": "nope", "payload": {"type": "ping"}})
+        await socket.send_to(text_data="not json")
+        self.assertTrue(await socket.receive_nothing())
+        await socket.send_json_to({"stream": "chat", "payload": {"type": "ping"}})
+        self.assertEqual(await socket.receive_json_from(), {"stream": "chat", "payload": {"type": "pong"}})
+        await socket.disconnect()
+
+    async def test_anonymous_is_rejected(self):
+        communicator = WebsocketCommunicator(self.application, "/ws/stream/")
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4001)
+
+    async def test_legacy_sockets_skip_each_others_events(self):
+        alice = await database_sync_to_async(self.make_user)("alice")
+        before = metrics.snapshot()["counters"].get("ws.legacy.feed", 0)
+        feed = await self.open_socket(alice, "/ws/feed/", greetings=1)
+        chat = await self.open_socket(alice, "/ws/chat/", greetings=1)
+        self.assertEqual(metrics.snapshot()["counters"]["ws.legacy.feed"], before + 1)
+
+        await self.group_send(alice, {"type": "feed.notification", "data": {"id": 1}})
+        self.assertEqual((await feed.receive_json_from())["type"], "notification")
+        self.assertTrue(await chat.receive_nothing())
+
+        await self.group_send(alice, {"type": "chat.new_message", "message": {"id": 1}})
+        self.assertEqual((await chat.receive_json_from())["type"], "new_message")
+        await self.group_send(alice, {"type": "presence.update", "user_id": 1, "online": True})
+        self.assertEqual((await chat.receive_json_from())["type"], "presence_update")
+        self.assertTrue(await feed.receive_nothing())
+        await feed.disconnect()
+        await chat.disconnect()
+
+
+class RoutingTableTests(SimpleTestCase):
+    def paths(self):
+        from doverx_backend import routing
+        importlib.reload(routing)
+        return [str(pattern.pattern) for pattern in routing.websocket_urlpatterns]
+
+    def tearDown(self):
+        self.paths()
+
+    def test_legacy_routes_behind_flag(self):
+        with override_settings(WS_LEGACY_ENDPOINTS=True):
+            self.assertEqual(self.paths(), ["ws/stream/$", "ws/feed/$", "ws/chat/$"])
+        with override_settings(WS_LEGACY_ENDPOINTS=False):
+            self.assertEqual(self.paths(), ["ws/stream/$"])
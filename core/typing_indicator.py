@@ -0,0 +1,171 @@
+import asyncio
+import time
+from channels.layers import get_channel_layer
+from . import metrics
+
+# =================================================================
+# TYPING INDICATOR - throttle theo (user, target), gom theo lô định kỳ
+# =================================================================
+# - target: "post:<id>" (đang gõ bình luận) hoặc "chat:<conversation_id>".
+# - Client có thể gửi "typing" mỗi phím gõ; chỉ 1 lần / TYPING_THROTTLE giây
+#   cho mỗi (user, target) tạo ra sự kiện, các lần còn lại chỉ gia hạn.
+# - Không ai gửi lại sau TYPING_TTL giây -> coi như đã ngừng gõ.
+# - Mỗi FLUSH_INTERVAL giây, mỗi group nhận của target có thay đổi được gửi
+#   đúng 1 event "typing.batch" (nhiều người gõ gom chung). Group nhận lưu
+#   theo từng người gõ (chat: người kia của A khác người kia của B), mỗi
+#   group chỉ nhận thay đổi của những người gõ gửi tới nó.
+# - Trạng thái giữ trong process; event chỉ chứa thay đổi (typing / stopped)
+#   nên nhiều process cùng gửi cho 1 target không ghi đè lẫn nhau.
+
+TYPING_THROTTLE = 2.0
+TYPING_TTL = 6.0
+FLUSH_INTERVAL = 0.5
+
+
+class TypingHub:
+    """Chỉ dùng trong event loop (không cần lock)"""
+
+    def __init__(self):
+        self._active = {}      # target -> {user_id: [user_name, expires_at]}
+        self._last_sent = {}   # (user_id, target) -> lần cuối tạo sự kiện
+        self._pending = {}     # target -> {"typing": {uid: name}, "stopped": set}
+        self._groups = {}      # target -> {user_id: groups nhận thay đổi của user đó}
+
+    def update(self, target, groups, user_id, user_name, is_typing, now=None):
+        """Ghi nhận 1 tín hiệu typing từ client. Returns True nếu sẽ gửi đi"""
+        now = time.monotonic() if now is None else now
+        active = self._active.setdefault(target, {})
+        key = (user_id, target)
+
+        if not is_typing:
+            self._last_sent.pop(key, None)
+            if active.pop(user_id, None) is None:
+                if not active:
+                    del self._active[target]
+                return False
+            self._groups.setdefault(target, {})[user_id] = list(groups)
+            pending = self._pending_for(target)
+            pending["typing"].pop(user_id, None)
+            pending["stopped"].add(user_id)
+            return True
+
+        if user_id in active and now - self._last_sent.get(key, 0) < TYPING_THROTTLE:
+            active[user_id][1] = now + TYPING_TTL
+            metrics.incr("typing.throttled")
+            return False
+
+        active[user_id] = [user_name, now + TYPING_TTL]
+        self._last_sent[key] = now
+        self._groups.setdefault(target, {})[user_id] = list(groups)
+        pending = self._pending_for(target)
+        pending["stopped"].discard(user_id)
+        pending["typing"][user_id] = user_name
+        return True
+
+    def _pending_for(self, target):
+        pending = self._pending.get(target)
+        if pending is None:
+            pending = self._pending[target] = {"typing": {}, "stopped": set()}
+        return pending
+
+    def expire(self, now=None):
+        """Người không gửi lại trong TYPING_TTL giây -> stopped"""
+        now = time.monotonic() if now is None else now
+        for target, active in list(self._active.items()):
+            for user_id in [uid for uid, (_, expires_at) in active.items() if expires_at <= now]:
+                del active[user_id]
+                self._last_sent.pop((user_id, target), None)
+                self._pending_for(target)["stopped"].add(user_id)
+            if not active:
+                del self._active[target]
+
+    def drain(self):
+        """[(groups, event), ...] cho các target có thay đổi từ lần flush trước"""
+        pending, self._pending = self._pending, {}
+        batches = []
+        for target, changes in pending.items():
+            senders = self._groups.get(target, {})
+            # group -> (typing, stopped) chỉ gồm người gõ gửi tới group đó
+            per_group = {}
+            for uid, name in changes["typing"].items():
+                for group in senders.get(uid, ()):
+                    per_group.setdefault(group, ({}, set()))[0][uid] = name
+            for uid in changes["stopped"]:
+                for group in senders.get(uid, ()):
+                    per_group.setdefault(group, ({}, set()))[1].add(uid)
+
+            kind, _, target_id = target.partition(":")
+            for group, (typing, stopped) in per_group.items():
+                batches.append(([group], {
+                    "type": "typing.batch",
+                    "scope": kind,
+                    "target_id": int(target_id),
+                    "typing": [{"user_id": uid, "user_name": name} for uid, name in typing.items()],
+                    "stopped": sorted(stopped),
+                    "ttl": TYPING_TTL,
+                }))
+
+            # Người đã ngừng gõ không cần giữ group nữa
+            active = self._active.get(target, {})
+            for uid in [uid for uid in senders if uid not in active]:
+                del senders[uid]
+            if not senders:
+                self._groups.pop(target, None)
+        return batches
+
+
+    def idle(self):
+        return not self._active and not self._pending
+
+
+hub = TypingHub()
+_flush_tasks = {}
+
+
+def post_target(post_id):
+    return f"post:{int(post_id)}"
+
+
+def chat_target(conversation_id):
+    return f"chat:{int(conversation_id)}"
+
+
+def user_typing(target, groups, user, is_typing=True):
+    """Gọi trong event loop (consumer.receive). Khởi động flush task nếu cần"""
+    name = user.get_full_name() or user.username
+    if hub.update(target, groups, user.id, name, bool(is_typing)):
+        ensure_flusher()
+
+
+def ensure_flusher():
+    loop = asyncio.get_running_loop()
+    task = _flush_tasks.get(loop)
+    if task is None or task.done():
+        _flush_tasks[loop] = loop.create_task(_flush_loop())
+
+
+async def flush():
+    hub.expire()
+    batches = hub.drain()
+    if not batches:
+        return 0
+    channel_layer = get_channel_layer()
+    sent = 0
+    for groups, event in batches:
+        for group in groups:
+            await channel_layer.group_send(group, event)
+            sent += 1
+    metrics.incr("typing.batches", sent)
+    return sent
+
+
+async def _flush_loop():
+    # Tự dừng khi không còn ai gõ, user_typing() sẽ khởi động lại
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await flush()
+        except Exception as e:
+            print(f"❌ [typing] Flush error: {e}")
+        if hub.idle():
+            return
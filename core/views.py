@@ -0,0 +1,19 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from . import metrics
+from .jobqueue import RedisBackend, get_backend
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """Số liệu nội bộ của process (job queue, websocket...) - chỉ admin"""
+    data = metrics.snapshot()
+    backend = get_backend()
+    if isinstance(backend, RedisBackend):
+        try:
+            data['job_queue'] = backend.stats()
+        except Exception as e:
+            data['job_queue'] = {'error': str(e)}
+    return Response(data)
@@ -20,14 +20,13 @@ django_asgi_app = get_asgi_application()
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from social.middleware import JWTAuthMiddleware
-from social.routing import websocket_urlpatterns as social_ws_urls
-from chat.routing import websocket_urlpatterns as chat_ws_urls
+from .routing import websocket_urlpatterns
 # ✅ Tạo application
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": JWTAuthMiddleware(
         AuthMiddlewareStack(
-          URLRouter(chat_ws_urls + social_ws_urls)
+          URLRouter(websocket_urlpatterns)
         )
     ),
 })
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.urls import re_path
+from chat.consumers import ChatConsumer
+from social.consumers import FeedConsumer, StreamConsumer
+
+# =================================================================
+# WEBSOCKET ROUTING - bảng route duy nhất (asgi.py)
+# =================================================================
+# ws/stream/ : 1 socket / tab, feed + chat multiplex (core/multiplex.py)
+#              {"stream": "feed" | "chat", "payload": {...}}
+#
+# DEPRECATED - shim cho client cũ (2 socket / tab), bật bằng
+# WS_LEGACY_ENDPOINTS (mặc định bật). Theo dõi metric ws.legacy.feed /
+# ws.legacy.chat, về 0 thì tắt cờ rồi xóa LegacyEndpointMixin.
+#   ws/feed/   -> FeedConsumer
+#   ws/chat/   -> ChatConsumer
+
+websocket_urlpatterns = [
+    re_path(r"ws/stream/$", StreamConsumer.as_asgi()),
+]
+
+if settings.WS_LEGACY_ENDPOINTS:
+    websocket_urlpatterns += [
+        re_path(r"ws/feed/$", FeedConsumer.as_asgi()),
+        re_path(r"ws/chat/$", ChatConsumer.as_asgi()),
+    ]
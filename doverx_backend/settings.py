@@ -57,6 +57,7 @@ INSTALLED_APPS = [
     "social_django",
     "social",
     "chat",
+    "core",
 
     "cloudinary",
     "cloudinary_storage",
@@ -83,6 +84,40 @@ if REDIS_URL:
 else:
     CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
 
+# =========================================================
+# CACHE (Redis nếu có, không thì LocMem)
+# =========================================================
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "doverx",
+        }
+    }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# =========================================================
+# WEBSOCKET (doverx_backend/routing.py)
+# =========================================================
+# Route cũ ws/feed/ + ws/chat/ (shim, deprecated) - client mới dùng ws/stream/
+WS_LEGACY_ENDPOINTS = os.getenv("WS_LEGACY_ENDPOINTS", "True").lower() == "true"
+
+# =========================================================
+# JOB QUEUE (core.jobqueue) - side effect chạy sau commit
+# =========================================================
+# eager: chạy ngay (test) | local: thread trong process | redis: `manage.py runjobs`
+# redis phải bật tường minh (JOB_QUEUE_BACKEND=redis) VÀ chạy worker runjobs,
+# nếu không job (email OTP, broadcast, push...) nằm mãi trong queue.
+JOB_QUEUE = {
+    "BACKEND": os.getenv("JOB_QUEUE_BACKEND", "local"),
+    "MAX_RETRIES": 3,
+    "BACKOFF_SECONDS": 2,  # retry sau ~2s, 4s, 8s... (core.jobqueue.retry_delay)
+    "MAX_BACKOFF_SECONDS": 300,
+    "LOCAL_WORKERS": 1,  # 1 worker để giữ thứ tự broadcast
+}
+
 # =========================================================
 # MIDDLEWARE
 # =========================================================
@@ -23,6 +23,7 @@ urlpatterns = [
     path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
     path("api/social/", include("social.urls")),
     path('api/chat/', include('chat.urls')),
+    path('api/metrics/', include('core.urls')),
 ]
 
 # Cho phép truy cập ảnh avatar trong MEDIA
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SocialConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'social'
+
+    def ready(self):
+        # Đăng ký signal cập nhật bộ đếm reaction/comment/share
+        from . import signals  # noqa: F401
@@ -0,0 +1,80 @@
+from collections import defaultdict
+from .models import Comment, CommentReaction
+
+# =================================================================
+# COMMENT TREE LOADER - dựng cây bình luận trong bộ nhớ
+# =================================================================
+# Thay cho CommentSerializer.get_replies đệ quy (1 query / node):
+#   1. Lấy toàn bộ comment của post (1 query, kèm author)
+#   2. Lấy reaction của viewer cho các comment đó (1 query)
+#   3. Gom con theo parent_id và gắn sẵn vào từng node
+# Số lượng reaction theo loại đã nằm sẵn trên Comment (bộ đếm).
+
+DEFAULT_ROOT_LIMIT = 20
+MAX_ROOT_LIMIT = 100
+
+
+class CommentTree:
+    def __init__(self, post_id, viewer=None):
+        self.comments = list(
+            Comment.objects.filter(post_id=post_id)
+            .select_related("author")
+            .order_by("created_at", "id")
+        )
+        self.by_id = {c.id: c for c in self.comments}
+        self.children = defaultdict(list)
+        for c in self.comments:
+            self.children[c.parent_id].append(c)
+
+        self.viewer_reactions = {}
+        if viewer is not None and viewer.is_authenticated and self.comments:
+            self.viewer_reactions = dict(
+                CommentReaction.objects.filter(comment__post_id=post_id, user=viewer)
+                .values_list("comment_id", "type")
+            )
+
+    def contains(self, comment_id):
+        return comment_id in self.by_id
+
+    def page(self, parent_id=None, cursor=None, limit=None, max_depth=None):
+        """
+        Lấy 1 trang con trực tiếp của parent_id (None = comment gốc), mỗi node
+        đã gắn sẵn cây con tới độ sâu max_depth.
+
+        Args:
+            cursor: id của node cuối cùng ở trang trước
+            max_depth: None = không giới hạn; node ở độ sâu cuối sẽ có
+                       has_more_replies=True để client gọi lazy-load nhánh đó
+
+        Returns:
+            (nodes, next_cursor)
+        """
+        nodes = self.children.get(parent_id, [])
+        if cursor is not None:
+            ids = [n.id for n in nodes]
+            nodes = nodes[ids.index(cursor) + 1:] if cursor in ids else []
+
+        next_cursor = None
+        if limit is not None and len(nodes) > limit:
+            nodes = nodes[:limit]
+            next_cursor = nodes[-1].id
+
+        for node in nodes:
+            self._attach(node, depth=1, max_depth=max_depth)
+        return nodes, next_cursor
+
+    def _attach(self, node, depth, max_depth):
+        # Duyệt bằng stack thay vì đệ quy để nhánh reply rất sâu không chạm giới hạn recursion
+        stack = [(node, depth)]
+        while stack:
+            current, level = stack.pop()
+            kids = self.children.get(current.id, [])
+            current.replies_count = len(kids)
+            current.viewer_reaction = self.viewer_reactions.get(current.id)
+            if max_depth is not None and level >= max_depth:
+                current.tree_children = []
+                current.has_more_replies = bool(kids)
+                continue
+            current.tree_children = kids
+            current.has_more_replies = False
+            stack.extend((kid, level + 1) for kid in kids)
@@ -1,29 +1,44 @@
 import json
-import asyncio
 import traceback
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from asgiref.sync import sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from .models import Post, Comment, PostReaction, CommentReaction
+from .counters import set_post_reaction, is_valid_reaction
+from .subscriptions import GLOBAL_GROUP, SubscriptionRegistry, broadcast_groups, post_group
+from . import event_log, wire
+from core import typing_indicator
+from core.keepalive import KeepaliveMixin
+from core.multiplex import LegacyEndpointMixin, MultiplexConsumer, Substream
+from chat.consumers import ChatStream
 
-class FeedConsumer(AsyncWebsocketConsumer):
+class FeedConsumer(LegacyEndpointMixin, KeepaliveMixin, AsyncWebsocketConsumer):
     """
     Consumer xử lý feed real-time: posts, comments, reactions, notifications
     """
+    # False khi chạy trong socket multiplex: ChatStream đã join user_{id}
+    join_user_group = True
+    # Route cũ ws/feed/: event của ChatConsumer đến qua user_{id} -> bỏ qua
+    legacy_name = 'feed'
+    foreign_events = frozenset({'presence_update'})
+    foreign_prefixes = ('chat_',)
     
     async def connect(self):
         """Kết nối WebSocket"""
-        self.feed_group_name = 'public_feed'
+        self.feed_group_name = GLOBAL_GROUP
         self.user = self.scope.get('user', AnonymousUser())
-        self.ping_task = None
+        self.subscriptions = SubscriptionRegistry()
+        self.batcher = None
+        self.protocol = wire.PROTOCOL_V1
 
         if isinstance(self.user, AnonymousUser) or not self.user:
             print("❌ FeedConsumer: Anonymous user, closing connection")
             await self.close(code=4001)
             return
 
-        # 1. Join Public Feed Group (Nhận tin chung: bài mới, like nhảy số...)
+        # 1. Join Public Feed Group (chỉ sự kiện toàn cục: bài mới).
+        #    Like/comment... của từng bài đi qua topic post_<id> / author_<id> (subscribe)
         await self.channel_layer.group_add(
             self.feed_group_name,
             self.channel_name
@@ -31,29 +46,35 @@ class FeedConsumer(AsyncWebsocketConsumer):
 
         # 2. JOIN USER GROUP (QUAN TRỌNG: Để nhận thông báo cá nhân)
        
-        self.user_group_name = f"user_{self.user.id}"
-        await self.channel_layer.group_add(
-            self.user_group_name,
-            self.channel_name
-        )
+        if self.join_user_group:
+            self.user_group_name = f"user_{self.user.id}"
+            await self.channel_layer.group_add(
+                self.user_group_name,
+                self.channel_name
+            )
 
         await self.accept()
         
-        # Send welcome message
+        # Send welcome message (seq: mốc event log hiện tại để resume sau này)
         await self.send(text_data=json.dumps({
             'type': 'connection_established',
             'message': f'Connected to feed as {self.user.username}',
-            'user_id': self.user.id
+            'user_id': self.user.id,
+            'seq': await sync_to_async(event_log.current_seq)()
         }))
+
+        if wire.requested_protocol(self.scope) == wire.PROTOCOL_V2:
+            await self.use_protocol(wire.PROTOCOL_V2)
         
-        # Start keepalive
-        self.ping_task = asyncio.create_task(self.send_periodic_ping())
+        # Keepalive chung cho cả process (core/keepalive.py), không tạo task riêng mỗi socket
+        self.start_keepalive()
         print(f"✅ FeedConsumer connected: {self.user.username}")
 
     async def disconnect(self, close_code):
         """Ngắt kết nối"""
-        if self.ping_task:
-            self.ping_task.cancel()
+        self.stop_keepalive()
+        if getattr(self, 'batcher', None):
+            self.batcher.close()
             
         # Rời nhóm Public
         await self.channel_layer.group_discard(
@@ -61,6 +82,11 @@ class FeedConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
+        # Rời các topic đang theo dõi
+        if hasattr(self, 'subscriptions'):
+            for group in self.subscriptions.groups():
+                await self.channel_layer.group_discard(group, self.channel_name)
+
         # Rời nhóm User (nếu có)
         if hasattr(self, 'user_group_name'):
             await self.channel_layer.group_discard(
@@ -70,20 +96,6 @@ class FeedConsumer(AsyncWebsocketConsumer):
             
         print(f"🔌 FeedConsumer disconnected: {self.user.username if self.user else 'Unknown'} (code: {close_code})")
 
-    async def send_periodic_ping(self):
-        """Gửi ping mỗi 30s để giữ connection"""
-        try:
-            while True:
-                await asyncio.sleep(30)
-                await self.send(text_data=json.dumps({
-                    'type': 'ping',
-                    'timestamp': str(asyncio.get_event_loop().time())
-                }))
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            print(f"❌ Ping error: {e}")
-
     async def receive(self, text_data):
         """Nhận tin nhắn từ client"""
         try:
@@ -98,24 +110,53 @@ class FeedConsumer(AsyncWebsocketConsumer):
                     'timestamp': data.get('timestamp')
                 }))
             
+            elif message_type == 'pong':
+                # Client trả lời ping -> bật phát hiện peer chết cho socket này
+                self.keepalive_replies = True
+
+            elif message_type == 'hello':
+                # {"type": "hello", "proto": 2} -> bật protocol v2 (social/wire.py)
+                if data.get('proto') == wire.PROTOCOL_V2:
+                    await self.use_protocol(wire.PROTOCOL_V2)
+
             elif message_type == 'delete_comment':
                 await self.handle_delete_comment(data)
             
             elif message_type == 'typing':
-                await self.channel_layer.group_send(
-                    self.feed_group_name,
-                    {
-                        'type': 'user_typing',
-                        'post_id': data.get('post_id'),
-                        'user_id': self.user.id,
-                        'user_name': self.user.get_full_name() or self.user.username,
-                        'is_typing': data.get('is_typing', True)
-                    }
+                # Chỉ gửi tới người đang xem bài (group post_<id>), gom theo lô
+                try:
+                    post_id = int(data.get('post_id'))
+                except (TypeError, ValueError):
+                    return
+                typing_indicator.user_typing(
+                    typing_indicator.post_target(post_id),
+                    [post_group(post_id)],
+                    self.user,
+                    data.get('is_typing', True)
                 )
+
+            elif message_type == 'subscribe':
+                # {"type": "subscribe", "posts": [1, 2], "authors": [7]}
+                await self.subscribe('post', data.get('posts') or [])
+                await self.subscribe('author', data.get('authors') or [])
+
+            elif message_type == 'unsubscribe':
+                await self.unsubscribe('post', data.get('posts') or [])
+                await self.unsubscribe('author', data.get('authors') or [])
+
+            elif message_type == 'subscribe_post':
+                await self.subscribe('post', [data.get('post_id')])
+
+            elif message_type == 'unsubscribe_post':
+                await self.unsubscribe('post', [data.get('post_id')])
                 
             elif message_type == "post_react":
                 await self.handle_post_react(data)
 
+            elif message_type == 'resume':
+                # {"type": "resume", "seq": 123} - gửi sau khi subscribe lại các topic
+                await self.handle_resume(data)
+
             else:
                 # Ignore unknown types to prevent spamming client with errors
                 pass 
@@ -130,19 +171,22 @@ class FeedConsumer(AsyncWebsocketConsumer):
         Handler cho các thông báo chung (kết bạn, like, comment...)
         """
         data = event.get('data', {})
-        await self.send(text_data=json.dumps({
+        await self.push({
             'type': 'notification',
             'data': data
-        }))
+        })
     # ==================== HANDLERS TỪ VIEWS GỬI SANG ====================
 
     async def feed_update(self, event):
-        """Broadcast feed update (Public) tới client"""
+        """Broadcast feed update (public_feed / topic) tới client"""
         try:
-            await self.send(text_data=json.dumps({
+            # Cùng sự kiện đã/ sẽ đến qua post_<id> -> bỏ bản đến qua author_<id>
+            if self.subscriptions.is_duplicate(event.get('group'), event['data'].get('post_id')):
+                return
+            await self.push({
                 'type': 'feed_update',
                 'data': event['data']
-            }))
+            })
         except Exception as e:
             print(f"❌ Error sending feed_update: {e}")
 
@@ -151,13 +195,58 @@ class FeedConsumer(AsyncWebsocketConsumer):
         try:
             # Views.py gửi type='feed_notification', ta forward xuống client
             data = event.get('data', {})
-            await self.send(text_data=json.dumps({
+            await self.push({
                 'type': 'notification',
                 'data': data
-            }))
+            })
         except Exception as e:
             print(f"❌ Error sending notification: {e}")
 
+    async def feed_notification_badge(self, event):
+        """Số notification chưa đọc mới (social/notifications.py)"""
+        await self.push({'type': 'notification_badge', 'count': event['count']})
+
+    async def use_protocol(self, version):
+        if version == wire.PROTOCOL_V2 and self.batcher is None:
+            self.protocol = version
+            self.batcher = wire.EventBatcher(lambda text: self.send(text_data=text))
+            await self.send(text_data=wire.dumps({'type': 'hello', 'proto': version, 'keys': wire.KEY_MAP}))
+
+    async def push(self, message):
+        """Gửi 1 sự kiện: v1 -> 1 frame ngay, v2 -> gom lô + rút gọn (social/wire.py)"""
+        if self.batcher is not None:
+            await self.batcher.push(message)
+        else:
+            await self.send(text_data=json.dumps(message))
+
+    async def subscribe(self, kind, ids):
+        """Theo dõi bài / tác giả đang hiển thị (giới hạn trong social/subscriptions.py)"""
+        added, removed = self.subscriptions.subscribe(kind, ids)
+        for group in removed:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        for group in added:
+            await self.channel_layer.group_add(group, self.channel_name)
+
+    async def unsubscribe(self, kind, ids):
+        for group in self.subscriptions.unsubscribe(kind, ids):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def typing_batch(self, event):
+        """Nhiều người đang gõ bình luận, gom trong 1 message (core/typing_indicator.py)"""
+        if event.get('scope') != 'post':
+            return
+        typing = [t for t in event['typing'] if t['user_id'] != self.user.id]
+        stopped = [uid for uid in event['stopped'] if uid != self.user.id]
+        if not typing and not stopped:
+            return
+        await self.push({
+            'type': 'typing_batch',
+            'post_id': event['target_id'],
+            'typing': typing,
+            'stopped': stopped,
+            'ttl': event['ttl']
+        })
+
     async def user_typing(self, event):
         """Broadcast typing status"""
         try:
@@ -175,20 +264,13 @@ class FeedConsumer(AsyncWebsocketConsumer):
             
             print(f"🗑️ User {self.user.username} deleting comment {comment_id}")
             
-            post_id = await self.delete_comment_sync(comment_id, self.user)
+            post_id, author_id = await self.delete_comment_sync(comment_id, self.user)
             
             if post_id:
-                await self.channel_layer.group_send(
-                    'public_feed',
-                    {
-                        'type': 'feed_update',
-                        'data': {
-                            'event': 'delete_comment',
-                            'post_id': post_id,
-                            'comment_id': comment_id,
-                        }
-                    }
-                )
+                await self.broadcast('delete_comment', {
+                    'post_id': post_id,
+                    'comment_id': comment_id,
+                }, post_id=post_id, author_id=author_id)
         except Exception as e:
             print(f"❌ [handle_delete_comment] Error: {e}")
 
@@ -197,72 +279,98 @@ class FeedConsumer(AsyncWebsocketConsumer):
         reaction_type = data.get("reaction_type")
 
         if not post_id: return
+        if reaction_type is not None and not is_valid_reaction(reaction_type): return
 
-        # Lưu DB
-        await self.toggle_post_reaction_sync(post_id, self.user, reaction_type)
-
-        # Get lại số lượng
-        reaction_counts = await self.get_post_reactions(post_id)
-
-        # Broadcast realtime
-        await self.channel_layer.group_send(
-            "public_feed",
-            {
-                "type": "feed_update",
-                "data": {
-                    "event": "post_react",
-                    "post_id": post_id,
-                    "reaction_type": reaction_type,
-                    "reaction_counts": reaction_counts,
-                    "user_id": self.user.id
-                }
-            }
-        )
-    async def chat_new_message(self, event):
-    # Pass là an toàn nhất, chỉ đơn giản là bỏ qua thông điệp này
-        pass 
-
-# Hàm này sẽ được gọi khi FeedConsumer nhận type: 'chat.user_typing'
-    async def chat_user_typing(self, event):
-    # Thông điệp chat typing, FeedConsumer không cần xử lý
-        pass
-
-# Hàm này sẽ được gọi khi FeedConsumer nhận type: 'chat.messages_read'
-    async def chat_messages_read(self, event):
-    # Thông điệp đã đọc, FeedConsumer không cần xử lý
-        pass
+        # Lưu DB + cập nhật bộ đếm, trả về số lượng mới (không cần GROUP BY)
+        reaction_counts, author_id = await self.toggle_post_reaction_sync(post_id, self.user, reaction_type)
+        if reaction_counts is None: return
+
+        # Broadcast realtime tới người đang xem bài (post_<id>) / trang tác giả
+        await self.broadcast("post_react", {
+            "post_id": post_id,
+            "reaction_type": reaction_type,
+            "reaction_counts": reaction_counts,
+            "user_id": self.user.id
+        }, post_id=post_id, author_id=author_id)
+
+    async def broadcast(self, event_type, data, post_id=None, author_id=None):
+        """Như BaseBroadcastViewSet._broadcast nhưng gửi thẳng (đang ở trong event loop)"""
+        groups = broadcast_groups(event_type, post_id=post_id, author_id=author_id)
+        if not groups:
+            return
+        items = await sync_to_async(event_log.feed_messages)(groups, {'event': event_type, **data})
+        for group, message in items:
+            await self.channel_layer.group_send(group, message)
+
+    async def handle_resume(self, data):
+        """Phát lại sự kiện feed sau seq client gửi lên (social/event_log.py)"""
+        try:
+            seq = int(data.get('seq'))
+        except (TypeError, ValueError):
+            seq = -1
+        groups = [self.feed_group_name, *self.subscriptions.groups()]
+        result = await sync_to_async(event_log.replay)(seq, groups) if seq >= 0 else None
+        if result is None:
+            # Lỡ nhiều hơn buffer giữ được -> client tải lại feed qua REST
+            await self.send(text_data=json.dumps({
+                'type': 'resync_required',
+                'seq': await sync_to_async(event_log.current_seq)()
+            }))
+            return
+        events, head = result
+        for event in events:
+            await self.push({'type': 'feed_update', 'data': event})
+        if self.batcher is not None:
+            await self.batcher.flush()
+        await self.send(text_data=json.dumps({'type': 'resume_complete', 'seq': head}))
     # ==================== DATABASE SYNC METHODS ====================
 
     @sync_to_async
     def delete_comment_sync(self, comment_id, user):
         try:
-            comment = Comment.objects.get(id=comment_id, author=user)
-            post_id = comment.post.id
+            comment = Comment.objects.select_related('post').get(id=comment_id, author=user)
+            post_id, author_id = comment.post_id, comment.post.author_id
             comment.delete()
-            return post_id
+            return post_id, author_id
         except:
-            return None
+            return None, None
 
     @sync_to_async
     def toggle_post_reaction_sync(self, post_id, user, reaction_type):
-        if reaction_type is None:
-            PostReaction.objects.filter(post_id=post_id, user=user).delete()
-            return
-        PostReaction.objects.update_or_create(
-            post_id=post_id,
-            user=user,
-            defaults={"type": reaction_type}
-        )
-
-    @sync_to_async
-    def get_post_reactions(self, post_id):
         try:
-            reactions = PostReaction.objects.filter(post_id=post_id).values('type')
-            reaction_counts = {}
-            for r in reactions:
-                reaction_type = r['type']
-                reaction_counts[reaction_type] = reaction_counts.get(reaction_type, 0) + 1
-            return reaction_counts
-        except:
-            return {}
+            _, reaction_counts = set_post_reaction(post_id, user, reaction_type)
+            author_id = Post.objects.filter(pk=post_id).values_list('author_id', flat=True).first()
+            return reaction_counts, author_id
+        except Exception as e:
+            print(f"❌ [toggle_post_reaction_sync] Error: {e}")
+            return None, None
     # Hàm này sẽ được gọi khi FeedConsumer nhận type: 'chat.new_message'
+
+
+# =================================================================
+# WS/STREAM/ - FEED + CHAT TRÊN 1 SOCKET (core/multiplex.py)
+# =================================================================
+
+class FeedStream(Substream, FeedConsumer):
+    """FeedConsumer chạy như stream "feed" trong StreamConsumer"""
+    join_user_group = False
+
+
+def _typing_stream(event):
+    return 'feed' if event.get('scope') == 'post' else 'chat'
+
+
+class StreamConsumer(MultiplexConsumer):
+    """
+    1 socket / tab thay cho ws/feed/ + ws/chat/:
+    {"stream": "feed" | "chat", "payload": {...}} theo cả 2 chiều.
+    Chỉ ChatStream join user_{id} và giữ presence -> mỗi event cá nhân giao 1 lần.
+    """
+    streams = {'feed': FeedStream, 'chat': ChatStream}
+    routes = {
+        'send_notification': 'chat',
+        'presence_update': 'chat',
+        'user_typing': 'feed',
+        'typing_batch': _typing_stream,
+    }
+    prefix_routes = [('feed_', 'feed'), ('chat_', 'chat')]
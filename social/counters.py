@@ -0,0 +1,176 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from .models import REACTION_CHOICES, Post, PostReaction, Comment, CommentReaction, Share
+
+# =================================================================
+# BỘ ĐẾM PHI CHUẨN HÓA (reaction / comment / share)
+# =================================================================
+# - Thêm/xóa reaction, comment, share: signals.py cộng/trừ bằng F()
+#   (bắt được cả xóa dây chuyền khi xóa user/post/comment).
+# - Đổi loại reaction (like -> love): set_*_reaction tự chuyển bộ đếm.
+# - Mọi cập nhật đều là UPDATE ... SET x = x + n nên an toàn khi chạy song song.
+
+REACTION_TYPES = [t for t, _ in REACTION_CHOICES]
+REACTION_FIELDS = [f"{t}_count" for t in REACTION_TYPES]
+
+
+def is_valid_reaction(rtype):
+    return rtype in REACTION_TYPES
+
+
+def bump(model, pk, **deltas):
+    """UPDATE model SET field = field + delta WHERE id = pk"""
+    deltas = {field: d for field, d in deltas.items() if d}
+    if deltas:
+        model.objects.filter(pk=pk).update(**{field: F(field) + d for field, d in deltas.items()})
+
+
+def reaction_deltas(old_type, new_type, sign=1):
+    deltas = {}
+    if old_type in REACTION_TYPES:
+        deltas[f"{old_type}_count"] = -sign
+        deltas["reactions_count"] = -sign
+    if new_type in REACTION_TYPES:
+        deltas[f"{new_type}_count"] = deltas.get(f"{new_type}_count", 0) + sign
+        deltas["reactions_count"] = deltas.get("reactions_count", 0) + sign
+    return deltas
+
+
+def read_reaction_counts(model, pk):
+    """Đọc lại bộ đếm sau khi cập nhật (1 SELECT theo khóa chính, không GROUP BY)"""
+    row = model.objects.filter(pk=pk).values(*REACTION_FIELDS).first() or {}
+    return {t: row[f"{t}_count"] for t in REACTION_TYPES if row.get(f"{t}_count", 0) > 0}
+
+
+def _set_reaction(reaction_model, target_model, target_field, target_id, user, rtype):
+    """
+    Đặt reaction của user lên target (rtype=None nghĩa là bỏ reaction).
+    Khóa dòng reaction hiện có để 2 request song song của cùng user
+    không đếm trùng.
+
+    Returns:
+        (old_type, reaction_counts)
+    """
+    if rtype is not None and not is_valid_reaction(rtype):
+        raise ValueError(f"Invalid reaction type: {rtype}")
+
+    lookup = {f"{target_field}_id": target_id, "user": user}
+    with transaction.atomic():
+        existing = reaction_model.objects.select_for_update().filter(**lookup).first()
+        old_type = existing.type if existing else None
+
+        if old_type != rtype:
+            if rtype is None:
+                # post_delete signal tự trừ bộ đếm
+                existing.delete()
+            elif existing:
+                existing.type = rtype
+                existing.save()
+                bump(target_model, target_id, **reaction_deltas(old_type, rtype))
+            else:
+                try:
+                    with transaction.atomic():
+                        # post_save signal tự cộng bộ đếm
+                        reaction_model.objects.create(type=rtype, **lookup)
+                except IntegrityError:
+                    # Request song song của cùng user đã insert trước -> chuyển thành update
+                    existing = reaction_model.objects.select_for_update().get(**lookup)
+                    old_type = existing.type
+                    if old_type != rtype:
+                        existing.type = rtype
+                        existing.save()
+                        bump(target_model, target_id, **reaction_deltas(old_type, rtype))
+
+        counts = read_reaction_counts(target_model, target_id)
+    return old_type, counts
+
+
+def set_post_reaction(post_id, user, rtype):
+    return _set_reaction(PostReaction, Post, "post", post_id, user, rtype)
+
+
+def set_comment_reaction(comment_id, user, rtype):
+    return _set_reaction(CommentReaction, Comment, "comment", comment_id, user, rtype)
+
+
+# =================================================================
+# DỰNG LẠI BỘ ĐẾM TỪ BẢNG GỐC (dùng bởi `manage.py rebuild_counters`)
+# =================================================================
+def _reaction_rows(reaction_model, target_field, ids):
+    rows = (
+        reaction_model.objects.filter(**{f"{target_field}_id__in": ids})
+        .values(f"{target_field}_id", "type").order_by()
+        .annotate(count=Count("id"))
+    )
+    result = {pk: {} for pk in ids}
+    for row in rows:
+        if row["type"] in REACTION_TYPES:
+            result[row[f"{target_field}_id"]][row["type"]] = row["count"]
+    return result
+
+
+def _count_by(model, field, ids):
+    return dict(
+        model.objects.filter(**{f"{field}_id__in": ids})
+        .values(f"{field}_id").order_by()
+        .annotate(count=Count("id"))
+        .values_list(f"{field}_id", "count")
+    )
+
+
+def _apply_reaction_counts(obj, counts):
+    for rtype in REACTION_TYPES:
+        setattr(obj, f"{rtype}_count", counts.get(rtype, 0))
+    obj.reactions_count = sum(counts.values())
+
+
+def rebuild_post_counters(batch_size=1000):
+    """Tính lại toàn bộ bộ đếm của Post. Trả về số post đã xử lý."""
+    fields = REACTION_FIELDS + ["reactions_count", "comments_count", "shares_count"]
+    total = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            posts = list(
+                Post.objects.select_for_update()
+                .filter(id__gt=last_id).order_by("id")
+                .only("id", *fields)[:batch_size]
+            )
+            if not posts:
+                break
+            ids = [p.id for p in posts]
+            reactions = _reaction_rows(PostReaction, "post", ids)
+            comments = _count_by(Comment, "post", ids)
+            shares = _count_by(Share, "post", ids)
+            for p in posts:
+                _apply_reaction_counts(p, reactions[p.id])
+                p.comments_count = comments.get(p.id, 0)
+                p.shares_count = shares.get(p.id, 0)
+            Post.objects.bulk_update(posts, fields)
+        total += len(posts)
+        last_id = ids[-1]
+    return total
+
+
+def rebuild_comment_counters(batch_size=1000):
+    """Tính lại bộ đếm reaction của Comment. Trả về số comment đã xử lý."""
+    fields = REACTION_FIELDS + ["reactions_count"]
+    total = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            comments = list(
+                Comment.objects.select_for_update()
+                .filter(id__gt=last_id).order_by("id")
+                .only("id", *fields)[:batch_size]
+            )
+            if not comments:
+                break
+            ids = [c.id for c in comments]
+            reactions = _reaction_rows(CommentReaction, "comment", ids)
+            for c in comments:
+                _apply_reaction_counts(c, reactions[c.id])
+            Comment.objects.bulk_update(comments, fields)
+        total += len(comments)
+        last_id = ids[-1]
+    return total
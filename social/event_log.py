@@ -0,0 +1,141 @@
+import json
+import threading
+from collections import deque
+from django.core.serializers.json import DjangoJSONEncoder
+from core.redis_client import get_redis
+
+# =================================================================
+# FEED EVENT LOG - ring buffer sự kiện feed có số thứ tự (seq)
+# =================================================================
+# - Mỗi sự kiện feed (bài mới, like, comment...) được ghi 1 lần kèm các
+#   group nhận (public_feed, post_<id>, author_<id>) và nhận seq tăng dần;
+#   seq nằm trong data của feed_update gửi client.
+# - Chỉ giữ EVENT_LOG_SIZE sự kiện gần nhất (Redis nếu có REDIS_URL, không
+#   thì trong bộ nhớ - chỉ đúng khi web + job chạy chung 1 process).
+# - Reconnect: client subscribe lại topic rồi gửi {"type": "resume", "seq": <seq cuối đã thấy>}
+#   -> FeedConsumer phát lại các sự kiện sau seq thuộc group của socket.
+#   seq đã trôi khỏi buffer -> resync_required (client tải lại feed như cũ).
+# - Sự kiện đang ghi dở lúc replay vẫn tới qua channel layer sau đó:
+#   client bỏ trùng theo seq, không giả định seq đến theo thứ tự.
+
+EVENT_LOG_SIZE = 5000
+
+KEY_PREFIX = "doverx:feedlog"
+
+
+class MemoryEventLog:
+    """Store trong bộ nhớ - chỉ đúng khi chạy 1 process (dev)"""
+
+    def __init__(self, size=EVENT_LOG_SIZE):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=size)  # (seq, groups, data)
+        self._seq = 0
+
+    def append(self, groups, data):
+        with self._lock:
+            self._seq += 1
+            self._entries.append((self._seq, list(groups), {**data, 'seq': self._seq}))
+            return self._seq
+
+    def current(self):
+        with self._lock:
+            return self._seq
+
+    def since(self, seq):
+        """Các sự kiện có seq > seq, None nếu đã có sự kiện bị đẩy khỏi buffer"""
+        with self._lock:
+            if seq > self._seq:
+                # Log đã bị reset (restart) -> seq của client không còn ý nghĩa
+                return None
+            if self._entries and self._entries[0][0] > seq + 1:
+                return None
+            if not self._entries and self._seq > seq:
+                return None
+            return [entry for entry in self._entries if entry[0] > seq]
+
+
+class RedisEventLog:
+    """
+    seq = INCR, sự kiện nằm trong sorted set (score = seq) cắt còn `size` phần tử.
+    Sorted set giữ đúng thứ tự seq kể cả khi nhiều process ghi xen kẽ.
+    """
+
+    def __init__(self, client, size=EVENT_LOG_SIZE):
+        self.redis = client
+        self.size = size
+
+    def append(self, groups, data):
+        seq = self.redis.incr(f"{KEY_PREFIX}:seq")
+        entry = json.dumps({'s': seq, 'g': list(groups), 'd': {**data, 'seq': seq}}, separators=(",", ":"), cls=DjangoJSONEncoder)
+        pipe = self.redis.pipeline()
+        pipe.zadd(f"{KEY_PREFIX}:events", {entry: seq})
+        pipe.zremrangebyrank(f"{KEY_PREFIX}:events", 0, -self.size - 1)
+        pipe.execute()
+        return seq
+
+    def current(self):
+        return int(self.redis.get(f"{KEY_PREFIX}:seq") or 0)
+
+    def since(self, seq):
+        pipe = self.redis.pipeline()
+        pipe.zrange(f"{KEY_PREFIX}:events", 0, 0, withscores=True)
+        pipe.zrangebyscore(f"{KEY_PREFIX}:events", f"({seq}", "+inf")
+        pipe.get(f"{KEY_PREFIX}:seq")
+        oldest, raw, current = pipe.execute()
+        current = int(current or 0)
+        if seq > current:
+            return None
+        if oldest and oldest[0][1] > seq + 1:
+            return None
+        if not oldest and current > seq:
+            return None
+        entries = []
+        for item in raw:
+            entry = json.loads(item)
+            entries.append((entry['s'], entry['g'], entry['d']))
+        return entries
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                client = get_redis()
+                _log = RedisEventLog(client) if client else MemoryEventLog()
+    return _log
+
+
+def record(groups, data):
+    """Ghi 1 sự kiện, trả về (seq, data có seq)"""
+    seq = get_log().append(groups, data)
+    return seq, {**data, 'seq': seq}
+
+
+def feed_messages(groups, data):
+    """Ghi log + dựng [[group, message], ...] feed_update cho channel layer"""
+    _, data = record(groups, data)
+    return [[group, {'type': 'feed_update', 'group': group, 'data': data}] for group in groups]
+
+
+def replay(seq, groups):
+    """
+    Sự kiện sau `seq` gửi tới ít nhất 1 group trong `groups` (mỗi sự kiện 1 lần).
+
+    Returns:
+        (list data theo seq tăng dần, seq cuối đã xét) hoặc None nếu cần resync
+    """
+    entries = get_log().since(seq)
+    if entries is None:
+        return None
+    groups = set(groups)
+    events = [data for _, entry_groups, data in entries if groups.intersection(entry_groups)]
+    return events, entries[-1][0] if entries else seq
+
+
+def current_seq():
+    return get_log().current()
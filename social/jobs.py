@@ -0,0 +1,33 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from core.jobqueue import job
+from . import event_log
+from .notifications import fan_out_new_post, push_notifications, push_aggregated
+
+
+@job("social.fan_out_new_post")
+def fan_out_new_post_job(post_id, author_id):
+    fan_out_new_post(post_id, author_id)
+
+
+@job("social.push_notifications")
+def push_notifications_job(payloads, new_unread=True):
+    push_notifications(payloads, new_unread)
+
+
+@job("social.push_aggregated")
+def push_aggregated_job(notif_id):
+    push_aggregated(notif_id)
+
+
+@job("social.broadcast_feed_event")
+def broadcast_feed_event_job(groups, data):
+    """Ghi sự kiện vào event log (lấy seq) rồi gửi tới các group"""
+    channel_layer = get_channel_layer()
+    items = event_log.feed_messages(groups, data)
+
+    async def _send_all():
+        for group, message in items:
+            await channel_layer.group_send(group, message)
+
+    async_to_sync(_send_all)()
@@ -0,0 +1,108 @@
+import json
+import random
+import time
+from django.core.management.base import BaseCommand
+from social import wire
+
+AVATAR = "https://res.cloudinary.com/demo/image/upload/v1700000000/media/avatars/avatar_{}.jpg"
+NAMES = ["Nguyễn Văn An", "Trần Thị Bình", "Lê Hoàng Cường", "Phạm Ngọc Dung", "Võ Minh Em"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mô phỏng luồng sự kiện feed tới N client: so sánh frame/s và byte/s "
+        "giữa protocol v1 (1 frame/sự kiện) và v2 (gom lô 50ms, gộp, key rút gọn)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=10_000)
+        parser.add_argument("--seconds", type=int, default=10)
+        parser.add_argument("--events-per-second", type=int, default=200)
+        parser.add_argument("--hot-posts", type=int, default=20, help="Số bài nhận phần lớn reaction")
+        parser.add_argument("--window-ms", type=int, default=int(wire.BATCH_WINDOW * 1000))
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        events = self._stream(options["seconds"], options["events_per_second"], options["hot_posts"])
+        clients = options["clients"]
+        seconds = options["seconds"]
+
+        # v1: mỗi sự kiện 1 frame, consumer nào cũng json.dumps riêng
+        t0 = time.perf_counter()
+        v1_frames = [json.dumps(message) for _, message in events]
+        v1_cpu = time.perf_counter() - t0
+        v1_bytes = sum(len(f.encode()) for f in v1_frames)
+
+        # v2: gom theo cửa sổ cố định (xấp xỉ timer của từng socket)
+        window = options["window_ms"] / 1000
+        buckets = {}
+        for ts, message in events:
+            buckets.setdefault(int(ts / window), []).append(message)
+        t0 = time.perf_counter()
+        v2_frames = [wire.encode_batch(batch) for _, batch in sorted(buckets.items())]
+        v2_cpu = time.perf_counter() - t0
+        v2_bytes = sum(len(f.encode()) for f in v2_frames)
+        v2_events = sum(len(wire.coalesce(batch)) for batch in buckets.values())
+
+        self.stdout.write(
+            f"📡 {len(events):,} events in {seconds}s to {clients:,} clients "
+            f"(all subscribed to the hot posts, window {options['window_ms']}ms)"
+        )
+        self._report("v1 (json/event)", len(v1_frames), v1_bytes, v1_cpu, len(events), clients, seconds)
+        self._report("v2 (batched)   ", len(v2_frames), v2_bytes, v2_cpu, v2_events, clients, seconds)
+        self.stdout.write(
+            f"\n📉 frames x{len(v1_frames) / max(len(v2_frames), 1):.1f} fewer, "
+            f"bytes x{v1_bytes / max(v2_bytes, 1):.1f} fewer"
+        )
+
+    def _report(self, label, frames, size, cpu, delivered, clients, seconds):
+        self.stdout.write(
+            f"\n📊 {label}: {frames * clients / seconds:>14,.0f} frames/s  "
+            f"{size * clients / seconds / 1024 / 1024:>10,.1f} MiB/s  "
+            f"events delivered/client {delivered:,}  "
+            f"encode CPU {cpu * clients / seconds:,.2f} core-s/s"
+        )
+
+    def _stream(self, seconds, per_second, hot_posts):
+        """[(timestamp, message)] - hỗn hợp like / comment / share trên vài bài nóng"""
+        counts = {}
+        events = []
+        for i in range(seconds * per_second):
+            ts = random.uniform(0, seconds)
+            post_id = random.randint(1, hot_posts)
+            user_id = random.randint(1, 5000)
+            roll = random.random()
+            if roll < 0.8:
+                post_counts = counts.setdefault(post_id, {"like": 0, "love": 0})
+                rtype = random.choice(["like", "love"])
+                post_counts[rtype] += 1
+                data = {
+                    "event": "post_react", "post_id": post_id, "user_id": user_id,
+                    "user_name": random.choice(NAMES), "user_avatar": AVATAR.format(user_id),
+                    "reaction_type": rtype, "reaction_counts": dict(post_counts), "owner_id": post_id,
+                }
+            elif roll < 0.9:
+                data = {
+                    "event": "new_comment", "post_id": post_id, "is_reply": False,
+                    "comment": {
+                        "id": 100_000 + i, "text": "Cảm ơn bác sĩ đã chia sẻ!", "user_id": user_id,
+                        "user_name": random.choice(NAMES), "user_avatar": AVATAR.format(user_id),
+                    },
+                    "post_author_id": post_id, "parent_author_id": None,
+                }
+            elif roll < 0.95:
+                data = {
+                    "event": "comment_react", "post_id": post_id, "comment_id": random.randint(1, 50),
+                    "user_id": user_id, "user_name": random.choice(NAMES),
+                    "user_avatar": AVATAR.format(user_id), "reaction_type": "like",
+                    "reactions_count": {"like": random.randint(1, 30)}, "owner_id": user_id,
+                }
+            else:
+                data = {
+                    "event": "share_post", "post_id": post_id, "user_id": user_id,
+                    "message": "", "shares_count": random.randint(1, 100),
+                }
+            events.append((ts, {"type": "feed_update", "data": data}))
+        events.sort(key=lambda e: e[0])
+        return events
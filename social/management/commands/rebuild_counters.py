@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from social.counters import rebuild_post_counters, rebuild_comment_counters
+
+
+class Command(BaseCommand):
+    help = "Dựng lại bộ đếm reaction/comment/share của Post và Comment từ bảng gốc"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        posts = rebuild_post_counters(batch_size=batch_size)
+        self.stdout.write(f"✅ Rebuilt counters for {posts} posts")
+        comments = rebuild_comment_counters(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt counters for {comments} comments"))
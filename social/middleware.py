@@ -1,48 +1,160 @@
 # bảo mật cho WebSocket bằng JWT trong Django Channels
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from core import metrics
 
 User = get_user_model()
 
+# =================================================================
+# USER NHẸ TRÊN SCOPE WEBSOCKET + CACHE CHO HANDSHAKE
+# =================================================================
+# - scope["user"] là User chỉ nạp PRINCIPAL_FIELDS (id, username, email, tên, role,
+#   is_active); các cột khác (bio, address, license_number, OTP...) là
+#   deferred: chỉ được đọc từ DB khi code sync thực sự truy cập
+#   (vd. user.avatar trong database_sync_to_async). Truy cập trong async
+#   sẽ báo SynchronousOnlyOperation -> phải load qua sync.
+# - Token chỉ dùng để xác định user_id. Tên / role không lấy từ claims:
+#   simplejwt chép claims của refresh token sang mọi access token mới (và
+#   rotation giữ tiếp), nên đổi tên hồ sơ sẽ không cập nhật tới khi đăng nhập lại.
+# - Cache LRU + TTL theo user_id, miss thì 1 SELECT PRINCIPAL_FIELDS (có
+#   is_active). Token vẫn được verify (chữ ký + hạn) mỗi lần.
+# - User đổi (is_active, hồ sơ...) -> accounts/signals.py gọi invalidate_cached_user
+#   trong process đó; process khác tự hết hạn sau tối đa USER_CACHE_TTL giây.
+# - Hit cache không cần nhảy sang thread pool (database_sync_to_async).
+
+USER_CACHE_TTL = 30
+USER_CACHE_SIZE = 10_000
+
+PRINCIPAL_FIELDS = ("id", "username", "email", "first_name", "last_name", "role", "is_active")
+
+
+class UserSnapshotCache:
+    """LRU + TTL trong process: user_id -> giá trị PRINCIPAL_FIELDS"""
+
+    def __init__(self, ttl=USER_CACHE_TTL, size=USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (expires_at, values)
+
+    def get(self, user_id, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, values, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserSnapshotCache()
+
+
+def invalidate_cached_user(user_id):
+    user_cache.invalidate(user_id)
+
+
+def decode_token(token_key):
+    """Verify token (chữ ký, hạn dùng), trả về AccessToken hoặc None"""
+    if not token_key:
+        return None
+    try:
+        return AccessToken(token_key)
+    except (InvalidToken, TokenError) as e:
+        print(f"❌ Invalid token: {e}")
+        return None
+
+
+def build_principal(values):
+    """User chỉ có PRINCIPAL_FIELDS, các cột khác deferred (nạp khi cần, chỉ trong sync)"""
+    return User.from_db("default", list(PRINCIPAL_FIELDS), [values[f] for f in PRINCIPAL_FIELDS])
+
+
 @database_sync_to_async
-def get_user_from_token(token_key):
+def load_principal_values(user_id):
+    """Cache miss: đọc PRINCIPAL_FIELDS từ DB (tên / role luôn mới nhất)"""
+    return User.objects.filter(id=user_id).values(*PRINCIPAL_FIELDS).first()
+
+
+async def get_user_from_token(token_key):
     """
      Xác thực JWT token cho WebSocket
     """
-    if not token_key:
-        return AnonymousUser()
-        
     try:
-        access_token = AccessToken(token_key)
+        access_token = decode_token(token_key)
+        if access_token is None:
+            return AnonymousUser()
+
         user_id = access_token.get("user_id") or access_token.get("id")
-        
         if not user_id:
             print("❌ No user_id in token")
             return AnonymousUser()
-            
-        user = User.objects.get(id=user_id)
-        
+        user_id = int(user_id)
+
+        values = user_cache.get(user_id)
+        if values is not None:
+            metrics.incr("ws.auth_cache_hit")
+        else:
+            metrics.incr("ws.auth_cache_miss")
+            values = await load_principal_values(user_id)
+            if values is None:
+                print("❌ User not found")
+                return AnonymousUser()
+            user_cache.set(user_id, values)
+
         #  Kiểm tra user còn active không
-        if not user.is_active:
-            print(f"❌ User {user.username} is inactive")
+        if not values["is_active"]:
+            print(f"❌ User {values['username']} is inactive")
             return AnonymousUser()
-            
-        return user
-        
-    except (InvalidToken, TokenError) as e:
-        print(f"❌ Invalid token: {e}")
-        return AnonymousUser()
-    except User.DoesNotExist:
-        print(f"❌ User not found")
-        return AnonymousUser()
+
+        return build_principal(values)
+
     except Exception as e:
         print(f"❌ Unexpected error: {e}")
         return AnonymousUser()
 
+
+def get_token(scope):
+    """?token=... (đã URL-decode) hoặc header Authorization: Bearer ..."""
+    query = parse_qs(scope.get("query_string", b"").decode())
+    token = (query.get("token") or [None])[0]
+    if token:
+        return token
+
+    headers = dict(scope.get("headers", []))
+    auth_header = headers.get(b"authorization", b"").decode()
+    if auth_header.startswith("Bearer "):
+        return auth_header[7:]  # Remove "Bearer " prefix
+    return None
+
+
 class JWTAuthMiddleware(BaseMiddleware):
     """
      Middleware xác thực JWT cho WebSocket
@@ -51,23 +163,7 @@ class JWTAuthMiddleware(BaseMiddleware):
     - Header: Authorization: Bearer xxx
     """
     async def __call__(self, scope, receive, send):
-        # Try query string first
-        query_string = scope.get("query_string", b"").decode()
-        token = None
-        
-        for param in query_string.split("&"):
-            if param.startswith("token="):
-                token = param.split("=")[1]
-                break
-
-        # Try headers if no query token
-        if not token:
-            headers = dict(scope.get("headers", []))
-            auth_header = headers.get(b"authorization", b"").decode()
-            
-            if auth_header.startswith("Bearer "):
-                token = auth_header[7:]  # Remove "Bearer " prefix
-
-        scope["user"] = await get_user_from_token(token)
-        
+        metrics.incr("ws.handshake")
+        scope["user"] = await get_user_from_token(get_token(scope))
+
         return await super().__call__(scope, receive, send)
@@ -0,0 +1,79 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+REACTION_TYPES = ['like', 'love', 'haha', 'wow', 'sad', 'angry', 'care']
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('social', 'Post')
+    Comment = apps.get_model('social', 'Comment')
+    PostReaction = apps.get_model('social', 'PostReaction')
+    CommentReaction = apps.get_model('social', 'CommentReaction')
+    Share = apps.get_model('social', 'Share')
+
+    def reaction_map(model, field):
+        result = {}
+        rows = model.objects.values(f'{field}_id', 'type').order_by().annotate(count=Count('id'))
+        for row in rows:
+            if row['type'] in REACTION_TYPES:
+                result.setdefault(row[f'{field}_id'], {})[row['type']] = row['count']
+        return result
+
+    def count_map(model, field):
+        return dict(
+            model.objects.values(f'{field}_id').order_by().annotate(count=Count('id'))
+            .values_list(f'{field}_id', 'count')
+        )
+
+    reaction_fields = [f'{t}_count' for t in REACTION_TYPES] + ['reactions_count']
+
+    post_reactions = reaction_map(PostReaction, 'post')
+    post_comments = count_map(Comment, 'post')
+    post_shares = count_map(Share, 'post')
+    posts = list(Post.objects.all())
+    for p in posts:
+        counts = post_reactions.get(p.id, {})
+        for t in REACTION_TYPES:
+            setattr(p, f'{t}_count', counts.get(t, 0))
+        p.reactions_count = sum(counts.values())
+        p.comments_count = post_comments.get(p.id, 0)
+        p.shares_count = post_shares.get(p.id, 0)
+    Post.objects.bulk_update(posts, reaction_fields + ['comments_count', 'shares_count'], batch_size=1000)
+
+    comment_reactions = reaction_map(CommentReaction, 'comment')
+    comments = list(Comment.objects.filter(id__in=list(comment_reactions.keys())))
+    for c in comments:
+        counts = comment_reactions[c.id]
+        for t in REACTION_TYPES:
+            setattr(c, f'{t}_count', counts.get(t, 0))
+        c.reactions_count = sum(counts.values())
+    Comment.objects.bulk_update(comments, reaction_fields, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0007_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(model_name='post', name='like_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='post', name='love_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='post', name='haha_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='post', name='wow_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='post', name='sad_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='post', name='angry_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='post', name='care_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='post', name='reactions_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='post', name='comments_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='post', name='shares_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='comment', name='like_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='comment', name='love_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='comment', name='haha_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='comment', name='wow_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='comment', name='sad_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='comment', name='angry_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='comment', name='care_count', field=models.IntegerField(default=0)),
+        migrations.AddField(model_name='comment', name='reactions_count', field=models.IntegerField(default=0)),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
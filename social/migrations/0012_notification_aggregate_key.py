@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 16:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0011_notification_actor_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='aggregate_key',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Dòng thường (và dòng có trước 0010, updated_at = lúc migrate): sắp theo created_at như cũ
+    Notification = apps.get_model('social', 'Notification')
+    Notification.objects.filter(aggregate_key__isnull=True).update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0013_notification_actor'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='notification',
+            options={'ordering': ['-updated_at', '-id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='social_notif_recipient_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='social_notif_unread_idx',
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', '-updated_at', '-id'], name='social_notif_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'is_read', '-updated_at'], name='social_notif_unread_upd_idx'),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
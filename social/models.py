@@ -14,13 +14,42 @@ class MixedMediaCloudinaryStorage(MediaCloudinaryStorage):
         Ghi đè để Cloudinary tự động nhận diện là video hay image
         """
         return 'auto'
-class Post(models.Model):
+class ReactionCountersMixin(models.Model):
+    """
+    Bộ đếm reaction phi chuẩn hóa (mỗi loại 1 cột) để đọc không cần GROUP BY.
+    Được cập nhật bằng F() trong social/counters.py + social/signals.py,
+    dựng lại từ bảng gốc bằng `python manage.py rebuild_counters`.
+    """
+    like_count = models.IntegerField(default=0)
+    love_count = models.IntegerField(default=0)
+    haha_count = models.IntegerField(default=0)
+    wow_count = models.IntegerField(default=0)
+    sad_count = models.IntegerField(default=0)
+    angry_count = models.IntegerField(default=0)
+    care_count = models.IntegerField(default=0)
+    reactions_count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def get_reaction_counts(self):
+        """{type: count} giống format cũ (chỉ trả các loại > 0)"""
+        counts = {}
+        for rtype, _ in REACTION_CHOICES:
+            value = getattr(self, f"{rtype}_count")
+            if value > 0:
+                counts[rtype] = value
+        return counts
+
+class Post(ReactionCountersMixin):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="posts")
     kind = models.CharField(max_length=20, default="normal")  
     content_text = models.TextField(blank=True, null=True)
     content_medical = models.JSONField(blank=True, null=True) 
     visibility = models.CharField(max_length=20, default="public")
     created_at = models.DateTimeField(default=timezone.now)
+    comments_count = models.IntegerField(default=0)
+    shares_count = models.IntegerField(default=0)
 
 class PostMedia(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="media")
@@ -56,7 +85,7 @@ class PostReaction(models.Model):
     class Meta:
         unique_together = ("post", "user")
 
-class Comment(models.Model):
+class Comment(ReactionCountersMixin):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     parent = models.ForeignKey("self", null=True, blank=True, on_delete=models.CASCADE, related_name="replies")
@@ -102,8 +131,32 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Notification gộp (social/notifications.py): số người + vài người gần nhất [{id, name}]
+    # (danh sách đầy đủ nằm ở NotificationActor, không nằm trên dòng)
+    actor_count = models.PositiveIntegerField(default=1)
+    actor_sample = models.JSONField(default=list, blank=True)
+    # Khóa cửa sổ gộp "recipient:loại:post:comment:khung" (unique), NULL với notification thường
+    aggregate_key = models.CharField(max_length=100, null=True, blank=True, unique=True)
+    # Khóa sắp xếp danh sách: dòng gộp có người mới được đẩy lên đầu.
+    # Đổi is_read bằng .update() để không làm đổi vị trí.
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-updated_at', '-id']
+        indexes = [
+            # Danh sách (keyset theo updated_at, id) và đếm / lọc chưa đọc
+            models.Index(fields=['recipient', '-updated_at', '-id'], name='social_notif_recent_idx'),
+            models.Index(fields=['recipient', 'is_read', '-updated_at'], name='social_notif_unread_upd_idx'),
+        ]
 
     def __str__(self):
-        return f"Notif for {self.recipient}: {self.text}"
\ No newline at end of file
+        return f"Notif for {self.recipient}: {self.text}"
+
+
+class NotificationActor(models.Model):
+    """1 người đã tương tác trong 1 notification gộp -> actor_count không đếm trùng"""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actors')
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = ("notification", "actor")
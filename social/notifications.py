@@ -0,0 +1,317 @@
+from collections import Counter
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.utils import timezone
+from accounts.models import Friendship
+from .models import Notification, NotificationActor
+
+User = get_user_model()
+
+# Số notification INSERT / group_send trong 1 lượt
+FANOUT_CHUNK_SIZE = 500
+
+# Bộ đếm badge (số chưa đọc) trong cache, miss thì COUNT lại từ DB
+UNREAD_TTL = 24 * 60 * 60
+
+# Gộp notification reaction: loại -> động từ hiển thị
+AGGREGATE_TYPES = {
+    'post_react': 'đã bày tỏ cảm xúc về bài viết của bạn.',
+    'comment_react': 'đã bày tỏ cảm xúc về bình luận của bạn.',
+}
+AGGREGATE_WINDOW = timedelta(hours=6)
+ACTOR_SAMPLE_SIZE = 3
+# Dòng đã gộp chỉ đẩy socket tối đa 1 lần / PUSH_INTERVAL giây (+ 1 lần cuối cửa sổ)
+PUSH_INTERVAL = 10
+
+
+def avatar_url(user):
+    try:
+        if user.avatar:
+            return user.avatar.url
+    except Exception:
+        pass
+    return None
+
+
+def build_notification_payload(notif, sender, recipient_id, extra_data=None):
+    """Payload socket cho 1 notification (format khớp với Frontend)"""
+    sender_name = sender.get_full_name() or sender.username
+    sender_avatar = avatar_url(sender)
+    payload = {
+        'id': notif.id,
+        'type': notif.notification_type,  # post_react, new_comment...
+        'text': notif.text,
+        'created_at': notif.created_at.isoformat(),
+        'sender': {
+            'id': sender.id,
+            'name': sender_name,
+            'avatar': sender_avatar
+        },
+        'post_id': notif.post_id,
+        'comment_id': notif.comment_id,
+        'is_read': False,
+        'actor_count': notif.actor_count,
+        'actor_sample': notif.actor_sample,
+
+        # Dữ liệu bổ sung (để tương thích logic cũ của Navbar nếu cần)
+        'owner_id': recipient_id,
+        'user_id': sender.id,
+        'user_name': sender_name,
+        'user_avatar': sender_avatar,
+    }
+    if extra_data:
+        payload.update(extra_data)
+    return payload
+
+
+# =================================================================
+# BADGE - SỐ NOTIFICATION CHƯA ĐỌC (cache: notif:unread:<user_id>)
+# =================================================================
+# - Navbar chỉ cần con số: GET /notifications/unread_count/ đọc cache,
+#   không tải danh sách.
+# - Tạo notification -> incr (trong job, sau commit), mark_read -> decr,
+#   mark_all_read -> 0. Key bị mất / hết hạn -> COUNT lại (index
+#   recipient + is_read), nên lệch tạm thời cũng tự sửa sau UNREAD_TTL.
+# - Mỗi lần đổi, số mới được đẩy qua socket: {"type": "notification_badge", "count": n}
+
+def _unread_key(user_id):
+    return f"notif:unread:{user_id}"
+
+
+def count_unread(user_ids):
+    """{user_id: số chưa đọc} đếm từ DB (1 query)"""
+    counts = dict(
+        Notification.objects.filter(recipient_id__in=user_ids, is_read=False)
+        .values('recipient_id').order_by().annotate(count=Count('id'))
+        .values_list('recipient_id', 'count')
+    )
+    return {user_id: counts.get(user_id, 0) for user_id in user_ids}
+
+
+def get_unread_count(user_id):
+    count = cache.get(_unread_key(user_id))
+    if count is None:
+        count = count_unread([user_id])[user_id]
+        cache.set(_unread_key(user_id), count, UNREAD_TTL)
+    return count
+
+
+def add_unread(deltas):
+    """
+    deltas: {user_id: số notification mới}. Returns {user_id: số chưa đọc mới}.
+    Gọi sau khi notification đã commit (job), nên user bị miss đếm lại từ DB là đủ.
+    """
+    counts, missing = {}, []
+    for user_id, delta in deltas.items():
+        try:
+            counts[user_id] = cache.incr(_unread_key(user_id), delta)
+        except ValueError:
+            missing.append(user_id)
+    if missing:
+        fresh = count_unread(missing)
+        cache.set_many({_unread_key(uid): count for uid, count in fresh.items()}, UNREAD_TTL)
+        counts.update(fresh)
+    return counts
+
+
+def mark_unread_read(user_id, count=1):
+    """Đã đọc `count` notification -> trả về số chưa đọc mới"""
+    try:
+        remaining = cache.decr(_unread_key(user_id), count)
+    except ValueError:
+        return get_unread_count(user_id)
+    if remaining < 0:
+        # Cache lệch (vd. đọc trước khi job kịp incr) -> đếm lại
+        cache.delete(_unread_key(user_id))
+        return get_unread_count(user_id)
+    return remaining
+
+
+def clear_unread(user_id):
+    cache.set(_unread_key(user_id), 0, UNREAD_TTL)
+    return 0
+
+
+def badge_message(count):
+    return {'type': 'feed.notification_badge', 'count': count}
+
+
+def push_notifications(payloads, new_unread=True):
+    """
+    Gửi nhiều notification tới group user_{owner_id} trong 1 lần vào event loop
+    (thay vì mỗi người 1 lần async_to_sync), kèm số badge mới của mỗi người.
+    new_unread=False: cập nhật dòng vốn đang chưa đọc (gộp) -> badge không đổi.
+    """
+    if not payloads:
+        return
+    badges = {}
+    if new_unread:
+        try:
+            badges = add_unread(Counter(payload['owner_id'] for payload in payloads))
+        except Exception as e:
+            print(f"❌ [push_notifications] Badge counter error: {e}")
+    channel_layer = get_channel_layer()
+
+    async def _send_all():
+        for payload in payloads:
+            await channel_layer.group_send(
+                f"user_{payload['owner_id']}",
+                {'type': 'feed_notification', 'data': payload}
+            )
+        for user_id, count in badges.items():
+            await channel_layer.group_send(f"user_{user_id}", badge_message(count))
+
+    async_to_sync(_send_all)()
+
+
+# =================================================================
+# GỘP NOTIFICATION (bài / bình luận được nhiều người thả cảm xúc)
+# =================================================================
+# - Cùng (recipient, post, comment, loại) trong 1 khung AGGREGATE_WINDOW (khung
+#   cố định tính từ epoch, khóa unique aggregate_key) -> 1 dòng:
+#   "A, B và 120 người khác đã bày tỏ cảm xúc...". actor_sample giữ vài
+#   người gần nhất; mọi người đã tương tác nằm ở bảng NotificationActor
+#   (unique notification + actor) -> actor_count là số người khác nhau (bỏ /
+#   thả lại cảm xúc không đếm lại), mỗi reaction chỉ ghi O(1) trên dòng.
+# - Dòng đã đọc có người mới -> chưa đọc lại (badge +1); dòng đang chưa
+#   đọc -> badge giữ nguyên, socket chỉ đẩy tối đa 1 lần / PUSH_INTERVAL.
+#   Lần bị chặn -> hẹn 1 lần đẩy cuối cửa sổ (push_aggregated) mang trạng
+#   thái mới nhất, nên người cuối cùng trong đợt không bị mất.
+# => Số dòng / số lần push tăng theo số cửa sổ, không theo số reaction.
+
+def actor_entry(user):
+    return {'id': user.id, 'name': user.get_full_name() or user.username}
+
+
+def aggregate_text(sample, actor_count, verb):
+    names = [actor['name'] for actor in sample[:2]]
+    others = actor_count - len(names)
+    if others > 0:
+        return f"{', '.join(names)} và {others} người khác {verb}"
+    return f"{' và '.join(names)} {verb}"
+
+
+def aggregate_key(recipient_id, notification_type, post_id=None, comment_id=None, now=None):
+    """Khóa của dòng gộp trong khung AGGREGATE_WINDOW chứa `now`"""
+    now = now or timezone.now()
+    bucket = int(now.timestamp() // AGGREGATE_WINDOW.total_seconds())
+    return f"{recipient_id}:{notification_type}:{post_id or 0}:{comment_id or 0}:{bucket}"
+
+
+def upsert_aggregated(recipient_id, sender, notification_type, post_id=None, comment_id=None):
+    """
+    Thêm sender vào notification gộp (tạo mới nếu chưa có trong cửa sổ).
+
+    Returns:
+        (notif, became_unread) - became_unread: badge của recipient tăng 1
+    """
+    verb = AGGREGATE_TYPES[notification_type]
+    actor = actor_entry(sender)
+    key = aggregate_key(recipient_id, notification_type, post_id, comment_id)
+    with transaction.atomic():
+        notif = Notification.objects.select_for_update().filter(aggregate_key=key).first()
+        if notif is None:
+            try:
+                with transaction.atomic():
+                    notif = Notification.objects.create(
+                        recipient_id=recipient_id,
+                        sender=sender,
+                        notification_type=notification_type,
+                        post_id=post_id,
+                        comment_id=comment_id,
+                        actor_count=1,
+                        actor_sample=[actor],
+                        text=aggregate_text([actor], 1, verb),
+                        aggregate_key=key,
+                    )
+                    NotificationActor.objects.create(notification=notif, actor=sender)
+                return notif, True
+            except IntegrityError:
+                # Reaction đầu tiên khác vừa tạo dòng của cửa sổ này -> cộng vào dòng đó
+                notif = Notification.objects.select_for_update().get(aggregate_key=key)
+
+        others = [a for a in notif.actor_sample if a.get('id') != sender.id]
+        # Dòng đang bị khóa -> get_or_create không đua với request khác
+        _, is_new_actor = NotificationActor.objects.get_or_create(notification=notif, actor=sender)
+        if is_new_actor:
+            notif.actor_count += 1
+        notif.actor_sample = ([actor] + others)[:ACTOR_SAMPLE_SIZE]
+        notif.sender = sender
+        notif.text = aggregate_text(notif.actor_sample, notif.actor_count, verb)
+        became_unread = notif.is_read
+        notif.is_read = False
+        notif.save(update_fields=['sender', 'actor_count', 'actor_sample', 'text', 'is_read', 'updated_at'])
+    return notif, became_unread
+
+
+def should_push(notif_id):
+    """Rate limit socket cho 1 dòng gộp: True tối đa 1 lần / PUSH_INTERVAL"""
+    return cache.add(f"notif:push:{notif_id}", 1, PUSH_INTERVAL)
+
+
+def claim_trailing_push(notif_id):
+    """Lần push bị chặn: True nếu chưa có lần đẩy cuối nào được hẹn trong cửa sổ này"""
+    return cache.add(f"notif:push:trailing:{notif_id}", 1, PUSH_INTERVAL)
+
+
+def push_aggregated(notif_id):
+    """Lần đẩy cuối cửa sổ: gửi trạng thái mới nhất của dòng gộp (badge không đổi)"""
+    notif = Notification.objects.select_related('sender').filter(id=notif_id).first()
+    if notif is None or notif.is_read:
+        return
+    cache.set(f"notif:push:{notif_id}", 1, PUSH_INTERVAL)
+    push_notifications([build_notification_payload(notif, notif.sender, notif.recipient_id)], new_unread=False)
+
+
+def fan_out_new_post(post_id, author_id):
+    """
+    Tạo notification 'new_post' cho toàn bộ bạn bè của tác giả:
+    - 1 query lấy friend ids
+    - bulk_create theo từng chunk
+    - đẩy socket theo từng chunk
+    Chạy trong job queue (social.jobs.fan_out_new_post_job), không chặn request.
+    Idempotent: job chạy lại (retry) bỏ qua bạn bè đã có 'new_post' của bài này,
+    chunk đã commit ở lần trước không bị tạo / đẩy trùng.
+    """
+    try:
+        author = User.objects.get(id=author_id)
+    except User.DoesNotExist:
+        return 0
+
+    text = f"{author.username} đã đăng bài viết mới."
+    friend_ids = Friendship.friend_ids_of(author_id)
+    total = 0
+    for start in range(0, len(friend_ids), FANOUT_CHUNK_SIZE):
+        chunk = friend_ids[start:start + FANOUT_CHUNK_SIZE]
+        existing = Notification.objects.filter(post_id=post_id, notification_type='new_post', recipient_id__in=chunk)
+        done = set(existing.values_list('recipient_id', flat=True))
+        chunk = [friend_id for friend_id in chunk if friend_id not in done]
+        if not chunk:
+            continue
+        notifs = Notification.objects.bulk_create([
+            Notification(
+                recipient_id=friend_id,
+                sender_id=author_id,
+                notification_type='new_post',
+                text=text,
+                post_id=post_id,
+            )
+            for friend_id in chunk
+        ])
+        if any(n.pk is None for n in notifs):
+            # MySQL: bulk_create không trả id -> đọc lại để payload có id thật
+            notifs = list(Notification.objects.filter(post_id=post_id, notification_type='new_post', recipient_id__in=chunk))
+        total += len(notifs)
+        try:
+            push_notifications([
+                build_notification_payload(n, author, n.recipient_id) for n in notifs
+            ])
+        except Exception as e:
+            print(f"❌ [fan_out_new_post] Socket push error: {e}")
+    return total
+
@@ -0,0 +1,70 @@
+import base64
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# =================================================================
+# KEYSET (CURSOR) PAGINATION - phân trang theo (created_at, id)
+# =================================================================
+# Cursor là chuỗi base64 "mờ" (opaque) để client chỉ việc gửi lại,
+# không cần biết bên trong chứa gì. Sắp xếp luôn là (-created_at, -id)
+# nên trang sau chỉ cần điều kiện "nhỏ hơn" cặp khóa cuối của trang trước.
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+
+
+class InvalidCursor(ValueError):
+    """Cursor không giải mã được (client gửi bậy hoặc đã bị sửa)"""
+
+
+def encode_cursor(created_at, pk):
+    raw = json.dumps({"t": created_at.isoformat(), "id": pk}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        created_at = parse_datetime(data["t"])
+        pk = int(data["id"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    if created_at is None:
+        raise InvalidCursor(cursor)
+    return created_at, pk
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Đọc ?limit=..., luôn bị chặn trong khoảng [1, maximum]"""
+    try:
+        size = int(request.query_params.get("limit", default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+def paginate_keyset(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE, time_field="created_at"):
+    """
+    Cắt 1 trang từ queryset theo keyset (time_field, id) giảm dần.
+
+    Returns:
+        (items, next_cursor) - next_cursor là None nếu đã hết dữ liệu
+    """
+    queryset = queryset.order_by(f"-{time_field}", "-id")
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f"{time_field}__lt": created_at}) |
+            Q(**{time_field: created_at, "id__lt": pk})
+        )
+
+    # Lấy dư 1 dòng để biết còn trang sau hay không (khỏi phải COUNT)
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, time_field), last.id)
+    return items, next_cursor
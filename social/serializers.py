@@ -95,12 +95,15 @@ class CommentSerializer(serializers.ModelSerializer):
     reaction_counts = serializers.SerializerMethodField()  
     reaction = serializers.SerializerMethodField()
     replies = serializers.SerializerMethodField()
+    replies_count = serializers.SerializerMethodField()
+    has_more_replies = serializers.SerializerMethodField()
     
     class Meta:
         model = Comment
         fields = [
             "id", "user", "author_id", "avatar", "text", "time", 
-            "likes", "reaction_counts", "reaction", "replies"      
+            "likes", "reaction_counts", "reaction", "replies",
+            "replies_count", "has_more_replies", "parent"
         ]
     
     def get_user(self, o):
@@ -115,14 +118,13 @@ class CommentSerializer(serializers.ModelSerializer):
             return None
     
     def get_likes(self, o):
-        """Tổng số reactions (tất cả loại)"""
-        return o.reactions.count()
+        """Tổng số reactions (tất cả loại) - đọc từ bộ đếm"""
+        return o.reactions_count
     
     #  Đếm reactions theo từng loại
     def get_reaction_counts(self, o):
         """Trả về số lượng reactions theo từng loại"""
-        agg = o.reactions.values("type").order_by().annotate(count=models.Count("id"))
-        return {x["type"]: x["count"] for x in agg}
+        return o.get_reaction_counts()
     
     # Trả về đúng icon/label
     def get_reaction(self, o):
@@ -130,23 +132,39 @@ class CommentSerializer(serializers.ModelSerializer):
         req = self.context.get("request")
         if not req or not req.user.is_authenticated:
             return None
-        
-        r = o.reactions.filter(user=req.user).first()
-        if not r:
+
+        # CommentTree đã lấy sẵn reaction của viewer cho cả post
+        if hasattr(o, "viewer_reaction"):
+            rtype = o.viewer_reaction
+        else:
+            r = o.reactions.filter(user=req.user).first()
+            rtype = r.type if r else None
+        if not rtype:
             return None
         
-        display = get_reaction_display(r.type)
+        display = get_reaction_display(rtype)
         return {
-            "type": r.type,
+            "type": rtype,
             "icon": display['icon'],
             "label": display['label']
         }
     
     def get_replies(self, o):
         """Nested replies (comments con)"""
-        children = o.replies.order_by("created_at")
+        if hasattr(o, "tree_children"):
+            children = o.tree_children
+        else:
+            children = o.replies.order_by("created_at")
         return CommentSerializer(children, many=True, context=self.context).data
 
+    def get_replies_count(self, o):
+        if hasattr(o, "replies_count"):
+            return o.replies_count
+        return o.replies.count()
+
+    def get_has_more_replies(self, o):
+        return getattr(o, "has_more_replies", False)
+
 
 class PostSerializer(serializers.ModelSerializer):
     author = UserBasicSerializer(read_only=True)
@@ -161,7 +179,7 @@ class PostSerializer(serializers.ModelSerializer):
     #  Trả về string đơn giản ("like", "love"...) để khớp với logic Frontend
     user_reaction = serializers.SerializerMethodField() 
     
-    comments_count = serializers.IntegerField(source="comments.count", read_only=True)
+    comments_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Post
@@ -177,14 +195,18 @@ class PostSerializer(serializers.ModelSerializer):
         return o.content_medical if o.kind == "medical" else (o.content_text or "")
     
     def get_reaction_counts(self, o):
-        agg = o.reactions.values("type").order_by().annotate(count=models.Count("id"))
-        return {x["type"]: x["count"] for x in agg}
+        # Đọc từ bộ đếm phi chuẩn hóa trên Post (không GROUP BY)
+        return o.get_reaction_counts()
     
     # Hàm mới: Trả về string reaction type 
     def get_user_reaction(self, o):
         req = self.context.get("request")
         if not req or not req.user.is_authenticated:
             return None
+
+        # Feed đã tính sẵn cho cả trang (xem PostViewSet._attach_feed_stats)
+        if hasattr(o, "feed_user_reaction"):
+            return o.feed_user_reaction
         
         # Cách tối ưu: Tìm trong prefetch (nếu view đã prefetch)
         # Nếu view chưa prefetch, nó sẽ query DB (chấp nhận được với số lượng nhỏ)
@@ -210,10 +232,23 @@ class PostSerializer(serializers.ModelSerializer):
             "icon": display['icon'],
             "label": display['label']
         }
+class NotificationSenderSerializer(UserBasicSerializer):
+    """Như UserBasicSerializer nhưng avatar trả thẳng URL lưu trữ (Cloudinary), không build_absolute_uri mỗi dòng"""
+
+    def get_avatar(self, obj):
+        try:
+            return obj.avatar.url if obj.avatar else None
+        except Exception:
+            return None
+
+
 class NotificationSerializer(serializers.ModelSerializer):
-    # Sử dụng UserBasicSerializer để hiển thị thông tin người gửi gọn nhẹ
-    sender = UserBasicSerializer(read_only=True)
+    # Thông tin người gửi gọn nhẹ (sender đã select_related trong view)
+    sender = NotificationSenderSerializer(read_only=True)
     
     class Meta:
         model = Notification
-        fields = ['id', 'sender', 'notification_type', 'post', 'comment', 'text','is_read', 'created_at']
\ No newline at end of file
+        fields = [
+            'id', 'sender', 'notification_type', 'post', 'comment', 'text', 'is_read', 'created_at',
+            'actor_count', 'actor_sample', 'updated_at'
+        ]
\ No newline at end of file
@@ -0,0 +1,53 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Post, PostReaction, Comment, CommentReaction, Share
+from .counters import bump, reaction_deltas
+
+# =================================================================
+# GIỮ BỘ ĐẾM PHI CHUẨN HÓA KHỚP VỚI BẢNG GỐC
+# =================================================================
+# post_delete cũng chạy cho các dòng bị xóa dây chuyền (CASCADE),
+# nên xóa user / comment cha vẫn trừ đúng bộ đếm.
+
+@receiver(post_save, sender=PostReaction)
+def post_reaction_created(sender, instance, created, **kwargs):
+    if created:
+        bump(Post, instance.post_id, **reaction_deltas(None, instance.type))
+
+
+@receiver(post_delete, sender=PostReaction)
+def post_reaction_deleted(sender, instance, **kwargs):
+    bump(Post, instance.post_id, **reaction_deltas(instance.type, None))
+
+
+@receiver(post_save, sender=CommentReaction)
+def comment_reaction_created(sender, instance, created, **kwargs):
+    if created:
+        bump(Comment, instance.comment_id, **reaction_deltas(None, instance.type))
+
+
+@receiver(post_delete, sender=CommentReaction)
+def comment_reaction_deleted(sender, instance, **kwargs):
+    bump(Comment, instance.comment_id, **reaction_deltas(instance.type, None))
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        bump(Post, instance.post_id, comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump(Post, instance.post_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Share)
+def share_created(sender, instance, created, **kwargs):
+    if created:
+        bump(Post, instance.post_id, shares_count=1)
+
+
+@receiver(post_delete, sender=Share)
+def share_deleted(sender, instance, **kwargs):
+    bump(Post, instance.post_id, shares_count=-1)
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+
+# =================================================================
+# TOPIC SUBSCRIPTIONS - fan-out theo mối quan tâm thay vì mọi kết nối
+# =================================================================
+# - public_feed        : chỉ sự kiện thật sự toàn cục (bài viết mới).
+# - post_<id>          : mọi thay đổi của 1 bài (sửa/xóa, reaction, comment,
+#                        share, typing bình luận). Client subscribe các bài
+#                        đang hiển thị trên màn hình.
+# - author_<id>        : thay đổi trên bài của 1 tác giả (trang cá nhân).
+#
+# Mỗi socket giới hạn số topic; vượt giới hạn thì bỏ topic cũ nhất
+# (bài đã cuộn qua lâu nhất).
+# Socket theo dõi cả post_<id> lẫn author_<tác giả> sẽ nhận 2 bản của cùng
+# sự kiện -> FeedConsumer bỏ bản đến qua author_<id> (xem is_duplicate).
+
+GLOBAL_GROUP = "public_feed"
+MAX_POST_SUBSCRIPTIONS = 100
+MAX_AUTHOR_SUBSCRIPTIONS = 50
+
+# Sự kiện gửi cho public_feed; còn lại chỉ tới group của bài / tác giả
+GLOBAL_EVENTS = {"new_post"}
+
+
+def post_group(post_id):
+    return f"post_{int(post_id)}"
+
+
+def author_group(author_id):
+    return f"author_{int(author_id)}"
+
+
+def broadcast_groups(event_type, post_id=None, author_id=None):
+    """Các group nhận 1 sự kiện feed"""
+    if event_type in GLOBAL_EVENTS:
+        return [GLOBAL_GROUP]
+    groups = []
+    if post_id is not None:
+        groups.append(post_group(post_id))
+    if author_id is not None:
+        groups.append(author_group(author_id))
+    return groups
+
+
+def _parse_ids(values):
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    ids = []
+    for value in values:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+class SubscriptionRegistry:
+    """Topic của 1 socket. Trả về group cần join/leave, consumer tự gọi channel layer"""
+
+    LIMITS = {"post": MAX_POST_SUBSCRIPTIONS, "author": MAX_AUTHOR_SUBSCRIPTIONS}
+    GROUPS = {"post": post_group, "author": author_group}
+
+    def __init__(self):
+        self._topics = {kind: OrderedDict() for kind in self.LIMITS}
+
+    def subscribe(self, kind, values):
+        """Returns (groups_to_add, groups_to_discard)"""
+        topics = self._topics[kind]
+        to_group = self.GROUPS[kind]
+        added, removed = [], []
+        for topic_id in _parse_ids(values):
+            if topic_id in topics:
+                topics.move_to_end(topic_id)
+                continue
+            topics[topic_id] = True
+            added.append(to_group(topic_id))
+            if len(topics) > self.LIMITS[kind]:
+                evicted, _ = topics.popitem(last=False)
+                removed.append(to_group(evicted))
+        # Topic vừa thêm rồi bị đẩy ra ngay trong cùng lô: không cần join
+        dropped = set(added) & set(removed)
+        return [g for g in added if g not in dropped], [g for g in removed if g not in dropped]
+
+    def unsubscribe(self, kind, values):
+        topics = self._topics[kind]
+        removed = []
+        for topic_id in _parse_ids(values):
+            if topics.pop(topic_id, None) is not None:
+                removed.append(self.GROUPS[kind](topic_id))
+        return removed
+
+    def has_post(self, post_id):
+        try:
+            return int(post_id) in self._topics["post"]
+        except (TypeError, ValueError):
+            return False
+
+    def groups(self):
+        return [self.GROUPS[kind](topic_id) for kind, topics in self._topics.items() for topic_id in topics]
+
+    def is_duplicate(self, group, post_id):
+        """Sự kiện đến qua author_<id> nhưng socket cũng đang theo dõi post_<id>"""
+        return bool(group) and group.startswith("author_") and post_id is not None and self.has_post(post_id)
@@ -1,3 +1,303 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .comment_tree import CommentTree
+from .counters import set_post_reaction, set_comment_reaction, rebuild_post_counters
+from .jobs import push_aggregated_job, push_notifications_job
+from .models import Post, PostReaction, Comment, Share, Notification, NotificationActor
+from .notifications import AGGREGATE_WINDOW, upsert_aggregated
 
-# Create your tests here.
+User = get_user_model()
+
+
+def make_user(name):
+    return User.objects.create_user(username=name, email=f"{name}@example.com")
+
+
+# =================================================================
+# BỘ ĐẾM PHI CHUẨN HÓA (social/counters.py, social/signals.py)
+# =================================================================
+class CounterTests(TestCase):
+    def setUp(self):
+        self.author = make_user("author")
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.post = Post.objects.create(author=self.author, content_text="hello")
+
+    def counters(self):
+        return Post.objects.values(
+            "reactions_count", "like_count", "love_count", "comments_count", "shares_count"
+        ).get(pk=self.post.pk)
+
+    def test_reaction_add_switch_remove(self):
+        set_post_reaction(self.post.id, self.alice, "like")
+        _, counts = set_post_reaction(self.post.id, self.bob, "like")
+        self.assertEqual(counts, {"like": 2})
+
+        # Đổi loại: chuyển bộ đếm, tổng không đổi
+        old_type, counts = set_post_reaction(self.post.id, self.alice, "love")
+        self.assertEqual(old_type, "like")
+        self.assertEqual(counts, {"like": 1, "love": 1})
+        self.assertEqual(self.counters()["reactions_count"], 2)
+
+        # Thả lại đúng loại cũ: không đếm trùng
+        set_post_reaction(self.post.id, self.alice, "love")
+        self.assertEqual(self.counters()["reactions_count"], 2)
+
+        old_type, counts = set_post_reaction(self.post.id, self.alice, None)
+        self.assertEqual(old_type, "love")
+        self.assertEqual(counts, {"like": 1})
+        self.assertEqual(self.counters()["reactions_count"], 1)
+
+    def test_invalid_reaction_type(self):
+        with self.assertRaises(ValueError):
+            set_post_reaction(self.post.id, self.alice, "meh")
+        self.assertEqual(self.counters()["reactions_count"], 0)
+
+    def test_comment_and_share_counters_follow_cascade(self):
+        root = Comment.objects.create(post=self.post, author=self.alice, text="root")
+        Comment.objects.create(post=self.post, author=self.bob, text="reply", parent=root)
+        Share.objects.create(post=self.post, user=self.bob)
+        set_comment_reaction(root.id, self.bob, "haha")
+        self.assertEqual(self.counters()["comments_count"], 2)
+        self.assertEqual(self.counters()["shares_count"], 1)
+        self.assertEqual(Comment.objects.get(pk=root.pk).reactions_count, 1)
+
+        # Xóa comment cha -> reply bị xóa dây chuyền cũng được trừ
+        root.delete()
+        self.assertEqual(self.counters()["comments_count"], 0)
+
+        # Xóa user -> reaction / share của user bị xóa dây chuyền
+        set_post_reaction(self.post.id, self.bob, "like")
+        self.bob.delete()
+        counters = self.counters()
+        self.assertEqual((counters["reactions_count"], counters["like_count"], counters["shares_count"]), (0, 0, 0))
+
+    def test_rebuild_fixes_drift(self):
+        set_post_reaction(self.post.id, self.alice, "like")
+        Comment.objects.create(post=self.post, author=self.bob, text="hi")
+        # Lệch do ghi thẳng DB (bỏ qua signal)
+        Post.objects.filter(pk=self.post.pk).update(reactions_count=42, like_count=0, comments_count=7)
+        PostReaction.objects.bulk_create([PostReaction(post=self.post, user=self.bob, type="love")])
+
+        self.assertEqual(rebuild_post_counters(batch_size=1), 1)
+        counters = self.counters()
+        self.assertEqual(counters["reactions_count"], 2)
+        self.assertEqual((counters["like_count"], counters["love_count"]), (1, 1))
+        self.assertEqual(counters["comments_count"], 1)
+
+    def test_rebuild_command(self):
+        Post.objects.filter(pk=self.post.pk).update(shares_count=3)
+        call_command("rebuild_counters", stdout=StringIO())
+        self.assertEqual(self.counters()["shares_count"], 0)
+
+
+# =================================================================
+# CÂY BÌNH LUẬN (social/comment_tree.py, CommentViewSet.list)
+# =================================================================
+class CommentTreeTests(TestCase):
+    def setUp(self):
+        self.viewer = make_user("viewer")
+        self.post = Post.objects.create(author=self.viewer, content_text="post")
+        self.roots = [Comment.objects.create(post=self.post, author=self.viewer, text=f"root {i}") for i in range(5)]
+        # root 0 -> a -> b -> c (nhánh sâu 3 tầng reply)
+        parent = self.roots[0]
+        self.chain = []
+        for name in ("a", "b", "c"):
+            parent = Comment.objects.create(post=self.post, author=self.viewer, text=name, parent=parent)
+            self.chain.append(parent)
+        set_comment_reaction(self.chain[0].id, self.viewer, "love")
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def list(self, **params):
+        return self.client.get("/api/social/comments/", {"post": self.post.id, **params})
+
+    def test_root_pages_follow_cursor(self):
+        tree = CommentTree(self.post.id)
+        seen, cursor = [], None
+        while True:
+            nodes, cursor = tree.page(cursor=cursor, limit=2)
+            seen += [n.id for n in nodes]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [c.id for c in self.roots])
+
+    def test_unknown_cursor_returns_empty_page(self):
+        nodes, cursor = CommentTree(self.post.id).page(cursor=self.chain[0].id, limit=2)
+        self.assertEqual((nodes, cursor), ([], None))
+
+    def test_depth_cut_marks_more_replies(self):
+        nodes, _ = CommentTree(self.post.id).page(limit=1, max_depth=2)
+        root = nodes[0]
+        self.assertEqual([n.id for n in root.tree_children], [self.chain[0].id])
+        cut = root.tree_children[0]
+        self.assertEqual(cut.tree_children, [])
+        self.assertTrue(cut.has_more_replies)
+        self.assertEqual(cut.replies_count, 1)
+
+    def test_paged_endpoint_query_count(self):
+        # Chỉ 2 query: comment của post + reaction của viewer
+        with self.assertNumQueries(2):
+            response = self.list(limit=2, depth=2)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([c["id"] for c in body["results"]], [c.id for c in self.roots[:2]])
+        self.assertEqual(body["next_cursor"], self.roots[1].id)
+        first = body["results"][0]
+        self.assertEqual(first["replies"][0]["reaction"]["type"], "love")
+        self.assertTrue(first["replies"][0]["has_more_replies"])
+
+    def test_lazy_load_branch(self):
+        body = self.list(parent=self.chain[0].id, depth=5).json()
+        self.assertEqual([c["id"] for c in body["results"]], [self.chain[1].id])
+        self.assertEqual(body["results"][0]["replies"][0]["id"], self.chain[2].id)
+        self.assertIsNone(body["next_cursor"])
+
+    def test_legacy_full_tree_shape(self):
+        body = self.list().json()
+        self.assertIsInstance(body, list)
+        self.assertEqual(len(body), 5)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.list(limit="x").status_code, 400)
+        self.assertEqual(self.list(parent=999999).status_code, 404)
+
+
+# =================================================================
+# GỘP NOTIFICATION REACTION (social/notifications.py)
+# =================================================================
+class AggregatedNotificationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user("owner")
+        self.fans = [make_user(f"fan{i}") for i in range(5)]
+        self.post = Post.objects.create(author=self.owner, content_text="post")
+
+    def react(self, user, post=None):
+        return upsert_aggregated(self.owner.id, user, "post_react", post_id=(post or self.post).id)
+
+    def test_one_row_per_window_counting_distinct_actors(self):
+        for fan in self.fans + self.fans[:2]:
+            notif, _ = self.react(fan)
+        notif.refresh_from_db()
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(notif.actor_count, 5)
+        self.assertEqual(NotificationActor.objects.filter(notification=notif).count(), 5)
+        # Người gần nhất lên đầu, mẫu tối đa 3 người
+        self.assertEqual([a["id"] for a in notif.actor_sample], [self.fans[1].id, self.fans[0].id, self.fans[4].id])
+        self.assertEqual(notif.text, "fan1, fan0 và 3 người khác đã bày tỏ cảm xúc về bài viết của bạn.")
+
+    def test_separate_rows_per_target_and_window(self):
+        other_post = Post.objects.create(author=self.owner, content_text="other")
+        self.react(self.fans[0])
+        self.react(self.fans[0], post=other_post)
+        later = timezone.now() + AGGREGATE_WINDOW
+        with mock.patch("social.notifications.timezone.now", return_value=later):
+            self.react(self.fans[0])
+        self.assertEqual(Notification.objects.count(), 3)
+
+    def test_read_row_becomes_unread_again(self):
+        notif, became_unread = self.react(self.fans[0])
+        self.assertTrue(became_unread)
+        _, became_unread = self.react(self.fans[1])
+        self.assertFalse(became_unread)
+        Notification.objects.filter(pk=notif.pk).update(is_read=True)
+        notif, became_unread = self.react(self.fans[2])
+        self.assertTrue(became_unread)
+        self.assertFalse(notif.is_read)
+
+    def test_concurrent_first_reaction_joins_existing_row(self):
+        first, _ = self.react(self.fans[0])
+        # Request song song không thấy dòng ở lần đọc đầu -> insert đụng unique aggregate_key
+        with mock.patch("django.db.models.query.QuerySet.first", return_value=None):
+            notif, _ = self.react(self.fans[1])
+        self.assertEqual(notif.pk, first.pk)
+        self.assertEqual(Notification.objects.get(pk=first.pk).actor_count, 2)
+
+    def test_bumped_row_moves_to_top_of_list(self):
+        aggregated, _ = self.react(self.fans[0])
+        Notification.objects.create(recipient=self.owner, sender=self.fans[1], notification_type="new_comment",
+                                    text="comment", post=self.post)
+        self.react(self.fans[2])
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        body = client.get("/api/social/notifications/", {"limit": 10}).json()
+        self.assertEqual(body["results"][0]["id"], aggregated.id)
+
+    def test_socket_push_is_throttled_with_one_trailing_push(self):
+        client = APIClient()
+        with mock.patch.object(push_notifications_job, "delay") as push, \
+                mock.patch.object(push_aggregated_job, "delay_in") as trailing:
+            for fan in self.fans[:3]:
+                client.force_authenticate(fan)
+                self.assertEqual(client.post(f"/api/social/posts/{self.post.id}/reactions/", {"type": "like"}).status_code, 200)
+        self.assertEqual(push.call_count, 1)
+        trailing.assert_called_once()
+        self.assertEqual(Notification.objects.get().actor_count, 3)
+
+    def test_own_reaction_does_not_notify(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        client.post(f"/api/social/posts/{self.post.id}/reactions/", {"type": "like"})
+        self.assertFalse(Notification.objects.exists())
+
+
+# =================================================================
+# DANH SÁCH + BADGE NOTIFICATION (NotificationViewSet)
+# =================================================================
+class NotificationListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user("owner")
+        self.sender = make_user("sender")
+        self.notifs = [
+            Notification.objects.create(recipient=self.owner, sender=self.sender, notification_type="new_comment",
+                                        text=str(i), is_read=i < 2)
+            for i in range(5)
+        ]
+        Notification.objects.create(recipient=self.sender, sender=self.owner, notification_type="new_comment", text="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def get(self, **params):
+        return self.client.get("/api/social/notifications/", params)
+
+    def test_plain_request_keeps_bare_list(self):
+        body = self.get().json()
+        self.assertIsInstance(body, list)
+        self.assertEqual([n["id"] for n in body], [n.id for n in reversed(self.notifs)])
+        self.assertEqual(len(self.get(unread=1).json()), 3)
+
+    def test_cursor_pages_cover_everything_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            body = self.get(**params).json()
+            seen += [n["id"] for n in body["results"]]
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [n.id for n in reversed(self.notifs)])
+        self.assertEqual(self.get(cursor="garbage").status_code, 400)
+
+    def test_unread_badge(self):
+        url = "/api/social/notifications/"
+        self.assertEqual(self.client.get(f"{url}unread_count/").json()["count"], 3)
+        with mock.patch("social.views.group_send_many.delay"):
+            self.assertEqual(self.client.post(f"{url}{self.notifs[4].id}/mark_read/").json()["count"], 2)
+            # Đọc lại dòng đã đọc: badge không trừ thêm
+            self.assertEqual(self.client.post(f"{url}{self.notifs[4].id}/mark_read/").json()["count"], 2)
+            self.assertEqual(self.client.post(f"{url}mark_all_read/").json()["count"], 0)
+        self.assertFalse(Notification.objects.filter(recipient=self.owner, is_read=False).exists())
+
+    def test_badge_recounts_when_cache_is_lost(self):
+        self.client.get("/api/social/notifications/unread_count/")
+        cache.clear()
+        self.assertEqual(self.client.get("/api/social/notifications/unread_count/").json()["count"], 3)
@@ -2,13 +2,18 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db import transaction
-from django.db.models import Count 
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import Post, PostMedia, PostReaction, Comment, CommentReaction, Share, Notification
+from .models import Post, PostMedia, PostReaction, Comment, Share, Notification
 from .serializers import PostSerializer, CommentSerializer, UserBasicSerializer, NotificationSerializer
-from django.db.models import Q
-from accounts.models import Friendship  
+from .pagination import paginate_keyset, get_page_size, InvalidCursor
+from .counters import set_post_reaction, set_comment_reaction, is_valid_reaction
+from .comment_tree import CommentTree, DEFAULT_ROOT_LIMIT, MAX_ROOT_LIMIT
+from .notifications import (
+    avatar_url, build_notification_payload, get_unread_count, mark_unread_read, clear_unread, badge_message,
+    AGGREGATE_TYPES, PUSH_INTERVAL, upsert_aggregated, should_push, claim_trailing_push
+)
+from .jobs import fan_out_new_post_job, push_notifications_job, push_aggregated_job, broadcast_feed_event_job
+from core.jobs import group_send_many
+from .subscriptions import broadcast_groups
 # =================================================================
 # 1. BASE CLASS (MIXIN) - Chứa logic chung để tái sử dụng
 # =================================================================
@@ -19,20 +24,18 @@ class BaseBroadcastViewSet(viewsets.GenericViewSet):
     """
 
     def _get_avatar_url(self, user):
-        try:
-            if user.avatar:
-                return user.avatar.url
-        except:
-            pass
-        return None
-
-    def _broadcast(self, event_type, data):
-        """Gửi tin nhắn tới kênh chung (Public Feed) để cập nhật UI cho mọi người"""
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            'public_feed',
-            {'type': 'feed_update', 'data': {'event': event_type, **data}}
-        )
+        return avatar_url(user)
+
+    def _broadcast(self, event_type, data, post_id=None, author_id=None):
+        """
+        Gửi sự kiện feed tới các topic liên quan (social/subscriptions.py):
+        bài mới -> public_feed, còn lại -> post_<id> + author_<id>.
+        Sự kiện được ghi vào event log (social/event_log.py) để client reconnect phát lại.
+        """
+        groups = broadcast_groups(event_type, post_id=post_id, author_id=author_id)
+        # Đẩy qua job queue: chạy sau commit, request không phải chờ Redis
+        if groups:
+            broadcast_feed_event_job.delay(list(groups), {'event': event_type, **data})
 
     def create_notification(self, recipient, sender, type, text, post=None, comment=None, extra_data=None):
         """
@@ -44,6 +47,20 @@ class BaseBroadcastViewSet(viewsets.GenericViewSet):
         if recipient.id == sender.id:
             return
 
+        if type in AGGREGATE_TYPES:
+            # Reaction: gộp vào 1 dòng theo (recipient, post, comment, loại), push có rate limit
+            notif, became_unread = upsert_aggregated(
+                recipient.id, sender, type,
+                post_id=post.id if post else None,
+                comment_id=comment.id if comment else None
+            )
+            if should_push(notif.id) or became_unread:
+                socket_payload = build_notification_payload(notif, sender, recipient.id, extra_data)
+                push_notifications_job.delay([socket_payload], new_unread=became_unread)
+            elif claim_trailing_push(notif.id):
+                push_aggregated_job.delay_in(PUSH_INTERVAL, notif.id)
+            return
+
         # A. Lưu vào DB
         notif = Notification.objects.create(
             recipient=recipient,
@@ -55,37 +72,11 @@ class BaseBroadcastViewSet(viewsets.GenericViewSet):
         )
 
         # B. Chuẩn bị dữ liệu Socket (Format khớp với Frontend)
-        socket_payload = {
-            'id': notif.id,
-            'type': type, # post_react, new_comment...
-            'text': text,
-            'created_at': notif.created_at.isoformat(),
-            'sender': {
-                'id': sender.id,
-                'name': sender.get_full_name() or sender.username,
-                'avatar': self._get_avatar_url(sender)
-            },
-            'post_id': post.id if post else None,
-            'comment_id': comment.id if comment else None,
-            'is_read': False,
-            
-            # Dữ liệu bổ sung (để tương thích logic cũ của Navbar nếu cần)
-            'owner_id': recipient.id, 
-            'user_id': sender.id,
-            'user_name': sender.get_full_name() or sender.username,
-            'user_avatar': self._get_avatar_url(sender),
-        }
-        
-        if extra_data:
-            socket_payload.update(extra_data)
+        socket_payload = build_notification_payload(notif, sender, recipient.id, extra_data)
 
-        # C. Gửi WebSocket tới GROUP RIÊNG của user (user_{id})
+        # C. Gửi WebSocket tới GROUP RIÊNG của user (user_{id}) qua job queue
         # Lưu ý: Cần đảm bảo consumers.py đã join user vào group này
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'user_{recipient.id}', 
-            {'type': 'feed_notification', 'data': socket_payload} 
-        )
+        push_notifications_job.delay([socket_payload])
 
 # =================================================================
 # 2. NOTIFICATION VIEWSET - API lấy danh sách thông báo
@@ -95,19 +86,59 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user).select_related('sender')
+
+    def list(self, request, *args, **kwargs):
+        """
+        GET /api/social/notifications/[?unread=1]
+            -> toàn bộ list (giữ format cũ cho dropdown hiện tại)
+        GET /api/social/notifications/?limit=20[&cursor=<next_cursor>][&unread=1]
+            -> {results, next_cursor}: phân trang bằng cursor (updated_at, id),
+               dòng gộp vừa có người mới lên đầu.
+        """
+        queryset = self.get_queryset()
+        if request.query_params.get('unread') in ('1', 'true'):
+            queryset = queryset.filter(is_read=False)
+        if 'cursor' not in request.query_params and 'limit' not in request.query_params:
+            return Response(self.get_serializer(queryset.order_by('-updated_at', '-id'), many=True).data)
+        try:
+            notifs, next_cursor = paginate_keyset(
+                queryset,
+                cursor=request.query_params.get('cursor'),
+                page_size=get_page_size(request, default=20),
+                time_field='updated_at',
+            )
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=400)
+
+        serializer = self.get_serializer(notifs, many=True)
+        return Response({"results": serializer.data, "next_cursor": next_cursor})
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        """Số cho badge trên Navbar (cache, không tải danh sách)"""
+        return Response({'count': get_unread_count(request.user.id)})
 
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
-        self.get_queryset().filter(is_read=False).update(is_read=True)
-        return Response({'status': 'ok'})
+        Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+        count = clear_unread(request.user.id)
+        self._push_badge(request.user.id, count)
+        return Response({'status': 'ok', 'count': count})
     
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         notif = self.get_object()
-        notif.is_read = True
-        notif.save()
-        return Response({'status': 'ok'})
+        # Chỉ trừ badge nếu thực sự chuyển từ chưa đọc -> đã đọc
+        updated = Notification.objects.filter(pk=notif.pk, is_read=False).update(is_read=True)
+        count = mark_unread_read(request.user.id) if updated else get_unread_count(request.user.id)
+        if updated:
+            self._push_badge(request.user.id, count)
+        return Response({'status': 'ok', 'count': count})
+
+    def _push_badge(self, user_id, count):
+        # Đồng bộ badge cho các tab khác của user
+        group_send_many.delay([[f'user_{user_id}', badge_message(count)]])
 
 # =================================================================
 # 3. POST VIEWSET - Kế thừa từ BaseBroadcastViewSet
@@ -116,17 +147,64 @@ class PostViewSet(BaseBroadcastViewSet, viewsets.ModelViewSet):
     queryset = (
         Post.objects
         .select_related("author")
-        .prefetch_related("media", "reactions", "comments")
+        .prefetch_related("media", "reactions")
         .order_by("-created_at")
     )
     serializer_class = PostSerializer
 
     def get_permissions(self):
-        return [permissions.AllowAny()] if self.action in ["list", "retrieve"] else [permissions.IsAuthenticated()]
+        return [permissions.AllowAny()] if self.action in ["list", "retrieve", "feed"] else [permissions.IsAuthenticated()]
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=False, methods=["get"], url_path="feed")
+    def feed(self, request):
+        """
+        Feed phân trang bằng cursor (created_at, id).
+        GET /api/social/posts/feed/?limit=10&cursor=<next_cursor>
+
+        Số query cố định cho mỗi trang: reaction/comment lấy từ bộ đếm
+        trên Post, chỉ reaction của viewer là cần thêm 1 query.
+        """
+        queryset = (
+            Post.objects
+            .select_related("author")
+            .prefetch_related("media")
+        )
+        try:
+            posts, next_cursor = paginate_keyset(
+                queryset,
+                cursor=request.query_params.get("cursor"),
+                page_size=get_page_size(request),
+            )
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=400)
+
+        self._attach_feed_stats(posts, request.user)
+        serializer = self.get_serializer(posts, many=True)
+        return Response({"results": serializer.data, "next_cursor": next_cursor})
+
+    def _attach_feed_stats(self, posts, user):
+        """
+        Lấy reaction của viewer cho cả trang trong 1 query rồi gắn vào từng
+        object để PostSerializer khỏi query lại từng dòng.
+        (reaction_counts / comments_count đã nằm sẵn trên Post)
+        """
+        post_ids = [p.id for p in posts]
+        if not post_ids:
+            return
+
+        viewer_reactions = {}
+        if user and user.is_authenticated:
+            viewer_reactions = dict(
+                PostReaction.objects.filter(post_id__in=post_ids, user=user)
+                .values_list("post_id", "type")
+            )
+
+        for p in posts:
+            p.feed_user_reaction = viewer_reactions.get(p.id)
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context.update({"request": self.request})
@@ -160,24 +238,8 @@ class PostViewSet(BaseBroadcastViewSet, viewsets.ModelViewSet):
             'user_id': request.user.id,
             'user_name': request.user.get_full_name() or request.user.username
         })
-        try:
-            friendships = Friendship.objects.filter(
-                (Q(from_user=request.user) | Q(to_user=request.user)) & 
-                Q(status='accepted')
-            )
-            for f in friendships:
-               
-                friend = f.to_user if f.from_user == request.user else f.from_user
-                
-                self.create_notification(
-                    recipient=friend, 
-                    sender=request.user, 
-                    type='new_post', 
-                    text=f"{request.user.username} đã đăng bài viết mới.", 
-                    post=p
-                )
-        except Exception as e:
-            print(f"❌ Error notifying friends: {e}")
+        # Báo cho bạn bè: bulk INSERT + đẩy socket theo lô, chạy sau commit trong job queue
+        fan_out_new_post_job.delay(p.id, request.user.id)
 
         return Response(post_data, status=201)
 
@@ -196,7 +258,7 @@ class PostViewSet(BaseBroadcastViewSet, viewsets.ModelViewSet):
         
         instance.refresh_from_db()
         serializer = self.get_serializer(instance)
-        self._broadcast('update_post', {'post': serializer.data})
+        self._broadcast('update_post', {'post_id': instance.id, 'post': serializer.data}, post_id=instance.id, author_id=instance.author_id)
         return Response(serializer.data)
 
     def destroy(self, request, *args, **kwargs):
@@ -205,8 +267,9 @@ class PostViewSet(BaseBroadcastViewSet, viewsets.ModelViewSet):
             return Response({'error': 'Bạn chỉ có thể xóa bài viết của mình'}, status=403)
         
         post_id = instance.id
+        author_id = instance.author_id
         instance.delete()
-        self._broadcast('delete_post', {'post_id': post_id})
+        self._broadcast('delete_post', {'post_id': post_id}, post_id=post_id, author_id=author_id)
         return Response(status=204)
 
     @action(detail=True, methods=["get", "post", "delete"], url_path="reactions")
@@ -225,34 +288,34 @@ class PostViewSet(BaseBroadcastViewSet, viewsets.ModelViewSet):
 
         # 1. BỎ LIKE
         if request.method == "DELETE":
-            deleted = PostReaction.objects.filter(post=post, user=request.user).delete()
-            if deleted[0] > 0:
+            old_type, reaction_counts = set_post_reaction(post.id, request.user, None)
+            if old_type:
                 self._broadcast('post_react', {
                     'post_id': post.id,
                     'user_id': request.user.id,
                     'reaction_type': None, 
-                    'reaction_counts': self._get_reaction_counts(post),
-                    'owner_id': post.author.id
-                })
+                    'reaction_counts': reaction_counts,
+                    'owner_id': post.author_id
+                }, post_id=post.id, author_id=post.author_id)
             return Response({"ok": True})
         
         # 2. THÊM/SỬA LIKE
         rtype = request.data.get("type")
         if not rtype: return Response({"error": "Missing type"}, status=400)
+        if not is_valid_reaction(rtype): return Response({"error": "Invalid type"}, status=400)
         
-        PostReaction.objects.update_or_create(
-            post=post, user=request.user, defaults={"type": rtype}
-        )
+        old_type, reaction_counts = set_post_reaction(post.id, request.user, rtype)
         
-        #  A. Lưu DB & Gửi thông báo cá nhân cho chủ bài viết
-        self.create_notification(
-            recipient=post.author,
-            sender=request.user,
-            type='post_react',
-            text=f"{request.user.username} đã bày tỏ cảm xúc về bài viết của bạn.",
-            post=post,
-            extra_data={'reaction_type': rtype}
-        )
+        #  A. Lưu DB & Gửi thông báo cá nhân cho chủ bài viết (chỉ reaction mới, không phải đổi loại)
+        if old_type is None:
+            self.create_notification(
+                recipient=post.author,
+                sender=request.user,
+                type='post_react',
+                text=f"{request.user.username} đã bày tỏ cảm xúc về bài viết của bạn.",
+                post=post,
+                extra_data={'reaction_type': rtype}
+            )
 
         #  B. Broadcast ra Public Feed để mọi người thấy số like nhảy
         self._broadcast('post_react', {
@@ -261,9 +324,9 @@ class PostViewSet(BaseBroadcastViewSet, viewsets.ModelViewSet):
             'user_name': request.user.get_full_name() or request.user.username,
             'user_avatar': self._get_avatar_url(request.user),
             'reaction_type': rtype,
-            'reaction_counts': self._get_reaction_counts(post),
-            'owner_id': post.author.id,
-        })
+            'reaction_counts': reaction_counts,
+            'owner_id': post.author_id,
+        }, post_id=post.id, author_id=post.author_id)
         return Response({"ok": True, "type": rtype})
 
     @action(detail=True, methods=["post"], url_path="share")
@@ -271,20 +334,18 @@ class PostViewSet(BaseBroadcastViewSet, viewsets.ModelViewSet):
         post = self.get_object()
         message = request.data.get("message", "")
         Share.objects.create(post=post, user=request.user, message=message)
-        shares_count = post.shares.count()
+        # signal đã cộng bộ đếm, chỉ cần đọc lại cột shares_count
+        post.refresh_from_db(fields=["shares_count"])
+        shares_count = post.shares_count
         
         self._broadcast('share_post', {
             'post_id': post.id,
             'user_id': request.user.id,
             'message': message,
             'shares_count': shares_count
-        })
+        }, post_id=post.id, author_id=post.author_id)
         return Response({"ok": True, "shares": shares_count})
 
-    def _get_reaction_counts(self, post):
-        agg = post.reactions.values("type").annotate(count=Count("id"))
-        return {x["type"]: x["count"] for x in agg}
-
 
 # =================================================================
 # 4. COMMENT VIEWSET - Kế thừa từ BaseBroadcastViewSet
@@ -300,10 +361,51 @@ class CommentViewSet(BaseBroadcastViewSet):
         return context
 
     def list(self, request):
+        """
+        GET /api/social/comments/?post=<id>
+            -> toàn bộ cây (giữ format cũ: list comment gốc)
+        GET /api/social/comments/?post=<id>&limit=20&depth=2[&cursor=<id>]
+            -> {results, next_cursor}: phân trang comment gốc, mỗi nhánh sâu tối đa `depth`
+        GET /api/social/comments/?post=<id>&parent=<comment_id>&limit=20&depth=2
+            -> mở rộng (lazy-load) nhánh reply của 1 comment
+
+        Mọi trường hợp chỉ tốn 2 query (comments + reaction của viewer).
+        """
         post_id = request.query_params.get("post")
         if not post_id: return Response({"error": "Missing post"}, status=400)
-        roots = Comment.objects.filter(post_id=post_id, parent__isnull=True).order_by("created_at")
-        return Response(CommentSerializer(roots, many=True, context={"request": request}).data)
+
+        try:
+            post_id = int(post_id)
+            parent_id = self._int_param(request, "parent")
+            cursor = self._int_param(request, "cursor")
+            limit = self._int_param(request, "limit")
+            depth = self._int_param(request, "depth")
+        except ValueError:
+            return Response({"error": "Invalid parameters"}, status=400)
+
+        tree = CommentTree(post_id, viewer=request.user)
+        if parent_id is not None and not tree.contains(parent_id):
+            return Response({"error": "Comment not found"}, status=404)
+
+        paged = limit is not None or parent_id is not None
+        if limit is not None:
+            limit = max(1, min(limit, MAX_ROOT_LIMIT))
+        elif paged:
+            limit = DEFAULT_ROOT_LIMIT
+        nodes, next_cursor = tree.page(
+            parent_id=parent_id,
+            cursor=cursor,
+            limit=limit,
+            max_depth=max(1, depth) if depth is not None else None,
+        )
+        data = CommentSerializer(nodes, many=True, context={"request": request}).data
+        if not paged:
+            return Response(data)
+        return Response({"results": data, "next_cursor": next_cursor})
+
+    def _int_param(self, request, name):
+        value = request.query_params.get(name)
+        return int(value) if value not in (None, "") else None
 
     def create(self, request):
         post_id = request.data.get("post")
@@ -354,7 +456,7 @@ class CommentViewSet(BaseBroadcastViewSet):
             'is_reply': parent_id is not None,
             'post_author_id': c.post.author.id,
             'parent_author_id': c.parent.author.id if c.parent else None
-        })
+        }, post_id=c.post_id, author_id=c.post.author_id)
         return Response(comment_data, status=201)
 
     def partial_update(self, request, pk=None):
@@ -366,7 +468,8 @@ class CommentViewSet(BaseBroadcastViewSet):
         c.save()
         
         comment_data = self.get_serializer(c).data
-        self._broadcast('update_comment', {'post_id': c.post.id, 'comment': comment_data})
+        self._broadcast('update_comment', {'post_id': c.post.id, 'comment': comment_data},
+                        post_id=c.post_id, author_id=c.post.author_id)
         return Response(comment_data)
 
     def destroy(self, request, pk=None):
@@ -379,6 +482,7 @@ class CommentViewSet(BaseBroadcastViewSet):
             return Response({'error': 'Bạn không có quyền xóa bình luận này'}, status=403)
 
         post_id = c.post.id
+        post_author_id = c.post.author_id
         comment_id = c.id
         c.delete()
         
@@ -386,7 +490,7 @@ class CommentViewSet(BaseBroadcastViewSet):
             'post_id': post_id, 
             'comment_id': comment_id,
             'deleted_by': request.user.id
-        })
+        }, post_id=post_id, author_id=post_author_id)
         return Response(status=204)
 
     @action(detail=True, methods=["post", "delete"], url_path="reactions")
@@ -394,35 +498,35 @@ class CommentViewSet(BaseBroadcastViewSet):
         c = self.get_queryset().get(pk=pk)
         
         if request.method == "DELETE":
-            deleted = CommentReaction.objects.filter(comment=c, user=request.user).delete()
-            if deleted[0] > 0:
+            old_type, reaction_counts = set_comment_reaction(c.id, request.user, None)
+            if old_type:
                 self._broadcast('comment_react', {
                     'post_id': c.post.id,
                     'comment_id': c.id,
                     'user_id': request.user.id,
                     'reaction_type': None,
-                    'reactions_count': self._get_reaction_counts(c),
+                    'reactions_count': reaction_counts,
                     'owner_id': c.author.id
-                })
+                }, post_id=c.post_id, author_id=c.post.author_id)
             return Response({"ok": True})
         
         rtype = request.data.get("type")
         if not rtype: return Response({"error": "Missing type"}, status=400)
+        if not is_valid_reaction(rtype): return Response({"error": "Invalid type"}, status=400)
         
-        CommentReaction.objects.update_or_create(
-            comment=c, user=request.user, defaults={"type": rtype}
-        )
+        old_type, reaction_counts = set_comment_reaction(c.id, request.user, rtype)
         
-        #  Lưu DB & Gửi thông báo cá nhân cho chủ comment
-        self.create_notification(
-            recipient=c.author,
-            sender=request.user,
-            type='comment_react',
-            text=f"{request.user.username} đã bày tỏ cảm xúc về bình luận của bạn.",
-            post=c.post,
-            comment=c,
-            extra_data={'reaction_type': rtype}
-        )
+        #  Lưu DB & Gửi thông báo cá nhân cho chủ comment (chỉ reaction mới, không phải đổi loại)
+        if old_type is None:
+            self.create_notification(
+                recipient=c.author,
+                sender=request.user,
+                type='comment_react',
+                text=f"{request.user.username} đã bày tỏ cảm xúc về bình luận của bạn.",
+                post=c.post,
+                comment=c,
+                extra_data={'reaction_type': rtype}
+            )
 
         #  B. Broadcast ra Public Feed
         self._broadcast('comment_react', {
@@ -432,11 +536,7 @@ class CommentViewSet(BaseBroadcastViewSet):
             'user_name': request.user.get_full_name() or request.user.username,
             'user_avatar': self._get_avatar_url(request.user),               
             'reaction_type': rtype,
-            'reactions_count': self._get_reaction_counts(c),
+            'reactions_count': reaction_counts,
             'owner_id': c.author.id 
-        })
-        return Response({"ok": True, "type": rtype})
-        
-    def _get_reaction_counts(self, comment):
-        agg = comment.reactions.values("type").annotate(count=Count("id"))
-        return {x["type"]: x["count"] for x in agg}
\ No newline at end of file
+        }, post_id=c.post_id, author_id=c.post.author_id)
+        return Response({"ok": True, "type": rtype})
\ No newline at end of file
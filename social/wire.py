@@ -0,0 +1,171 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+# =================================================================
+# PROTOCOL v2 CHO FEED SOCKET (opt-in: ?proto=2 hoặc {"type": "hello", "proto": 2})
+# =================================================================
+# v1 (mặc định): mỗi sự kiện 1 frame JSON, giữ nguyên như cũ.
+# v2:
+#   - Gom sự kiện của mỗi socket trong BATCH_WINDOW giây thành 1 frame:
+#       {"t": "b", "ev": [<event>, ...]}
+#   - Sự kiện bị thay thế chỉ giữ bản mới nhất trong cùng lô
+#     (vd. reaction_counts của cùng 1 bài: số sau cùng là đủ).
+#   - Key rút gọn theo KEY_MAP (gửi kèm trong hello để client giải mã),
+#     bỏ các trường lặp lại ở mỗi lượt like (avatar, owner...).
+#   - JSON không khoảng trắng. (Chưa dùng msgpack vì chưa có trong requirements.)
+
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+BATCH_WINDOW = 0.05
+MAX_BATCH_EVENTS = 200
+
+KEY_MAP = {
+    "type": "t",
+    "event": "e",
+    "data": "d",
+    "post_id": "p",
+    "comment_id": "c",
+    "user_id": "u",
+    "user_name": "n",
+    "user_avatar": "a",
+    "reaction_type": "r",
+    "reaction_counts": "rc",
+    "reactions_count": "cc",
+    "shares_count": "sc",
+    "owner_id": "o",
+    "post": "po",
+    "comment": "cm",
+    "is_reply": "ir",
+    "post_author_id": "pa",
+    "parent_author_id": "qa",
+    "deleted_by": "db",
+    "message": "m",
+    "typing": "ty",
+    "stopped": "st",
+    "ttl": "tl",
+    "group": "g",
+    "seq": "q",
+}
+
+# Trường dư thừa trong v2 (client tự tra theo user_id / post_id nếu cần)
+DROP_FIELDS = {
+    "post_react": {"user_avatar", "user_name", "owner_id"},
+    "comment_react": {"user_avatar", "user_name", "owner_id"},
+}
+
+# Sự kiện chứa giá trị tuyệt đối -> bản mới nhất thay thế bản cũ (khóa theo đối tượng)
+SUPERSEDE_FIELDS = {
+    "post_react": "post_id",
+    "comment_react": "comment_id",
+    "share_post": "post_id",
+    "update_post": "post_id",
+    "update_comment": "comment_id",
+}
+
+
+def requested_protocol(scope):
+    """?proto=2 trên URL websocket"""
+    query = parse_qs(scope.get("query_string", b"").decode())
+    try:
+        return PROTOCOL_V2 if int(query.get("proto", ["1"])[0]) == PROTOCOL_V2 else PROTOCOL_V1
+    except ValueError:
+        return PROTOCOL_V1
+
+
+def dumps(payload):
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def supersede_key(message):
+    """Khóa gộp của 1 message gửi client (None = không gộp)"""
+    if message.get("type") == "notification_badge":
+        # Số badge là giá trị tuyệt đối -> chỉ cần số cuối cùng
+        return ("notification_badge",)
+    data = message.get("data")
+    if message.get("type") != "feed_update" or not isinstance(data, dict):
+        return None
+    event = data.get("event")
+    field = SUPERSEDE_FIELDS.get(event)
+    if field is None or data.get(field) is None:
+        return None
+    return (event, data[field])
+
+
+def coalesce(messages):
+    """Bỏ các message đã bị bản sau thay thế, giữ thứ tự xuất hiện của bản cuối"""
+    latest = {}
+    for index, message in enumerate(messages):
+        key = supersede_key(message)
+        if key is not None:
+            latest[key] = index
+    return [
+        message for index, message in enumerate(messages)
+        if (key := supersede_key(message)) is None or latest[key] == index
+    ]
+
+
+def compact(value, drop=()):
+    if isinstance(value, dict):
+        return {KEY_MAP.get(k, k): compact(v) for k, v in value.items() if k not in drop}
+    if isinstance(value, list):
+        return [compact(v) for v in value]
+    return value
+
+
+def compact_message(message):
+    message = {k: v for k, v in message.items() if k != "group"}
+    data = message.get("data")
+    if isinstance(data, dict):
+        message["data"] = compact(data, DROP_FIELDS.get(data.get("event"), ()))
+    return compact(message)
+
+
+def encode_batch(messages):
+    return dumps({"t": "b", "ev": [compact_message(m) for m in coalesce(messages)]})
+
+
+class EventBatcher:
+    """
+    Hàng đợi gửi của 1 socket (v2). push() không chờ I/O; frame được gửi
+    sau BATCH_WINDOW giây hoặc ngay khi đủ MAX_BATCH_EVENTS sự kiện.
+    """
+
+    def __init__(self, send_text, window=BATCH_WINDOW):
+        self._send_text = send_text
+        self._window = window
+        self._pending = []
+        self._timer = None
+        self._closed = False
+
+    async def push(self, message):
+        if self._closed:
+            return
+        self._pending.append(message)
+        if len(self._pending) >= MAX_BATCH_EVENTS:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._window, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._timer = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            await self._send_text(encode_batch(pending))
+        except Exception as e:
+            print(f"❌ [wire] Batch send error: {e}")
+
+    def close(self):
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending = []